@@ -1,13 +1,18 @@
-
 import json
+import os
+import traceback
 import typing
+import uuid
 
 import debugutils
 
-from pdfextract import ltjson, pdfprocessor, dataprovider
+from pdfextract import ltjson, pdfprocessor, dataprovider, pagecache, fanout
 
-def process_pdf(pdfId: str):
-  data_provider = dataprovider.SupabaseDataProvider(pdfId=pdfId)
+def process_pdf(
+  pdfId: str,
+  page_range: typing.Union[None, typing.List[int]] = None,
+):
+  data_provider = dataprovider.make_data_provider(pdfId=pdfId)
   pdfdata = data_provider.get_pdf_for_key(pdfkey=pdfId)
   success = True
   results_json = ""
@@ -18,34 +23,93 @@ def process_pdf(pdfId: str):
       error_message="Could not get pdf file for key: {0}".format(pdfId)
     )
   else:
-    results = pdfprocessor.process_pdf(data_provider=data_provider, pdfkey=pdfId, pdfdata=pdfdata)
-    encoder = ltjson.LTJsonEncoder()
-    results_json = encoder.encode(results)
-    data_provider.write_pdf_summary(results_json=results_json)
+    try:
+      # Set PROCESS_PDF_CHUNK_PAGES to split the pdf into chunks of pages each processed by its own invocation
+      chunk_pages = int(os.environ.get("PROCESS_PDF_CHUNK_PAGES") or 0)
+      if chunk_pages > 0 and page_range is None:
+        results = fanout.coordinate_pdf(
+          data_provider=data_provider,
+          dispatcher=make_chunk_dispatcher(),
+          pdfkey=pdfId,
+          pdfdata=pdfdata,
+          job_id=uuid.uuid4().hex,
+          chunk_pages=chunk_pages,
+        )
+      else:
+        # Set PROCESS_PDF_NUM_WORKERS to process pages in parallel worker processes
+        num_workers = int(os.environ.get("PROCESS_PDF_NUM_WORKERS") or 1)
+        # Set PROCESS_PDF_CHECKPOINT_INTERVAL_S to checkpoint that often so a timed out pdf resumes when invoked again
+        # Needs the pdf_processing_checkpoints table and PROCESS_PDF_NUM_WORKERS=1
+        checkpoint_interval_s = float(os.environ.get("PROCESS_PDF_CHECKPOINT_INTERVAL_S") or -1)
+        results = pdfprocessor.process_pdf(
+          data_provider=data_provider,
+          pdfkey=pdfId,
+          pdfdata=pdfdata,
+          page_numbers=list(range(page_range[0], page_range[1])) if page_range is not None else None,
+          num_workers=num_workers,
+          page_cache=pagecache.make_page_cache(),
+          checkpoint_interval_s=checkpoint_interval_s,
+        )
+      encoder = ltjson.LTJsonEncoder()
+      results_json = encoder.encode(results)
+      data_provider.write_pdf_summary(results_json=results_json)
+    except Exception as e:
+      # A failed chunk or page still has to end the progress for the website
+      # then fails the invocation so Lambda retries and alarms on it
+      traceback.print_exc()
+      data_provider.write_processpdf_error(
+        pdfkey=pdfId,
+        error_message="Failed to process pdf: {0}".format(e)
+      )
+      data_provider.write_processpdf_done(pdfkey=pdfId, success=False)
+      raise
   data_provider.write_processpdf_done(pdfkey=pdfId, success=success)
 
   return results_json
 
+def process_chunk(event: fanout.ChunkEvent):
+  data_provider = dataprovider.make_data_provider(pdfId=event["pdfId"])
+  pdfdata = data_provider.get_pdf_for_key(pdfkey=event["pdfId"])
+  if pdfdata is None:
+    raise RuntimeError("Could not get pdf file for key: {0}".format(event["pdfId"]))
+  fanout.process_chunk(
+    data_provider=data_provider,
+    event=event,
+    pdfdata=pdfdata,
+    page_cache=pagecache.make_page_cache(),
+  )
+
+def make_chunk_dispatcher() -> fanout.ChunkDispatcher:
+  # Lambda sets AWS_LAMBDA_FUNCTION_NAME so chunks invoke this same function
+  function_name = os.environ.get("AWS_LAMBDA_FUNCTION_NAME")
+  if function_name is None or debugutils.is_dev():
+    return fanout.LocalChunkDispatcher(handle_event=process_chunk)
+  max_concurrency = int(os.environ.get("PROCESS_PDF_MAX_CONCURRENT_CHUNKS") or 16)
+  return fanout.LambdaChunkDispatcher(function_name=function_name, max_concurrency=max_concurrency)
 
 def handler(
   event: typing.Any,
   context: typing.Any, # pylint:disable=unused-argument
 ) -> typing.Union[None, str]:
-  pdfId = None
-  if "pdfId" in event:
-    pdfId = event["pdfId"]
+  request: typing.Dict[str, typing.Any] = dict(event)
   if "body" in event:
     body = event["body"]
     try:
       body_json = json.loads(body)
-      if "pdfId" in body_json:
-        pdfId = body_json["pdfId"]
+      request.update(body_json)
     except Exception as e:
       print("Failed to json parse body:", body, e)
 
+  if fanout.is_chunk_event(request):
+    print("Found chunk:", request["jobId"], request["phase"], request["chunkIdx"])
+    process_chunk(event=typing.cast(fanout.ChunkEvent, request))
+    return None
+
+  pdfId = request.get("pdfId")
   if pdfId is not None:
     print("Found pdfId:", pdfId)
-    results_json = process_pdf(pdfId=pdfId)
+    # pageRange: [start, end) to only process those pages
+    results_json = process_pdf(pdfId=pdfId, page_range=request.get("pageRange"))
 
     if debugutils.is_dev():
       return results_json
@@ -0,0 +1,273 @@
+
+import json
+import typing
+import zlib
+
+from . import votesearch, symbol_library
+from .ltjson import LTJsonEncoder, PdfElem, PdfResultsDelta, PdfRowPtr, PdfSchedule, \
+  PdfScheduleCell, PdfScheduleRow, PdfSummaryJson, ScheduleTypes
+
+# Enough of a PdfProcessor to pick up where a timed out invocation left off
+# Serialized as zlib compressed json
+
+CHECKPOINT_VERSION = 2
+
+class ItemSearchRuleState(typing.TypedDict):
+  rowPtr: PdfRowPtr
+  regex: typing.Union[None, str]
+  # Index into ProcessorCheckpoint shapeMatches since rules often share symbols
+  shapeMatches: int
+
+class ScheduleSearchRuleState(typing.TypedDict):
+  destination: ScheduleTypes
+  results: PdfSummaryJson
+  itemSearchRules: typing.Dict[int, typing.List[ItemSearchRuleState]]
+
+class ProcessorCheckpoint(typing.TypedDict):
+  version: int
+  pageNumbers: typing.List[int]
+  # 1: finding schedules 2: matching items
+  passNumber: int
+  # Pages of passNumber completed in sorted page order
+  numPagesDone: int
+  lastPage: int
+  deltas: typing.List[PdfResultsDelta]
+  rules: typing.List[ScheduleSearchRuleState]
+  shapeMatches: typing.List[typing.List[typing.List[symbol_library.SymbolTemplate]]]
+
+class CheckpointEncoder(LTJsonEncoder):
+  def default(self, o: typing.Any):
+    if isinstance(o, symbol_library.SymbolTemplate):
+      return o.as_dict()
+    return super().default(o)
+
+def make_checkpoint(
+  searcher: votesearch.PdfSearcher,
+  page_numbers: typing.List[int],
+  pass_number: int,
+  num_pages_done: int,
+  last_page: int,
+  deltas: typing.List[PdfResultsDelta],
+) -> ProcessorCheckpoint:
+  shape_matches: typing.List[typing.List[typing.List[symbol_library.SymbolTemplate]]] = []
+  shape_matches_idxes: typing.Dict[int, int] = {}
+  rules: typing.List[ScheduleSearchRuleState] = []
+  for rule in searcher.search_rules:
+    item_search_rules: typing.Dict[int, typing.List[ItemSearchRuleState]] = {}
+    for schedule_page_number, page_item_search_rules in rule.item_search_rules_by_page.items():
+      item_search_rules[schedule_page_number] = []
+      for item_search_rule in page_item_search_rules:
+        key = id(item_search_rule.shape_matches)
+        if key not in shape_matches_idxes:
+          shape_matches_idxes[key] = len(shape_matches)
+          shape_matches.append(item_search_rule.shape_matches)
+        item_search_rules[schedule_page_number].append({
+          "rowPtr": item_search_rule.row_ptr,
+          "regex": item_search_rule.regex_pattern,
+          "shapeMatches": shape_matches_idxes[key],
+        })
+    rules.append({
+      "destination": rule.destination,
+      "results": rule.results,
+      "itemSearchRules": item_search_rules,
+    })
+  return {
+    "version": CHECKPOINT_VERSION,
+    "pageNumbers": page_numbers,
+    "passNumber": pass_number,
+    "numPagesDone": num_pages_done,
+    "lastPage": last_page,
+    "deltas": deltas,
+    "rules": rules,
+    "shapeMatches": shape_matches,
+  }
+
+def encode_checkpoint(checkpoint: ProcessorCheckpoint) -> bytes:
+  encoder = CheckpointEncoder(separators=(",", ":"))
+  return zlib.compress(encoder.encode(checkpoint).encode("utf-8"))
+
+def decode_checkpoint(data: bytes) -> typing.Union[None, ProcessorCheckpoint]:
+  '''
+  json turns the int page keys into strings and the ScheduleTypes into their values so those are restored
+  '''
+  try:
+    checkpoint_json = json.loads(zlib.decompress(data).decode("utf-8"))
+  except Exception as e:
+    print("Failed to decode checkpoint:", e)
+    return None
+  if checkpoint_json.get("version") != CHECKPOINT_VERSION:
+    return None
+  shape_matches = [
+    [
+      [symbol_library.SymbolTemplate.from_dict(template_json=template_json) for template_json in shape_group]
+      for shape_group in shape_option
+    ]
+    for shape_option in checkpoint_json["shapeMatches"]
+  ]
+  rules: typing.List[ScheduleSearchRuleState] = []
+  for rule_json in checkpoint_json["rules"]:
+    rules.append({
+      "destination": ScheduleTypes(rule_json["destination"]),
+      "results": decode_summary(summary_json=rule_json["results"]),
+      "itemSearchRules": {
+        int(schedule_page_number): [
+          {
+            "rowPtr": decode_row_ptr(row_ptr_json=item_rule_json["rowPtr"]),
+            "regex": item_rule_json["regex"],
+            "shapeMatches": item_rule_json["shapeMatches"],
+          }
+          for item_rule_json in item_rules_json
+        ]
+        for schedule_page_number, item_rules_json in rule_json["itemSearchRules"].items()
+      },
+    })
+  return {
+    "version": CHECKPOINT_VERSION,
+    "pageNumbers": checkpoint_json["pageNumbers"],
+    "passNumber": checkpoint_json["passNumber"],
+    "numPagesDone": checkpoint_json["numPagesDone"],
+    "lastPage": checkpoint_json["lastPage"],
+    "deltas": [decode_delta(delta_json=delta_json) for delta_json in checkpoint_json["deltas"]],
+    "rules": rules,
+    "shapeMatches": shape_matches,
+  }
+
+def merge_checkpoints(checkpoints: typing.List[ProcessorCheckpoint]) -> ProcessorCheckpoint:
+  '''
+  Combines the pass 1 checkpoints of disjoint page ranges into one that starts pass 2 on every page
+  '''
+  rules: typing.List[ScheduleSearchRuleState] = []
+  shape_matches: typing.List[typing.List[typing.List[symbol_library.SymbolTemplate]]] = []
+  for pdf_checkpoint in checkpoints:
+    if len(rules) == 0:
+      rules = [
+        {
+          "destination": rule_state["destination"],
+          "results": votesearch.make_empty_pdfsummarryjson(),
+          "itemSearchRules": {},
+        }
+        for rule_state in pdf_checkpoint["rules"]
+      ]
+    shape_matches_offset = len(shape_matches)
+    shape_matches.extend(pdf_checkpoint["shapeMatches"])
+    for rule, rule_state in zip(rules, pdf_checkpoint["rules"]):
+      votesearch.merge(dest=rule["results"], other=rule_state["results"])
+      for schedule_page_number, item_rule_states in rule_state["itemSearchRules"].items():
+        rule["itemSearchRules"][schedule_page_number] = [
+          {
+            "rowPtr": item_rule_state["rowPtr"],
+            "regex": item_rule_state["regex"],
+            "shapeMatches": item_rule_state["shapeMatches"] + shape_matches_offset,
+          }
+          for item_rule_state in item_rule_states
+        ]
+  page_numbers: typing.List[int] = []
+  deltas: typing.List[PdfResultsDelta] = []
+  for pdf_checkpoint in checkpoints:
+    page_numbers.extend(pdf_checkpoint["pageNumbers"])
+    deltas.extend(pdf_checkpoint["deltas"])
+  return {
+    "version": CHECKPOINT_VERSION,
+    "pageNumbers": page_numbers,
+    "passNumber": 2,
+    "numPagesDone": 0,
+    "lastPage": max([pdf_checkpoint["lastPage"] for pdf_checkpoint in checkpoints], default=-1),
+    "deltas": deltas,
+    "rules": rules,
+    "shapeMatches": shape_matches,
+  }
+
+def encode_deltas(deltas: typing.List[PdfResultsDelta]) -> bytes:
+  encoder = LTJsonEncoder(separators=(",", ":"))
+  return zlib.compress(encoder.encode(deltas).encode("utf-8"))
+
+def decode_deltas(data: bytes) -> typing.List[PdfResultsDelta]:
+  deltas_json = json.loads(zlib.decompress(data).decode("utf-8"))
+  return [decode_delta(delta_json=delta_json) for delta_json in deltas_json]
+
+def restore_searcher(
+  searcher: votesearch.PdfSearcher,
+  checkpoint: ProcessorCheckpoint,
+) -> None:
+  if len(searcher.search_rules) != len(checkpoint["rules"]):
+    raise ValueError("Checkpoint has {0} rules but the searcher has {1}".format(
+      len(checkpoint["rules"]), len(searcher.search_rules)
+    ))
+  for rule, rule_state in zip(searcher.search_rules, checkpoint["rules"]):
+    if rule.destination != rule_state["destination"]:
+      raise ValueError("Checkpoint rule {0} does not match {1}".format(
+        rule_state["destination"], rule.destination
+      ))
+    rule.results = rule_state["results"]
+    rule.item_search_rules_by_page = {
+      schedule_page_number: [
+        votesearch.ItemSearchRule(
+          row_ptr=item_rule_state["rowPtr"],
+          regex=item_rule_state["regex"],
+          shape_matches=checkpoint["shapeMatches"][item_rule_state["shapeMatches"]],
+        )
+        for item_rule_state in item_rule_states
+      ]
+      for schedule_page_number, item_rule_states in rule_state["itemSearchRules"].items()
+    }
+    rule.label_matcher = None
+
+def decode_delta(delta_json: typing.Dict[str, typing.Any]) -> PdfResultsDelta:
+  return {
+    "page": delta_json["page"],
+    "schedules": decode_summary(summary_json=delta_json["schedules"]),
+    "elems": [decode_elem(elem_json=elem_json) for elem_json in delta_json["elems"]],
+  }
+
+def decode_row_ptr(row_ptr_json: typing.Dict[str, typing.Any]) -> PdfRowPtr:
+  return {
+    "schedule": ScheduleTypes(row_ptr_json["schedule"]),
+    "page": row_ptr_json["page"],
+    "row": row_ptr_json["row"],
+  }
+
+def decode_elem(elem_json: typing.Dict[str, typing.Any]) -> PdfElem:
+  x0, y0, x1, y1 = elem_json["bbox"]
+  return {
+    "label": elem_json["label"],
+    "bbox": (x0, y0, x1, y1),
+    "rowPtr": decode_row_ptr(row_ptr_json=elem_json["rowPtr"]),
+  }
+
+def decode_cell(cell_json: typing.Dict[str, typing.Any]) -> PdfScheduleCell:
+  x0, y0, x1, y1 = cell_json["bbox"]
+  return {
+    "key": cell_json["key"],
+    "label": cell_json["label"],
+    "bbox": (x0, y0, x1, y1),
+    "rowPtr": decode_row_ptr(row_ptr_json=cell_json["rowPtr"]),
+  }
+
+def decode_row(row_json: typing.Dict[str, typing.Any]) -> PdfScheduleRow:
+  return {
+    "elems": {
+      int(page_number): [decode_elem(elem_json=elem_json) for elem_json in elems_json]
+      for page_number, elems_json in row_json["elems"].items()
+    },
+    "cells": [decode_cell(cell_json=cell_json) for cell_json in row_json["cells"]],
+  }
+
+def decode_schedule(schedule_json: typing.Dict[str, typing.Any]) -> PdfSchedule:
+  return {
+    "headerRow": decode_row(row_json=schedule_json["headerRow"]),
+    "rows": [decode_row(row_json=row_json) for row_json in schedule_json["rows"]],
+  }
+
+def decode_summary(summary_json: typing.Dict[str, typing.Any]) -> PdfSummaryJson:
+  summary = votesearch.make_empty_pdfsummarryjson()
+  for schedule_type in ScheduleTypes:
+    summary[schedule_type.value] = {
+      int(page_number): decode_schedule(schedule_json=schedule_json)
+      for page_number, schedule_json in summary_json[schedule_type.value].items()
+    }
+  summary["houseName"] = summary_json["houseName"]
+  summary["architectName"] = summary_json["architectName"]
+  summary["pageNames"] = {
+    int(page_number): page_name for page_number, page_name in summary_json["pageNames"].items()
+  }
+  return summary
@@ -0,0 +1,95 @@
+
+import typing
+
+import numpy as np
+
+# Plain python kernels. compiled_utils_build compiles these ahead of time with numba
+# and compiled_utils falls back to calling them directly
+
+LinePointsTypePy = typing.Tuple[float, float, float, float]
+BboxTypePy = typing.Tuple[float, float, float, float]
+
+def point_inside_line_bbox(
+  line: LinePointsTypePy,
+  x: float,
+  y: float,
+):
+  x0, y0, x1, y1 = line
+  xmin = min(x0, x1) - 0.1
+  ymin = min(y0, y1) - 0.1
+  xmax = max(x0, x1) + 0.1
+  ymax = max(y0, y1) + 0.1
+  x_inside = xmin <= x and x <= xmax
+  y_inside = ymin <= y and y <= ymax
+  return x_inside and y_inside
+
+def get_det(
+  a: typing.Tuple[float, float],
+  b: typing.Tuple[float, float],
+):
+  return a[0] * b[1] - a[1] * b[0]
+
+def line_intersection(line1: LinePointsTypePy, line2: LinePointsTypePy):
+  dx = (line1[0] - line1[2], line2[0] - line2[2])
+  dy = (line1[1] - line1[3], line2[1] - line2[3])
+
+  div = get_det(dx, dy)
+  if div == 0:
+    return (-1., -1.)
+
+  d = (get_det((line1[0], line1[1]), (line1[2], line1[3])), get_det((line2[0], line2[1]), (line2[2], line2[3])))
+  x = get_det(d, dx) / div
+  y = get_det(d, dy) / div
+
+  if point_inside_line_bbox(line1, x, y):
+    if point_inside_line_bbox(line2, x, y):
+      return (x, y)
+
+  return (-1., -1.)
+
+def box_contains(outer: BboxTypePy, inner: BboxTypePy):
+  x0a, y0a, x1a, y1a = outer
+  x0b, y0b, x1b, y1b = inner
+  if x0a <= x0b and y0a <= y0b:
+    # outer starts before inner
+    if x1a >= x1b and y1a >= y1b:
+      # outer ends after inner
+      return True
+  return False
+
+def boxes_contain(outer: BboxTypePy, inners: np.ndarray):
+  '''
+  inners: (N,4) Returns (N,) box_contains(outer, inners[i])
+  '''
+  out = np.empty((inners.shape[0],), dtype=np.bool_)
+  for i in range(inners.shape[0]):
+    out[i] = box_contains(outer, (inners[i, 0], inners[i, 1], inners[i, 2], inners[i, 3]))
+  return out
+
+def bbox_intersection_area(a: BboxTypePy, b: BboxTypePy):
+  a_top = max(a[1], a[3])
+  a_bottom = min(a[1], a[3])
+  b_top = max(b[1], b[3])
+  b_bottom = min(b[1], b[3])
+
+  left = max(a[0], b[0])
+  right = min(a[2], b[2])
+  bottom = max(a_bottom, b_bottom)
+  top = min(a_top, b_top)
+
+  if left < right and bottom < top:
+    return (right - left) * (top - bottom)
+  elif left == right:
+    return 0.1 * (top - bottom)
+  elif bottom == top:
+    return (right - left) * 0.1
+  return 0.
+
+def bbox_intersection_areas(a: BboxTypePy, bboxes: np.ndarray):
+  '''
+  bboxes: (N,4) Returns (N,) bbox_intersection_area(a, bboxes[i])
+  '''
+  out = np.empty((bboxes.shape[0],), dtype=np.float64)
+  for i in range(bboxes.shape[0]):
+    out[i] = bbox_intersection_area(a, (bboxes[i, 0], bboxes[i, 1], bboxes[i, 2], bboxes[i, 3]))
+  return out
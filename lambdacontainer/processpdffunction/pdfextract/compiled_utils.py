@@ -1,59 +1,126 @@
 
-
 import typing
 
-import numba.types
-from numba.pycc import CC
-
-cc = CC("compiled_utils")
-cc.verbose = True
-
-
-FloatTupleType = numba.types.Tuple([numba.types.float64, numba.types.float64])
-LinePointsTypePy = typing.Tuple[float, float, float, float]
-LinePointsTypeNumba = numba.types.Tuple([numba.types.float64, numba.types.float64, numba.types.float64, numba.types.float64])
-
-@numba.njit()
-@cc.export("points_inside_line_bbox", numba.types.boolean(LinePointsTypeNumba, numba.types.float64, numba.types.float64))
-def point_inside_line_bbox(
-  line: LinePointsTypePy,
-  x: float,
-  y: float,
-):
-  x0, y0, x1, y1 = line
-  xmin = min(x0, x1) - 0.1
-  ymin = min(y0, y1) - 0.1
-  xmax = max(x0, x1) + 0.1
-  ymax = max(y0, y1) + 0.1
-  x_inside = xmin <= x and x <= xmax
-  y_inside = ymin <= y and y <= ymax
-  return x_inside and y_inside
-
-@numba.njit()
-@cc.export("get_det", numba.types.float64(FloatTupleType, FloatTupleType))
-def get_det(
-  a: typing.Tuple[float, float],
-  b: typing.Tuple[float, float],
-):
-  return a[0] * b[1] - a[1] * b[0]
-
-@cc.export("line_intersection", FloatTupleType(LinePointsTypeNumba, LinePointsTypeNumba))
-def line_intersection(line1: LinePointsTypePy, line2: LinePointsTypePy):
-  dx = (line1[0] - line1[2], line2[0] - line2[2])
-  dy = (line1[1] - line1[3], line2[1] - line2[3])
-
-  div = get_det(a=dx, b=dy)
-  if div == 0:
-    return (-1, -1)
-
-  d = (get_det(a=line1[0:2], b=line1[2:4]), get_det(a=line2[0:2], b=line2[2:4]))
-  x = get_det(a=d, b=dx) / div
-  y = get_det(a=d, b=dy) / div
-
-  if point_inside_line_bbox(line1, x, y):
-    if point_inside_line_bbox(line2, x, y):
-      return x, y
-
-  return (-1, -1)
-
-# cc.compile()
+import numpy as np
+
+from . import compiled_kernels
+
+# Prefers the ahead of time compiled kernels from compiled_utils_build
+# and falls back to pure python when the extension hasn't been built
+try:
+  from . import compiled_utils_aot # type: ignore # pylint:disable=no-name-in-module
+except ImportError:
+  compiled_utils_aot = None
+
+LinePointsTypePy = compiled_kernels.LinePointsTypePy
+BboxTypePy = compiled_kernels.BboxTypePy
+
+IS_COMPILED = compiled_utils_aot is not None
+
+def line_pair_intersections(lines1: np.ndarray, lines2: np.ndarray) -> np.ndarray:
+  '''
+  compiled_kernels.line_intersection of each row of lines1 with the same row of lines2
+  lines1: (...,4) lines2: (...,4) broadcast against each other. Returns (...,2)
+  '''
+  l1x0 = lines1[..., 0]
+  l1y0 = lines1[..., 1]
+  l1x1 = lines1[..., 2]
+  l1y1 = lines1[..., 3]
+  l2x0 = lines2[..., 0]
+  l2y0 = lines2[..., 1]
+  l2x1 = lines2[..., 2]
+  l2y1 = lines2[..., 3]
+  dx0 = l1x0 - l1x1
+  dx1 = l2x0 - l2x1
+  dy0 = l1y0 - l1y1
+  dy1 = l2y0 - l2y1
+  div = dx0 * dy1 - dx1 * dy0
+  d0 = l1x0 * l1y1 - l1y0 * l1x1
+  d1 = l2x0 * l2y1 - l2y0 * l2x1
+  with np.errstate(divide="ignore", invalid="ignore"):
+    x = (d0 * dx1 - d1 * dx0) / div
+    y = (d0 * dy1 - d1 * dy0) / div
+  def inside_line_bbox(x0, y0, x1, y1):
+    return (np.minimum(x0, x1) - 0.1 <= x) & (x <= np.maximum(x0, x1) + 0.1) & \
+      (np.minimum(y0, y1) - 0.1 <= y) & (y <= np.maximum(y0, y1) + 0.1)
+  found = (div != 0) & inside_line_bbox(l1x0, l1y0, l1x1, l1y1) & inside_line_bbox(l2x0, l2y0, l2x1, l2y1)
+  return np.stack([np.where(found, x, -1.), np.where(found, y, -1.)], axis=-1)
+
+def boxes_contain_numpy(outer: BboxTypePy, inners: np.ndarray) -> np.ndarray:
+  x0, y0, x1, y1 = outer
+  return (x0 <= inners[:, 0]) & (y0 <= inners[:, 1]) & (x1 >= inners[:, 2]) & (y1 >= inners[:, 3])
+
+def bbox_pair_intersection_areas(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+  '''
+  compiled_kernels.bbox_intersection_area of each row of a with the same row of b
+  a: (...,4) b: (...,4) broadcast against each other. Returns (...)
+  '''
+  left = np.maximum(a[..., 0], b[..., 0])
+  right = np.minimum(a[..., 2], b[..., 2])
+  bottom = np.maximum(np.minimum(a[..., 1], a[..., 3]), np.minimum(b[..., 1], b[..., 3]))
+  top = np.minimum(np.maximum(a[..., 1], a[..., 3]), np.maximum(b[..., 1], b[..., 3]))
+  return np.where(
+    (left < right) & (bottom < top),
+    (right - left) * (top - bottom),
+    np.where(
+      left == right,
+      0.1 * (top - bottom),
+      np.where(bottom == top, (right - left) * 0.1, 0.)
+    )
+  )
+
+def bbox_intersection_areas_numpy(a: BboxTypePy, bboxes: np.ndarray) -> np.ndarray:
+  return bbox_pair_intersection_areas(a=np.array(a, dtype=np.float64), b=bboxes)
+
+# The compiled kernels only take tuples of float64 and crash the process on anything else
+# (ex: a list, a numpy row, None or the wrong length) so the functions below coerce first
+if compiled_utils_aot is not None:
+  point_inside_line_bbox_kernel = compiled_utils_aot.point_inside_line_bbox
+  get_det_kernel = compiled_utils_aot.get_det
+  line_intersection_kernel = compiled_utils_aot.line_intersection
+  box_contains_kernel = compiled_utils_aot.box_contains
+  boxes_contain_kernel = compiled_utils_aot.boxes_contain
+  bbox_intersection_area_kernel = compiled_utils_aot.bbox_intersection_area
+  bbox_intersection_areas_kernel = compiled_utils_aot.bbox_intersection_areas
+else:
+  point_inside_line_bbox_kernel = compiled_kernels.point_inside_line_bbox
+  get_det_kernel = compiled_kernels.get_det
+  line_intersection_kernel = compiled_kernels.line_intersection
+  box_contains_kernel = compiled_kernels.box_contains
+  boxes_contain_kernel = boxes_contain_numpy
+  bbox_intersection_area_kernel = compiled_kernels.bbox_intersection_area
+  bbox_intersection_areas_kernel = bbox_intersection_areas_numpy
+
+def to_float_tuple(values: typing.Any, length: int) -> typing.Tuple[float, ...]:
+  if values is None or len(values) != length:
+    raise ValueError("Expected {0} numbers: {1}".format(length, values))
+  return tuple([float(value) for value in values])
+
+def to_bboxes_array(bboxes: typing.Any) -> np.ndarray:
+  bboxes = np.ascontiguousarray(bboxes, dtype=np.float64)
+  if bboxes.size == 0:
+    bboxes = bboxes.reshape((0, 4))
+  if bboxes.ndim != 2 or bboxes.shape[1] != 4:
+    raise ValueError("Expected bboxes of shape (N, 4): {0}".format(bboxes.shape))
+  return bboxes
+
+def point_inside_line_bbox(line: LinePointsTypePy, x: float, y: float) -> bool:
+  return point_inside_line_bbox_kernel(to_float_tuple(line, 4), float(x), float(y))
+
+def get_det(a: typing.Tuple[float, float], b: typing.Tuple[float, float]) -> float:
+  return get_det_kernel(to_float_tuple(a, 2), to_float_tuple(b, 2))
+
+def line_intersection(line1: LinePointsTypePy, line2: LinePointsTypePy) -> typing.Tuple[float, float]:
+  return line_intersection_kernel(to_float_tuple(line1, 4), to_float_tuple(line2, 4))
+
+def box_contains(outer: BboxTypePy, inner: BboxTypePy) -> bool:
+  return box_contains_kernel(to_float_tuple(outer, 4), to_float_tuple(inner, 4))
+
+def boxes_contain(outer: BboxTypePy, inners: typing.Any) -> np.ndarray:
+  return boxes_contain_kernel(to_float_tuple(outer, 4), to_bboxes_array(inners))
+
+def bbox_intersection_area(a: BboxTypePy, b: BboxTypePy) -> float:
+  return bbox_intersection_area_kernel(to_float_tuple(a, 4), to_float_tuple(b, 4))
+
+def bbox_intersection_areas(a: BboxTypePy, bboxes: typing.Any) -> np.ndarray:
+  return bbox_intersection_areas_kernel(to_float_tuple(a, 4), to_bboxes_array(bboxes))
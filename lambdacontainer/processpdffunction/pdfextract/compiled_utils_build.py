@@ -0,0 +1,44 @@
+
+import os
+import typing
+
+import numba
+import numba.types
+from numba.pycc import CC
+
+from . import compiled_kernels
+
+# Ahead of time compiles compiled_kernels into the compiled_utils_aot extension
+# next to this file so Lambda cold starts don't pay for numba's JIT
+# python -m pdfextract.compiled_utils_build
+
+AOT_MODULE_NAME = "compiled_utils_aot"
+
+FloatTupleType = numba.types.UniTuple(numba.types.float64, 2)
+LinePointsTypeNumba = numba.types.UniTuple(numba.types.float64, 4)
+BboxTypeNumba = numba.types.UniTuple(numba.types.float64, 4)
+LinesTypeNumba = numba.types.float64[:, :]
+
+EXPORTS: typing.List[typing.Tuple[str, typing.Any]] = [
+  ("point_inside_line_bbox", numba.types.boolean(LinePointsTypeNumba, numba.types.float64, numba.types.float64)),
+  ("get_det", numba.types.float64(FloatTupleType, FloatTupleType)),
+  ("line_intersection", FloatTupleType(LinePointsTypeNumba, LinePointsTypeNumba)),
+  ("box_contains", numba.types.boolean(BboxTypeNumba, BboxTypeNumba)),
+  ("boxes_contain", numba.types.boolean[:](BboxTypeNumba, LinesTypeNumba)),
+  ("bbox_intersection_area", numba.types.float64(BboxTypeNumba, BboxTypeNumba)),
+  ("bbox_intersection_areas", numba.types.float64[:](BboxTypeNumba, LinesTypeNumba)),
+]
+
+def make_cc(output_dir: str) -> CC:
+  cc = CC(AOT_MODULE_NAME)
+  cc.output_dir = output_dir
+  cc.verbose = True
+  # Kernels call each other through compiled_kernels' globals so those need to be jitted first
+  for name, _ in EXPORTS:
+    setattr(compiled_kernels, name, numba.njit(getattr(compiled_kernels, name)))
+  for name, signature in EXPORTS:
+    cc.export(name, signature)(getattr(compiled_kernels, name).py_func)
+  return cc
+
+if __name__ == "__main__":
+  make_cc(output_dir=os.path.dirname(os.path.abspath(__file__))).compile()
@@ -1,27 +1,47 @@
 
 import abc
 import argparse
+import base64
 import enum
 import os
+import queue
+import shutil
+import threading
 import typing
 
-import supabase
-import storage3 # type: ignore
 import debugutils
 
-supabase_url = os.environ.get("SUPABASE_URL") or "1"
-supabase_key = os.environ.get("SUPABASE_KEY") or "1"
-print("Supabase url:", supabase_url, "Key:", supabase_key)
-db_client: supabase.client.Client = supabase.client.create_client(
-  supabase_url=supabase_url,
-  supabase_key=supabase_key
-)
+from . import ltjson
+
+if typing.TYPE_CHECKING:
+  import supabase
+  import storage3 # type: ignore
+
+# Created on first use since importing supabase and connecting is slow on cold start
+db_client: typing.Union[None, "supabase.client.Client"] = None
+db_client_lock = threading.Lock()
+
+def get_db_client() -> "supabase.client.Client":
+  global db_client # pylint:disable=global-statement
+  with db_client_lock:
+    if db_client is None:
+      import supabase # pylint:disable=import-outside-toplevel,redefined-outer-name
+      supabase_url = os.environ.get("SUPABASE_URL") or "1"
+      supabase_key = os.environ.get("SUPABASE_KEY") or "1"
+      print("Supabase url:", supabase_url)
+      db_client = supabase.client.create_client(
+        supabase_url=supabase_url,
+        supabase_key=supabase_key
+      )
+    return db_client
 
 # Match /website/utils/tablenames.types.ts
 class TableNames(enum.Enum):
   PDF_SUMMARY = "pdf_summary"
   PDF_ELEMENT_LOCATIONS = "pdf_element_locations"
   STREAMING_PROGRESS = "pdf_processing_progress"
+  PDF_SUMMARY_DELTAS = "pdf_summary_deltas"
+  CHECKPOINTS = "pdf_processing_checkpoints"
 
 class StreamingProgressTable(enum.Enum):
   PDF_ID = "pdf_id"
@@ -35,6 +55,16 @@ class PdfSummaryTable(enum.Enum):
   PDF_SUMMARY = "pdf_summary"
   PDF_NAME = "pdf_name"
 
+class PdfSummaryDeltasTable(enum.Enum):
+  PDF_ID = "pdf_id"
+  STEP = "step"
+  PAGE = "page"
+  DELTA = "delta"
+
+class CheckpointsTable(enum.Enum):
+  PDF_ID = "pdf_id"
+  CHECKPOINT = "checkpoint"
+
 UpdateType = typing.Dict[str, typing.Dict[str, typing.Dict[str, typing.Union[str, int, bool]]]]
 KeyType = typing.Dict[str, typing.Dict[str, typing.Union[str, int, bool]]]
 
@@ -43,6 +73,10 @@ class DataProvider(metaclass=abc.ABCMeta):
   def get_pdf_for_key(self, pdfkey: str) -> typing.Union[None, bytes]:
     pass
 
+  @abc.abstractmethod
+  def write_pdf_summary(self, results_json: str):
+    pass
+
   @abc.abstractmethod
   def write_processpdf_start(self, pdfkey: str, num_steps_total: int):
     pass
@@ -51,6 +85,48 @@ class DataProvider(metaclass=abc.ABCMeta):
   def write_processpdf_progress(self, pdfkey: str, curr_step: int, message: str):
     pass
 
+  @abc.abstractmethod
+  def write_processpdf_delta(self, pdfkey: str, curr_step: int, delta: ltjson.PdfResultsDelta):
+    '''
+    The schedules and elems a step found on one page
+    The summary is votesearch.merge_results_deltas of every delta
+    '''
+    pass
+
+  @abc.abstractmethod
+  def flush_processpdf_deltas(self):
+    '''
+    Wait for every write_processpdf_delta so far to be written
+    '''
+    pass
+
+  @abc.abstractmethod
+  def write_processpdf_checkpoint(self, pdfkey: str, checkpoint: bytes):
+    pass
+
+  @abc.abstractmethod
+  def read_processpdf_checkpoint(self, pdfkey: str) -> typing.Union[None, bytes]:
+    pass
+
+  @abc.abstractmethod
+  def delete_processpdf_checkpoint(self, pdfkey: str):
+    pass
+
+  @abc.abstractmethod
+  def write_job_data(self, job_id: str, key: str, data: bytes):
+    '''
+    Results passed between a fan out coordinator and its chunks
+    '''
+    pass
+
+  @abc.abstractmethod
+  def read_job_data(self, job_id: str, key: str) -> typing.Union[None, bytes]:
+    pass
+
+  @abc.abstractmethod
+  def delete_job_data(self, job_id: str):
+    pass
+
   @abc.abstractmethod
   def write_processpdf_error(self, pdfkey: str, error_message: str):
     pass
@@ -63,21 +139,173 @@ class NullDataProvider(DataProvider):
   def get_pdf_for_key(self, pdfkey: str) -> typing.Union[None, bytes]:
     pass
 
+  def write_pdf_summary(self, results_json: str):
+    pass
+
   def write_processpdf_start(self, pdfkey: str, num_steps_total: int):
     pass
 
   def write_processpdf_progress(self, pdfkey: str, curr_step: int, message: str):
     pass
 
+  def write_processpdf_delta(self, pdfkey: str, curr_step: int, delta: ltjson.PdfResultsDelta):
+    pass
+
+  def flush_processpdf_deltas(self):
+    pass
+
+  def write_processpdf_checkpoint(self, pdfkey: str, checkpoint: bytes):
+    pass
+
+  def read_processpdf_checkpoint(self, pdfkey: str) -> typing.Union[None, bytes]:
+    pass
+
+  def delete_processpdf_checkpoint(self, pdfkey: str):
+    pass
+
+  def write_job_data(self, job_id: str, key: str, data: bytes):
+    pass
+
+  def read_job_data(self, job_id: str, key: str) -> typing.Union[None, bytes]:
+    pass
+
+  def delete_job_data(self, job_id: str):
+    pass
+
   def write_processpdf_error(self, pdfkey: str, error_message: str):
     pass
 
   def write_processpdf_done(self, pdfkey: str, success: bool):
     pass
 
+ProgressUpdate = typing.Tuple[str, int, str] # pdfkey, curr_step, message
+
+class ProgressFlusher:
+  '''
+  Coalesces progress updates on a background thread. Only the latest update is
+  written and at most once every interval_s so callers never wait on the network
+  '''
+  def __init__(
+    self,
+    write_progress: typing.Callable[[str, int, str], None],
+    interval_s: float,
+  ) -> None:
+    self.write_progress = write_progress
+    self.interval_s = interval_s
+    self.condition = threading.Condition()
+    # Held while writing so flush can't be overtaken by an in flight write
+    self.write_lock = threading.Lock()
+    self.pending: typing.Union[None, ProgressUpdate] = None
+    self.closed = False
+    self.thread: typing.Union[None, threading.Thread] = None
+
+  def put(self, pdfkey: str, curr_step: int, message: str):
+    with self.condition:
+      self.pending = (pdfkey, curr_step, message)
+      if self.thread is None:
+        self.closed = False
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+      self.condition.notify()
+
+  def flush(self):
+    '''
+    Write the latest update now
+    '''
+    with self.write_lock:
+      self.__write_pending()
+
+  def close(self):
+    self.flush()
+    with self.condition:
+      self.closed = True
+      self.condition.notify()
+      thread = self.thread
+      self.thread = None
+    if thread is not None:
+      thread.join()
+
+  def __write_pending(self):
+    with self.condition:
+      pending = self.pending
+      self.pending = None
+    if pending is not None:
+      pdfkey, curr_step, message = pending
+      self.write_progress(pdfkey, curr_step, message)
+
+  def __run(self):
+    while True:
+      with self.condition:
+        while self.pending is None and not self.closed:
+          self.condition.wait()
+        if self.closed:
+          return
+      with self.write_lock:
+        self.__write_pending()
+      # Rate limit but wake up right away on close
+      with self.condition:
+        self.condition.wait_for(lambda: self.closed, timeout=self.interval_s)
+
+DeltaUpdate = typing.Tuple[str, int, ltjson.PdfResultsDelta] # pdfkey, curr_step, delta
+
+class DeltaWriter:
+  '''
+  Writes every delta in order on a background thread so callers never wait on the network
+  '''
+  def __init__(
+    self,
+    write_delta: typing.Callable[[str, int, ltjson.PdfResultsDelta], None],
+  ) -> None:
+    self.write_delta = write_delta
+    self.queue: "queue.Queue[typing.Union[None, DeltaUpdate]]" = queue.Queue()
+    self.lock = threading.Lock()
+    self.thread: typing.Union[None, threading.Thread] = None
+
+  def put(self, pdfkey: str, curr_step: int, delta: ltjson.PdfResultsDelta):
+    with self.lock:
+      if self.thread is None:
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+    self.queue.put((pdfkey, curr_step, delta))
+
+  def flush(self):
+    '''
+    Wait for every delta so far to be written
+    '''
+    self.queue.join()
+
+  def close(self):
+    with self.lock:
+      thread = self.thread
+      self.thread = None
+    if thread is not None:
+      self.queue.put(None)
+      thread.join()
+
+  def __run(self):
+    while True:
+      update = self.queue.get()
+      try:
+        if update is None:
+          return
+        pdfkey, curr_step, delta = update
+        self.write_delta(pdfkey, curr_step, delta)
+      except Exception as e:
+        # The thread has to keep draining the queue or flush never returns
+        print("Failed to write delta:", e)
+      finally:
+        self.queue.task_done()
+
 class SupabaseDataProvider(DataProvider):
   def __init__(self, pdfId: str) -> None:
     self.pdfId = pdfId
+    # PROGRESS_FLUSH_INTERVAL_MS between progress writes
+    flush_interval_ms = float(os.environ.get("PROGRESS_FLUSH_INTERVAL_MS") or 500)
+    self.progress_flusher = ProgressFlusher(
+      write_progress=self.__write_processpdf_progress,
+      interval_s=flush_interval_ms / 1000,
+    )
+    self.delta_writer = DeltaWriter(write_delta=self.__write_processpdf_delta)
 
   def get_pdf_for_key(self, pdfkey: str) -> typing.Union[None, bytes]:
     if debugutils.is_dev():
@@ -87,22 +315,24 @@ class SupabaseDataProvider(DataProvider):
           return binary_str
     try:
       storage_client: storage3.SyncStorageClient = typing.cast(
-        storage3.SyncStorageClient,
-        db_client.storage()
+        "storage3.SyncStorageClient",
+        get_db_client().storage()
       )
       pdf_bytes = storage_client.from_("pdfs").download("public/" + pdfkey + ".pdf")
       return pdf_bytes
     except Exception as e:
-      print("PDF: {0} not found", pdfkey, e)
+      print("PDF: {0} not found:".format(pdfkey), e)
     return None
 
   def write_pdf_summary(self, results_json: str):
+    # The summary replaces the deltas so they need to land first
+    self.delta_writer.flush()
     data = {
       PdfSummaryTable.PDF_ID.value: self.pdfId,
       PdfSummaryTable.PDF_SUMMARY.value: results_json,
     }
     try:
-      db_client.table(TableNames.PDF_SUMMARY.value)\
+      get_db_client().table(TableNames.PDF_SUMMARY.value)\
         .update(json=data).eq(PdfSummaryTable.PDF_ID.value, self.pdfId).execute() # type: ignore
     except Exception as e:
       print("Failed to write_pdf_summary:", e)
@@ -113,46 +343,237 @@ class SupabaseDataProvider(DataProvider):
       StreamingProgressTable.TOTAL_STEPS.value: num_steps_total,
     }
     try:
-      db_client.table(TableNames.STREAMING_PROGRESS.value)\
+      get_db_client().table(TableNames.STREAMING_PROGRESS.value)\
         .update(json=data).eq(StreamingProgressTable.PDF_ID.value, pdfkey).execute() # type:ignore
     except Exception as e:
       print("Failed to write_processpdf_start:", e)
 
   def write_processpdf_progress(self, pdfkey: str, curr_step: int, message: str):
+    self.progress_flusher.put(pdfkey=pdfkey, curr_step=curr_step, message=message)
+
+  def __write_processpdf_progress(self, pdfkey: str, curr_step: int, message: str):
     data = {
       StreamingProgressTable.PDF_ID.value: pdfkey,
       StreamingProgressTable.CURR_STEP.value: curr_step,
       StreamingProgressTable.MSG.value: message
     }
     try:
-      db_client.table(TableNames.STREAMING_PROGRESS.value)\
+      get_db_client().table(TableNames.STREAMING_PROGRESS.value)\
         .update(json=data).eq(StreamingProgressTable.PDF_ID.value, pdfkey).execute() # type:ignore
     except Exception as e:
       print("Failed to write_processpdf_progress:", e)
 
+  def write_processpdf_delta(self, pdfkey: str, curr_step: int, delta: ltjson.PdfResultsDelta):
+    self.delta_writer.put(pdfkey=pdfkey, curr_step=curr_step, delta=delta)
+
+  def flush_processpdf_deltas(self):
+    self.delta_writer.flush()
+
+  def __write_processpdf_delta(self, pdfkey: str, curr_step: int, delta: ltjson.PdfResultsDelta):
+    try:
+      data = {
+        PdfSummaryDeltasTable.PDF_ID.value: pdfkey,
+        PdfSummaryDeltasTable.STEP.value: curr_step,
+        PdfSummaryDeltasTable.PAGE.value: delta["page"],
+        PdfSummaryDeltasTable.DELTA.value: ltjson.LTJsonEncoder().encode(delta),
+      }
+      get_db_client().table(TableNames.PDF_SUMMARY_DELTAS.value)\
+        .upsert(json=data).execute() # type:ignore
+    except Exception as e:
+      print("Failed to write_processpdf_delta:", e)
+
+  def write_processpdf_checkpoint(self, pdfkey: str, checkpoint: bytes):
+    # Deltas up to the checkpoint need to be written before resuming can skip them
+    self.delta_writer.flush()
+    data = {
+      CheckpointsTable.PDF_ID.value: pdfkey,
+      CheckpointsTable.CHECKPOINT.value: base64.b64encode(checkpoint).decode("ascii"),
+    }
+    try:
+      get_db_client().table(TableNames.CHECKPOINTS.value)\
+        .upsert(json=data).execute() # type:ignore
+    except Exception as e:
+      print("Failed to write_processpdf_checkpoint:", e)
+
+  def read_processpdf_checkpoint(self, pdfkey: str) -> typing.Union[None, bytes]:
+    try:
+      response = get_db_client().table(TableNames.CHECKPOINTS.value)\
+        .select(CheckpointsTable.CHECKPOINT.value)\
+        .eq(CheckpointsTable.PDF_ID.value, pdfkey).execute() # type:ignore
+      if len(response.data) > 0:
+        return base64.b64decode(response.data[0][CheckpointsTable.CHECKPOINT.value])
+    except Exception as e:
+      print("Failed to read_processpdf_checkpoint:", e)
+    return None
+
+  def delete_processpdf_checkpoint(self, pdfkey: str):
+    try:
+      get_db_client().table(TableNames.CHECKPOINTS.value)\
+        .delete().eq(CheckpointsTable.PDF_ID.value, pdfkey).execute() # type:ignore
+    except Exception as e:
+      print("Failed to delete_processpdf_checkpoint:", e)
+
+  def write_job_data(self, job_id: str, key: str, data: bytes):
+    path = get_job_data_path(job_id=job_id, key=key)
+    try:
+      storage_client: storage3.SyncStorageClient = typing.cast(
+        "storage3.SyncStorageClient",
+        get_db_client().storage()
+      )
+      storage_client.from_("pdfs").upload(path, data)
+    except Exception as e:
+      print("Failed to write_job_data:", path, e)
+
+  def read_job_data(self, job_id: str, key: str) -> typing.Union[None, bytes]:
+    path = get_job_data_path(job_id=job_id, key=key)
+    try:
+      storage_client: storage3.SyncStorageClient = typing.cast(
+        "storage3.SyncStorageClient",
+        get_db_client().storage()
+      )
+      return storage_client.from_("pdfs").download(path)
+    except Exception as e:
+      print("Failed to read_job_data:", path, e)
+    return None
+
+  def delete_job_data(self, job_id: str):
+    directory = get_job_data_dir(job_id=job_id)
+    try:
+      storage_client: storage3.SyncStorageClient = typing.cast(
+        "storage3.SyncStorageClient",
+        get_db_client().storage()
+      )
+      bucket = storage_client.from_("pdfs")
+      # Listing is paged so remove a page at a time until none are left
+      while True:
+        files = bucket.list(directory)
+        if len(files) == 0:
+          break
+        removed = bucket.remove([directory + "/" + f["name"] for f in files])
+        if len(removed) == 0:
+          print("Failed to delete_job_data:", directory, "nothing removed")
+          break
+    except Exception as e:
+      print("Failed to delete_job_data:", directory, e)
+
   def write_processpdf_error(self, pdfkey: str, error_message: str):
     # Could occur before start
+    # Don't let a pending progress message overwrite the error
+    self.progress_flusher.flush()
     data = {
       StreamingProgressTable.PDF_ID.value: pdfkey,
       StreamingProgressTable.MSG.value: error_message
     }
     try:
-      db_client.table(TableNames.STREAMING_PROGRESS.value)\
+      get_db_client().table(TableNames.STREAMING_PROGRESS.value)\
         .update(json=data).eq(StreamingProgressTable.PDF_ID.value, pdfkey).execute() # type:ignore
     except Exception as e:
       print("Failed to write_processpdf_error:", e)
 
   def write_processpdf_done(self, pdfkey: str, success: bool):
+    self.delta_writer.close()
+    self.progress_flusher.close()
     data = {
       StreamingProgressTable.PDF_ID.value: pdfkey,
       StreamingProgressTable.SUCCESS.value: success,
     }
     try:
-      db_client.table(TableNames.STREAMING_PROGRESS.value)\
+      get_db_client().table(TableNames.STREAMING_PROGRESS.value)\
         .update(json=data).eq(StreamingProgressTable.PDF_ID.value, pdfkey).execute() # type:ignore
     except Exception as e:
       print("Failed to write_processpdf_done:", e)
 
+class LocalDataProvider(DataProvider):
+  '''
+  Stands in for SupabaseDataProvider with files under directory
+  '''
+  def __init__(self, pdfId: str, directory: str) -> None:
+    self.pdfId = pdfId
+    self.directory = directory
+    os.makedirs(self.directory, exist_ok=True)
+
+  def get_pdf_for_key(self, pdfkey: str) -> typing.Union[None, bytes]:
+    for path in [os.path.join(self.directory, pdfkey + ".pdf"), pdfkey]:
+      if os.path.exists(path):
+        with open(path, "rb") as f:
+          return f.read()
+    print("PDF: {0} not found".format(pdfkey))
+    return None
+
+  def write_pdf_summary(self, results_json: str):
+    self.__write(name=self.pdfId + ".summary.json", data=results_json.encode("utf-8"))
+
+  def write_processpdf_start(self, pdfkey: str, num_steps_total: int):
+    print("Processing:", pdfkey, "steps:", num_steps_total)
+
+  def write_processpdf_progress(self, pdfkey: str, curr_step: int, message: str):
+    print("Progress:", pdfkey, curr_step, message)
+
+  def write_processpdf_delta(self, pdfkey: str, curr_step: int, delta: ltjson.PdfResultsDelta):
+    with open(os.path.join(self.directory, pdfkey + ".deltas.jsonl"), "a", encoding="utf-8") as f:
+      f.write(ltjson.LTJsonEncoder().encode(delta) + "\n")
+
+  def flush_processpdf_deltas(self):
+    pass
+
+  def write_processpdf_checkpoint(self, pdfkey: str, checkpoint: bytes):
+    self.__write(name=pdfkey + ".checkpoint", data=checkpoint)
+
+  def read_processpdf_checkpoint(self, pdfkey: str) -> typing.Union[None, bytes]:
+    return self.__read(name=pdfkey + ".checkpoint")
+
+  def delete_processpdf_checkpoint(self, pdfkey: str):
+    try:
+      os.remove(os.path.join(self.directory, pdfkey + ".checkpoint"))
+    except FileNotFoundError:
+      pass
+
+  def write_job_data(self, job_id: str, key: str, data: bytes):
+    self.__write(name=get_job_data_path(job_id=job_id, key=key), data=data)
+
+  def read_job_data(self, job_id: str, key: str) -> typing.Union[None, bytes]:
+    return self.__read(name=get_job_data_path(job_id=job_id, key=key))
+
+  def delete_job_data(self, job_id: str):
+    shutil.rmtree(os.path.join(self.directory, get_job_data_dir(job_id=job_id)), ignore_errors=True)
+
+  def write_processpdf_error(self, pdfkey: str, error_message: str):
+    print("Error:", pdfkey, error_message)
+
+  def write_processpdf_done(self, pdfkey: str, success: bool):
+    print("Done:", pdfkey, "success:", success)
+
+  def __write(self, name: str, data: bytes):
+    path = os.path.join(self.directory, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Chunks may run in other processes so write then rename
+    tmp_path = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(tmp_path, "wb") as f:
+      f.write(data)
+    os.replace(tmp_path, path)
+
+  def __read(self, name: str) -> typing.Union[None, bytes]:
+    path = os.path.join(self.directory, name)
+    if not os.path.exists(path):
+      return None
+    with open(path, "rb") as f:
+      return f.read()
+
+def get_job_data_dir(job_id: str) -> str:
+  return "jobs/{0}".format(job_id)
+
+def get_job_data_path(job_id: str, key: str) -> str:
+  return "{0}/{1}".format(get_job_data_dir(job_id=job_id), key)
+
+def make_data_provider(pdfId: str) -> DataProvider:
+  '''
+  LOCAL_DATA_DIR=/tmp/pdfdata to use files instead of supabase
+  '''
+  local_data_dir = os.environ.get("LOCAL_DATA_DIR")
+  if local_data_dir:
+    return LocalDataProvider(pdfId=pdfId, directory=local_data_dir)
+  return SupabaseDataProvider(pdfId=pdfId)
+
 def parse_args():
   parser = argparse.ArgumentParser()
   parser.add_argument("--listtables", dest="listtables", default=False, action="store_true")
@@ -0,0 +1,88 @@
+
+import typing
+
+import numpy as np
+
+def line_distance_matrix(
+  lines1: np.ndarray,
+  lines2: np.ndarray,
+) -> np.ndarray:
+  '''
+  lines1: (N,4) lines2: (M,4)
+  Returns (N,M) of min(forward, backward) L1 distance between the line endpoints
+  '''
+  x0a = lines1[:, 0:1]
+  y0a = lines1[:, 1:2]
+  x1a = lines1[:, 2:3]
+  y1a = lines1[:, 3:4]
+  x0b = lines2[:, 0]
+  y0b = lines2[:, 1]
+  x1b = lines2[:, 2]
+  y1b = lines2[:, 3]
+  dist_forward = np.abs(x0a-x0b) + np.abs(y0a-y0b) + np.abs(x1a-x1b) + np.abs(y1a-y1b)
+  dist_backward = np.abs(x0a-x1b) + np.abs(y0a-y1b) + np.abs(x1a-x0b) + np.abs(y1a-y0b)
+  return np.minimum(dist_forward, dist_backward)
+
+def early_exit_totals(
+  running_totals: np.ndarray,
+  max_dist: float,
+) -> np.ndarray:
+  '''
+  running_totals: (N,K) running sums down each column
+  The total of each column at the first row over max_dist otherwise the last row
+  '''
+  if max_dist < 0:
+    return running_totals[-1]
+  over = running_totals > max_dist
+  first_over = np.where(over.any(axis=0), over.argmax(axis=0), running_totals.shape[0] - 1)
+  return running_totals[first_over, np.arange(running_totals.shape[1])]
+
+def line_set_distance(
+  lines1: np.ndarray,
+  lines2: np.ndarray,
+  max_dist: float,
+) -> float:
+  '''
+  Average over lines1 of the distance to the closest line in lines2
+  Stops adding once the total is over max_dist unless max_dist < 0
+  '''
+  if lines1.shape[0] == 0 or lines2.shape[0] == 0:
+    return 0.
+  best_dists = line_distance_matrix(lines1=lines1, lines2=lines2).min(axis=1)
+  running_totals = np.cumsum(best_dists / max(lines1.shape[0], lines2.shape[0]))
+  return float(early_exit_totals(running_totals=running_totals[:, None], max_dist=max_dist)[0])
+
+def line_set_distances(
+  lines1: np.ndarray,
+  lines: np.ndarray,
+  line_offsets: np.ndarray,
+  max_dist: float,
+) -> np.ndarray:
+  '''
+  line_set_distance of lines1 against each candidate at once
+  lines: (M,4) with candidate k being lines[line_offsets[k]:line_offsets[k+1]]
+  '''
+  num_candidates = line_offsets.shape[0] - 1
+  out = np.zeros((num_candidates,), dtype=np.float64)
+  line_counts = np.diff(line_offsets)
+  has_lines = np.flatnonzero(line_counts > 0)
+  if lines1.shape[0] == 0 or has_lines.shape[0] == 0:
+    return out
+  dists = line_distance_matrix(lines1=lines1, lines2=lines)
+  best_dists = np.minimum.reduceat(dists, line_offsets[has_lines], axis=1)
+  divisors = np.maximum(lines1.shape[0], line_counts[has_lines])
+  running_totals = np.cumsum(best_dists / divisors, axis=0)
+  out[has_lines] = early_exit_totals(running_totals=running_totals, max_dist=max_dist)
+  return out
+
+def stack_lines(
+  line_sets: typing.List[np.ndarray],
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+  '''
+  Concatenated lines and line_offsets for line_set_distances
+  '''
+  line_counts = [line_set.shape[0] for line_set in line_sets]
+  line_offsets = np.concatenate([[0], np.cumsum(line_counts, dtype=np.int64)]).astype(np.int64)
+  if len(line_sets) == 0:
+    return np.zeros((0, 4), dtype=np.float64), line_offsets
+  return np.concatenate(line_sets, axis=0).reshape((-1, 4)), line_offsets
@@ -0,0 +1,218 @@
+import abc
+import concurrent.futures
+import io
+import json
+import typing
+
+from . import checkpoint, dataprovider, ltjson, pagecache, pdfprocessor, votesearch
+
+# Splits a pdf into page ranges processed by separate invocations
+# Phase 1: each chunk finds the schedules on its pages
+# Phase 2: each chunk matches the items of every schedule on its pages
+# Schedules apply to pages in other chunks so phase 2 waits for all of phase 1
+
+SCHEDULES_KEY = "schedules"
+
+class ChunkEvent(typing.TypedDict):
+  pdfId: str
+  jobId: str
+  pageRange: typing.List[int] # [start, end)
+  phase: int
+  chunkIdx: int
+
+def is_chunk_event(event: typing.Dict[str, typing.Any]) -> bool:
+  return all([key in event for key in ["pdfId", "jobId", "pageRange", "phase", "chunkIdx"]])
+
+def split_page_ranges(num_pages: int, chunk_pages: int) -> typing.List[typing.Tuple[int, int]]:
+  return [
+    (start, min(start + chunk_pages, num_pages))
+    for start in range(0, num_pages, chunk_pages)
+  ]
+
+def get_chunk_key(phase: int, chunk_idx: int) -> str:
+  return "phase{0}-chunk{1}".format(phase, chunk_idx)
+
+class ChunkDispatcher(metaclass=abc.ABCMeta):
+  @abc.abstractmethod
+  def dispatch(self, events: typing.List[ChunkEvent]) -> typing.Iterator[int]:
+    '''
+    Runs every event and yields the index of each as it finishes
+    '''
+    pass
+
+class LocalChunkDispatcher(ChunkDispatcher):
+  def __init__(self, handle_event: typing.Callable[[ChunkEvent], typing.Any]) -> None:
+    self.handle_event = handle_event
+
+  def dispatch(self, events: typing.List[ChunkEvent]) -> typing.Iterator[int]:
+    for idx, event in enumerate(events):
+      self.handle_event(event)
+      yield idx
+
+class LambdaChunkDispatcher(ChunkDispatcher):
+  '''
+  Invokes function_name once per chunk and waits for every invocation
+  '''
+  def __init__(self, function_name: str, max_concurrency: int) -> None:
+    self.function_name = function_name
+    self.max_concurrency = max_concurrency
+
+  def dispatch(self, events: typing.List[ChunkEvent]) -> typing.Iterator[int]:
+    import boto3 # pylint:disable=import-outside-toplevel
+    import botocore.config # pylint:disable=import-outside-toplevel
+    # A chunk can run up to the 15 minute Lambda timeout and retrying would rerun the chunk
+    client = boto3.client("lambda", config=botocore.config.Config(
+      read_timeout=900,
+      retries={ "max_attempts": 0 },
+    ))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.max_concurrency)) as executor:
+      futures = {
+        executor.submit(self.__invoke, client, event): idx
+        for idx, event in enumerate(events)
+      }
+      for future in concurrent.futures.as_completed(futures):
+        future.result()
+        yield futures[future]
+
+  def __invoke(self, client: typing.Any, event: ChunkEvent):
+    response = client.invoke(
+      FunctionName=self.function_name,
+      InvocationType="RequestResponse",
+      Payload=json.dumps(event).encode("utf-8"),
+    )
+    if "FunctionError" in response:
+      raise RuntimeError("Chunk {0} failed: {1}".format(
+        event["chunkIdx"], response["Payload"].read().decode("utf-8")
+      ))
+
+def process_chunk(
+  data_provider: dataprovider.DataProvider,
+  event: ChunkEvent,
+  pdfdata: bytes,
+  page_cache: typing.Union[None, pagecache.PageCache] = None,
+):
+  '''
+  Writes the chunk's result as job data for the coordinator
+  '''
+  phase = event["phase"]
+  job_id = event["jobId"]
+  start, end = event["pageRange"]
+  page_numbers = list(range(start, end))
+  processor = pdfprocessor.PdfProcessor(
+    pdfdata=pdfdata,
+    page_numbers=page_numbers,
+    page_cache=page_cache if page_cache is not None else pagecache.NullPageCache(),
+    data_provider=data_provider,
+    last_pass_number=phase,
+  )
+  num_restored_deltas = 0
+  if phase == 2:
+    schedules_data = data_provider.read_job_data(job_id=job_id, key=SCHEDULES_KEY)
+    schedules = checkpoint.decode_checkpoint(data=schedules_data) if schedules_data is not None else None
+    if schedules is None:
+      raise RuntimeError("Missing schedules for job: {0}".format(job_id))
+    processor.restore_checkpoint(pdf_checkpoint=schedules)
+    num_restored_deltas = len(processor.deltas)
+  for _ in processor.process_page():
+    pass
+  if phase == 1:
+    data = checkpoint.encode_checkpoint(checkpoint=processor.make_checkpoint(last_page=end - 1))
+  else:
+    data = checkpoint.encode_deltas(deltas=processor.deltas[num_restored_deltas:])
+  data_provider.write_job_data(
+    job_id=job_id,
+    key=get_chunk_key(phase=phase, chunk_idx=event["chunkIdx"]),
+    data=data,
+  )
+
+def coordinate_pdf(
+  data_provider: dataprovider.DataProvider,
+  dispatcher: ChunkDispatcher,
+  pdfkey: str,
+  pdfdata: bytes,
+  job_id: str,
+  chunk_pages: int,
+) -> ltjson.PdfSummaryJson:
+  num_pages = pdfprocessor.get_pdf_num_pages(pdfdata_io=io.BytesIO(initial_bytes=pdfdata))
+  page_ranges = split_page_ranges(num_pages=num_pages, chunk_pages=chunk_pages)
+  data_provider.write_processpdf_start(pdfkey=pdfkey, num_steps_total=2 * len(page_ranges) + 1)
+  try:
+    curr_step = 0
+    deltas: typing.List[ltjson.PdfResultsDelta] = []
+    for phase in [1, 2]:
+      events: typing.List[ChunkEvent] = [
+        {
+          "pdfId": pdfkey,
+          "jobId": job_id,
+          "pageRange": [start, end],
+          "phase": phase,
+          "chunkIdx": chunk_idx,
+        }
+        for chunk_idx, (start, end) in enumerate(page_ranges)
+      ]
+      for chunk_idx in dispatcher.dispatch(events=events):
+        curr_step += 1
+        if phase == 2:
+          chunk_deltas = checkpoint.decode_deltas(data=read_chunk_data(
+            data_provider=data_provider,
+            job_id=job_id,
+            key=get_chunk_key(phase=phase, chunk_idx=chunk_idx),
+          ))
+          for delta in chunk_deltas:
+            if not votesearch.results_delta_is_empty(delta=delta):
+              data_provider.write_processpdf_delta(pdfkey=pdfkey, curr_step=curr_step, delta=delta)
+          deltas.extend(chunk_deltas)
+        start, end = page_ranges[chunk_idx]
+        data_provider.write_processpdf_progress(
+          pdfkey=pdfkey,
+          curr_step=curr_step,
+          message="Processing pages: {0}-{1}".format(start + 1, end),
+        )
+      if phase == 1:
+        schedules = merge_schedules(
+          data_provider=data_provider,
+          job_id=job_id,
+          num_chunks=len(page_ranges),
+        )
+        for delta in schedules["deltas"]:
+          if not votesearch.results_delta_is_empty(delta=delta):
+            data_provider.write_processpdf_delta(pdfkey=pdfkey, curr_step=curr_step, delta=delta)
+        deltas.extend(schedules["deltas"])
+        data_provider.write_job_data(
+          job_id=job_id,
+          key=SCHEDULES_KEY,
+          data=checkpoint.encode_checkpoint(checkpoint=schedules),
+        )
+    data_provider.flush_processpdf_deltas()
+    return votesearch.merge_results_deltas(deltas=deltas)
+  finally:
+    # Chunk results are only needed until the summary is built
+    data_provider.delete_job_data(job_id=job_id)
+
+def merge_schedules(
+  data_provider: dataprovider.DataProvider,
+  job_id: str,
+  num_chunks: int,
+) -> checkpoint.ProcessorCheckpoint:
+  chunk_checkpoints: typing.List[checkpoint.ProcessorCheckpoint] = []
+  for chunk_idx in range(num_chunks):
+    key = get_chunk_key(phase=1, chunk_idx=chunk_idx)
+    chunk_checkpoint = checkpoint.decode_checkpoint(data=read_chunk_data(
+      data_provider=data_provider,
+      job_id=job_id,
+      key=key,
+    ))
+    if chunk_checkpoint is None:
+      raise RuntimeError("Could not decode {0} for job: {1}".format(key, job_id))
+    chunk_checkpoints.append(chunk_checkpoint)
+  return checkpoint.merge_checkpoints(checkpoints=chunk_checkpoints)
+
+def read_chunk_data(
+  data_provider: dataprovider.DataProvider,
+  job_id: str,
+  key: str,
+) -> bytes:
+  data = data_provider.read_job_data(job_id=job_id, key=key)
+  if data is None:
+    raise RuntimeError("Missing {0} for job: {1}".format(key, job_id))
+  return data
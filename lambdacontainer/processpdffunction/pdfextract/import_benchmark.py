@@ -0,0 +1,81 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import typing
+
+# Cold start cost of importing the Lambda entry points. Each sample is a fresh interpreter
+# python -m pdfextract.import_benchmark --max-ms 1500
+
+BENCHMARKS: typing.Dict[str, str] = {
+  "app": "import app",
+  "pdfprocessor": "from pdfextract import pdfprocessor",
+  "dataprovider": "from pdfextract import dataprovider",
+  "searcher": "from pdfextract import votesearch; votesearch.PdfSearcher()",
+}
+
+TIMER_TEMPLATE = '''
+import time
+t0 = time.perf_counter()
+{0}
+print((time.perf_counter() - t0) * 1000)
+'''
+
+ImportTime = typing.Tuple[str, int] # module, cumulative microseconds
+
+def run_sample(code: str, cwd: str) -> typing.Tuple[float, typing.List[ImportTime]]:
+  '''
+  Milliseconds to run code and each module's cumulative import time
+  '''
+  result = subprocess.run(
+    [sys.executable, "-X", "importtime", "-c", TIMER_TEMPLATE.format(code)],
+    cwd=cwd,
+    capture_output=True,
+    text=True,
+    check=True,
+  )
+  import_times: typing.List[ImportTime] = []
+  for line in result.stderr.splitlines():
+    # import time: self [us] | cumulative | imported package
+    if not line.startswith("import time:"):
+      continue
+    parts = line[len("import time:"):].split("|")
+    if len(parts) != 3 or not parts[1].strip().isdigit():
+      continue
+    import_times.append((parts[2].rstrip(), int(parts[1])))
+  return float(result.stdout.strip().splitlines()[-1]), import_times
+
+def parse_args():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--repeat", dest="repeat", type=int, default=5)
+  parser.add_argument("--top", dest="top", type=int, default=10)
+  parser.add_argument("--max-ms", dest="max_ms", type=float, default=-1)
+  parser.add_argument("benchmarks", nargs="*", default=list(BENCHMARKS.keys()))
+  return parser.parse_args()
+
+def main():
+  args = parse_args()
+  cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  failed = False
+  for name in args.benchmarks:
+    samples: typing.List[float] = []
+    import_times: typing.List[ImportTime] = []
+    for _ in range(args.repeat):
+      elapsed_ms, import_times = run_sample(code=BENCHMARKS[name], cwd=cwd)
+      samples.append(elapsed_ms)
+    median_ms = statistics.median(samples)
+    print("{0}: median {1:.1f}ms min {2:.1f}ms max {3:.1f}ms".format(
+      name, median_ms, min(samples), max(samples)
+    ))
+    import_times.sort(key=lambda import_time: import_time[1], reverse=True)
+    for module, cumulative_us in import_times[:args.top]:
+      print("  {0:>8.1f}ms {1}".format(cumulative_us / 1000, module))
+    if args.max_ms >= 0 and median_ms > args.max_ms:
+      print("{0} is over {1}ms".format(name, args.max_ms))
+      failed = True
+  if failed:
+    sys.exit(1)
+
+if __name__ == "__main__":
+  main()
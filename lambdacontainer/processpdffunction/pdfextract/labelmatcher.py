@@ -0,0 +1,99 @@
+
+import collections
+import re
+import typing
+
+from . import pdfindexer
+
+# ItemSearchRule regexes are "^(?P<label>X)[\n ]?$"
+ITEM_LABEL_REGEX = re.compile(r"^\^\(\?P<label>(?P<inner>.*)\)\[\\n \]\?\$$", re.DOTALL)
+REGEX_SPECIAL_CHARS = set(".^$*+?{}[]\\|()")
+# What "[\n ]?$" allows after the label. $ also matches before a trailing newline
+LABEL_SUFFIXES = ["", "\n", " ", "\n\n", " \n"]
+
+LabelMatch = typing.Tuple[int, str] # regex idx, label
+ElemLabelMatch = typing.Tuple[int, int, str] # elem idx, regex idx, label
+
+def get_literal_label(regex: str) -> typing.Union[None, str]:
+  '''
+  The label that regex matches if it can only match one label
+  '''
+  match = ITEM_LABEL_REGEX.match(regex)
+  if match is None:
+    return None
+  inner = match.group("inner")
+  if any([c in REGEX_SPECIAL_CHARS for c in inner]):
+    return None
+  return inner
+
+class LabelMatcher:
+  '''
+  Matches text against many label regexes at once
+  Literal labels are dictionary lookups. The remaining regexes are only
+  searched one by one when a single combined alternation matches
+  '''
+  def __init__(self, regexes: typing.List[str]) -> None:
+    self.literal_lookup: typing.DefaultDict[str, typing.List[int]] = collections.defaultdict(list)
+    regex_idxes: typing.DefaultDict[str, typing.List[int]] = collections.defaultdict(list)
+    for idx, regex in enumerate(regexes):
+      literal_label = get_literal_label(regex=regex)
+      if literal_label is not None:
+        if len(literal_label) > 0:
+          self.literal_lookup[literal_label].append(idx)
+      else:
+        regex_idxes[regex].append(idx)
+    self.regexes = [(re.compile(regex), idxes) for regex, idxes in regex_idxes.items()]
+    self.combined_regex: typing.Union[None, typing.Pattern[str]] = None
+    if len(self.regexes) > 1:
+      try:
+        self.combined_regex = re.compile("|".join([
+          "(?:{0})".format(regex.replace("(?P<label>", "(?:")) for regex in regex_idxes.keys()
+        ]))
+      except re.error:
+        # Search each regex
+        self.combined_regex = None
+
+  def match(self, text: str) -> typing.List[LabelMatch]:
+    out: typing.List[LabelMatch] = []
+    for suffix in LABEL_SUFFIXES:
+      if len(suffix) > 0 and not text.endswith(suffix):
+        continue
+      label = text[:len(text)-len(suffix)]
+      for idx in self.literal_lookup.get(label, []):
+        out.append((idx, label))
+    out.extend(self.match_regexes(text=text))
+    return out
+
+  def match_text_index(self, text_index: pdfindexer.TextIndex) -> typing.List[ElemLabelMatch]:
+    '''
+    Every match on a page sorted by elem idx
+    Literal labels are looked up and only the regexes visit each text elem
+    '''
+    out: typing.List[ElemLabelMatch] = []
+    for label, idxes in self.literal_lookup.items():
+      for suffix in LABEL_SUFFIXES:
+        for elem_idx in text_index.raw_text_lookup.get(label + suffix, []):
+          for idx in idxes:
+            out.append((elem_idx, idx, label))
+    if len(self.regexes) > 0:
+      for elem_idx, text in zip(text_index.elem_idxes, text_index.texts):
+        for idx, label in self.match_regexes(text=text):
+          out.append((elem_idx, idx, label))
+    out.sort(key=lambda elem_match: elem_match[0])
+    return out
+
+  def match_regexes(self, text: str) -> typing.List[LabelMatch]:
+    out: typing.List[LabelMatch] = []
+    if len(self.regexes) > 0:
+      if self.combined_regex is not None and self.combined_regex.search(text) is None:
+        return out
+      for regex, idxes in self.regexes:
+        match = regex.search(text)
+        if match is None:
+          continue
+        label = match.groupdict()["label"]
+        if len(label) == 0:
+          continue
+        for idx in idxes:
+          out.append((idx, label))
+    return out
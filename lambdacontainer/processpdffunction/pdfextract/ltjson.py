@@ -1,8 +1,8 @@
-
 import enum
 import json
 import typing
 
+import numpy as np
 import pdfminer.layout
 
 from . import debug_utils
@@ -11,89 +11,549 @@ from . import path_utils
 ElemListType = typing.List[typing.Union[pdfminer.layout.LTCurve, pdfminer.layout.LTChar]]
 BboxType = typing.Tuple[float, float, float, float]
 
+FLAG_IS_RECT = 1
+FLAG_IS_LINE = 2
+FLAG_IS_CONTAINER = 4
+FLAG_IS_ANNOTATION = 8
+FLAG_UPRIGHT = 16
+FLAG_HAS_TEXT = 32
+FLAG_HAS_PATH = 64
+
+PATH_SEGMENT_TYPES = path_utils.PATH_SEGMENT_TYPES
+
+SERIALIZED_KEYS = [
+  "bbox", "width", "height", "label", "text", "size", "original_path", "linewidth",
+  "is_container", "is_annotation", "is_line", "is_rect", "parent_idx", "children_idxes", "upright",
+]
+
+class PageArrays:
+  '''
+  The elements of a page stored as columns. LTJson elements are views into a row
+  N elements, S path segments, P path points
+  bbox: (N,4) width, height, size, linewidth: (N,) with nan for None
+  flags: (N,) FLAG_ bitfield, parent_idx: (N,) with -1 for None
+  text_offsets: (N+1,) into text_buffer
+  path_offsets: (N+1,) into segment_types, segment_offsets: (S+1,) into points (P,2)
+  '''
+  def __init__(
+    self,
+    bbox: np.ndarray,
+    width: np.ndarray,
+    height: np.ndarray,
+    size: np.ndarray,
+    linewidth: np.ndarray,
+    flags: np.ndarray,
+    parent_idx: np.ndarray,
+    text_offsets: np.ndarray,
+    text_buffer: str,
+    path_offsets: np.ndarray,
+    segment_types: np.ndarray,
+    segment_offsets: np.ndarray,
+    points: np.ndarray,
+    labels: typing.Dict[int, str],
+    children_idxes: typing.Dict[int, typing.List[int]],
+  ) -> None:
+    self.bbox = bbox
+    self.width = width
+    self.height = height
+    self.size = size
+    self.linewidth = linewidth
+    self.flags = flags
+    self.parent_idx = parent_idx
+    self.text_offsets = text_offsets
+    self.text_buffer = text_buffer
+    self.path_offsets = path_offsets
+    self.segment_types = segment_types
+    self.segment_offsets = segment_offsets
+    self.points = points
+    # Rarely set so kept sparse
+    self.labels = labels
+    self.children_idxes = children_idxes
+    # Variable length values replaced after building
+    self.text_overrides: typing.Dict[int, typing.Union[None, str]] = {}
+    self.path_overrides: typing.Dict[int, typing.Any] = {}
+    # Lazily flattened lines (M,4) of every path with (N+1,) offsets by elem
+    self.path_lines: typing.Union[None, typing.Tuple[np.ndarray, np.ndarray]] = None
+    self.zeroed_path_lines: typing.Union[None, np.ndarray] = None
+
+  def __len__(self) -> int:
+    return self.bbox.shape[0]
+
+  @property
+  def nbytes(self) -> int:
+    '''
+    Size of the columns. Python objects like views and overrides are not counted
+    '''
+    arrays = [
+      self.bbox, self.width, self.height, self.size, self.linewidth, self.flags, self.parent_idx,
+      self.text_offsets, self.path_offsets, self.segment_types, self.segment_offsets, self.points,
+    ]
+    return sum([array.nbytes for array in arrays]) + len(self.text_buffer)
+
+  def views(self) -> typing.List["LTJson"]:
+    return [LTJson(page_arrays=self, idx=idx) for idx in range(len(self))]
+
+  def has_flag(self, idx: int, flag: int) -> bool:
+    return (self.flags.item(idx) & flag) != 0
+
+  def set_flag(self, idx: int, flag: int, value: bool):
+    if value:
+      self.flags[idx] |= flag
+    else:
+      self.flags[idx] &= ~flag & 0xff
+
+  def get_text(self, idx: int) -> typing.Union[None, str]:
+    if self.text_overrides and idx in self.text_overrides:
+      return self.text_overrides[idx]
+    if not self.has_flag(idx, FLAG_HAS_TEXT):
+      return None
+    return self.text_buffer[self.text_offsets.item(idx):self.text_offsets.item(idx+1)]
+
+  def get_path(self, idx: int) -> typing.Any:
+    if self.path_overrides and idx in self.path_overrides:
+      return self.path_overrides[idx]
+    if not self.has_flag(idx, FLAG_HAS_PATH):
+      return None
+    path: typing.List[typing.Tuple[typing.Any, ...]] = []
+    for segment_idx in range(self.path_offsets.item(idx), self.path_offsets.item(idx+1)):
+      segment_type = PATH_SEGMENT_TYPES[self.segment_types.item(segment_idx)]
+      start = self.segment_offsets.item(segment_idx)
+      end = self.segment_offsets.item(segment_idx+1)
+      pts = [tuple(pt) for pt in self.points[start:end].tolist()]
+      path.append((segment_type, *pts))
+    return path
+
+  def get_path_lines(self) -> typing.Tuple[np.ndarray, np.ndarray]:
+    '''
+    lines (M,4), line_offsets (N+1,) with elem i's lines at lines[line_offsets[i]:line_offsets[i+1]]
+    '''
+    if self.path_lines is not None:
+      return self.path_lines
+    page_arrays = self
+    if self.path_overrides:
+      page_arrays = self.take(list(range(len(self))))
+    lines, line_elem_idxes = path_utils.paths_to_lines(
+      path_offsets=page_arrays.path_offsets,
+      segment_types=page_arrays.segment_types,
+      segment_offsets=page_arrays.segment_offsets,
+      points=page_arrays.points,
+    )
+    line_counts = np.bincount(line_elem_idxes, minlength=len(self))
+    line_offsets = np.concatenate([[0], np.cumsum(line_counts)])
+    self.path_lines = (lines, line_offsets)
+    return self.path_lines
+
+  def get_zeroed_path_lines(self) -> typing.Tuple[np.ndarray, np.ndarray]:
+    '''
+    get_path_lines with each elem's lines moved so their min x and min y is 0
+    '''
+    lines, line_offsets = self.get_path_lines()
+    if self.zeroed_path_lines is not None:
+      return self.zeroed_path_lines, line_offsets
+    zeroed_lines = lines.copy()
+    has_lines = np.flatnonzero(np.diff(line_offsets) > 0)
+    if has_lines.shape[0] > 0:
+      starts = line_offsets[has_lines]
+      xmin = np.minimum.reduceat(np.minimum(lines[:, 0], lines[:, 2]), starts)
+      ymin = np.minimum.reduceat(np.minimum(lines[:, 1], lines[:, 3]), starts)
+      line_counts = np.diff(line_offsets)[has_lines]
+      zeroed_lines[:, [0, 2]] -= np.repeat(xmin, line_counts)[:, None]
+      zeroed_lines[:, [1, 3]] -= np.repeat(ymin, line_counts)[:, None]
+    self.zeroed_path_lines = zeroed_lines
+    return self.zeroed_path_lines, line_offsets
+
+  def take(self, idxes: typing.List[int]) -> "PageArrays":
+    builder = PageArraysBuilder()
+    for idx in idxes:
+      builder.add_row(page_arrays=self, idx=idx)
+    return builder.build()
+
+  def to_columns(self) -> typing.Dict[str, np.ndarray]:
+    if self.text_overrides or self.path_overrides:
+      # Rebuild so the overrides are part of the buffers
+      return self.take(list(range(len(self)))).to_columns()
+    return {
+      "bbox": self.bbox,
+      "width": self.width,
+      "height": self.height,
+      "size": self.size,
+      "linewidth": self.linewidth,
+      "flags": self.flags,
+      "parent_idx": self.parent_idx,
+      "text_offsets": self.text_offsets,
+      "text_buffer": np.array(self.text_buffer),
+      "path_offsets": self.path_offsets,
+      "segment_types": self.segment_types,
+      "segment_offsets": self.segment_offsets,
+      "points": self.points,
+      "sparse": np.array(json.dumps({
+        "labels": self.labels,
+        "children_idxes": self.children_idxes,
+      })),
+    }
+
+  @staticmethod
+  def from_columns(columns: typing.Mapping[str, np.ndarray]) -> "PageArrays":
+    sparse = json.loads(str(columns["sparse"][()]))
+    return PageArrays(
+      bbox=columns["bbox"],
+      width=columns["width"],
+      height=columns["height"],
+      size=columns["size"],
+      linewidth=columns["linewidth"],
+      flags=columns["flags"],
+      parent_idx=columns["parent_idx"],
+      text_offsets=columns["text_offsets"],
+      text_buffer=str(columns["text_buffer"][()]),
+      path_offsets=columns["path_offsets"],
+      segment_types=columns["segment_types"],
+      segment_offsets=columns["segment_offsets"],
+      points=columns["points"],
+      labels={ int(key): val for key, val in sparse["labels"].items() },
+      children_idxes={ int(key): val for key, val in sparse["children_idxes"].items() },
+    )
+
+class PageArraysBuilder:
+  def __init__(self) -> None:
+    self.bbox: typing.List[typing.Tuple[float, float, float, float]] = []
+    self.width: typing.List[float] = []
+    self.height: typing.List[float] = []
+    self.size: typing.List[float] = []
+    self.linewidth: typing.List[float] = []
+    self.flags: typing.List[int] = []
+    self.parent_idx: typing.List[int] = []
+    self.text_offsets: typing.List[int] = [0]
+    self.text_parts: typing.List[str] = []
+    self.text_len = 0
+    self.path_offsets: typing.List[int] = [0]
+    self.segment_types: typing.List[int] = []
+    self.segment_offsets: typing.List[int] = [0]
+    self.points: typing.List[typing.Tuple[float, float]] = []
+    self.labels: typing.Dict[int, str] = {}
+    self.children_idxes: typing.Dict[int, typing.List[int]] = {}
+
+  def __len__(self) -> int:
+    return len(self.flags)
+
+  def add(
+    self,
+    bbox: typing.Sequence[float] = (0, 0, 0, 0),
+    width: float = 0,
+    height: float = 0,
+    label: typing.Union[None, str] = None,
+    text: typing.Union[None, str] = None,
+    size: typing.Union[None, float] = None,
+    original_path: typing.Any = None,
+    linewidth: typing.Union[None, float] = None,
+    is_container: bool = False,
+    is_annotation: bool = False,
+    is_line: bool = False,
+    is_rect: bool = False,
+    parent_idx: typing.Union[None, int] = None,
+    children_idxes: typing.Union[None, typing.List[int]] = None,
+    upright: bool = True,
+  ) -> int:
+    idx = len(self.flags)
+    x0, y0, x1, y1 = bbox
+    self.bbox.append((x0, y0, x1, y1))
+    self.width.append(width)
+    self.height.append(height)
+    self.size.append(np.nan if size is None else size)
+    self.linewidth.append(np.nan if linewidth is None else linewidth)
+    flags = 0
+    flags |= FLAG_IS_RECT if is_rect else 0
+    flags |= FLAG_IS_LINE if is_line else 0
+    flags |= FLAG_IS_CONTAINER if is_container else 0
+    flags |= FLAG_IS_ANNOTATION if is_annotation else 0
+    flags |= FLAG_UPRIGHT if upright else 0
+    if text is not None:
+      flags |= FLAG_HAS_TEXT
+      self.text_parts.append(text)
+      self.text_len += len(text)
+    self.text_offsets.append(self.text_len)
+    if original_path is not None:
+      flags |= FLAG_HAS_PATH
+      for segment in original_path:
+        self.segment_types.append(PATH_SEGMENT_TYPES.index(segment[0]))
+        for pt in segment[1:]:
+          self.points.append((pt[0], pt[1]))
+        self.segment_offsets.append(len(self.points))
+    self.path_offsets.append(len(self.segment_types))
+    self.flags.append(flags)
+    self.parent_idx.append(-1 if parent_idx is None else parent_idx)
+    if label is not None:
+      self.labels[idx] = label
+    if children_idxes:
+      self.children_idxes[idx] = list(children_idxes)
+    return idx
+
+  def add_elem(
+    self,
+    elem: pdfminer.layout.LTComponent,
+    parent_idx: typing.Union[None, int],
+    children_idxes: typing.Union[None, typing.List[int]] = None,
+  ) -> int:
+    text = None
+    size = None
+    upright = True
+    original_path = None
+    linewidth = None
+    if isinstance(elem, pdfminer.layout.LTCurve):
+      original_path = elem.original_path
+      linewidth = elem.linewidth
+    if isinstance(elem, pdfminer.layout.LTText):
+      text = elem.get_text()
+      if isinstance(elem, pdfminer.layout.LTChar):
+        size = elem.size
+        upright = elem.upright
+    return self.add(
+      bbox=elem.bbox,
+      width=elem.width,
+      height=elem.height,
+      text=text,
+      size=size,
+      original_path=original_path,
+      linewidth=linewidth,
+      is_container=isinstance(elem, pdfminer.layout.LTContainer),
+      is_annotation=isinstance(elem, pdfminer.layout.LTAnno),
+      is_line=isinstance(elem, pdfminer.layout.LTLine),
+      is_rect=isinstance(elem, pdfminer.layout.LTRect),
+      parent_idx=parent_idx,
+      children_idxes=children_idxes,
+      upright=upright,
+    )
+
+  def add_serialized(self, serialized_json: typing.Dict[str, typing.Any]) -> int:
+    kwargs = { key: serialized_json[key] for key in SERIALIZED_KEYS if key in serialized_json }
+    return self.add(**kwargs)
+
+  def add_row(self, page_arrays: PageArrays, idx: int) -> int:
+    size = page_arrays.size.item(idx)
+    linewidth = page_arrays.linewidth.item(idx)
+    parent_idx = page_arrays.parent_idx.item(idx)
+    return self.add(
+      bbox=page_arrays.bbox[idx].tolist(),
+      width=page_arrays.width.item(idx),
+      height=page_arrays.height.item(idx),
+      label=page_arrays.labels.get(idx),
+      text=page_arrays.get_text(idx),
+      size=None if np.isnan(size) else size,
+      original_path=page_arrays.get_path(idx),
+      linewidth=None if np.isnan(linewidth) else linewidth,
+      is_container=page_arrays.has_flag(idx, FLAG_IS_CONTAINER),
+      is_annotation=page_arrays.has_flag(idx, FLAG_IS_ANNOTATION),
+      is_line=page_arrays.has_flag(idx, FLAG_IS_LINE),
+      is_rect=page_arrays.has_flag(idx, FLAG_IS_RECT),
+      parent_idx=None if parent_idx < 0 else parent_idx,
+      children_idxes=page_arrays.children_idxes.get(idx),
+      upright=page_arrays.has_flag(idx, FLAG_UPRIGHT),
+    )
+
+  def build(self) -> PageArrays:
+    return PageArrays(
+      bbox=np.array(self.bbox, dtype=np.float64).reshape((-1, 4)),
+      width=np.array(self.width, dtype=np.float64),
+      height=np.array(self.height, dtype=np.float64),
+      size=np.array(self.size, dtype=np.float64),
+      linewidth=np.array(self.linewidth, dtype=np.float64),
+      flags=np.array(self.flags, dtype=np.uint8),
+      parent_idx=np.array(self.parent_idx, dtype=np.int64),
+      text_offsets=np.array(self.text_offsets, dtype=np.int64),
+      text_buffer="".join(self.text_parts),
+      path_offsets=np.array(self.path_offsets, dtype=np.int64),
+      segment_types=np.array(self.segment_types, dtype=np.uint8),
+      segment_offsets=np.array(self.segment_offsets, dtype=np.int64),
+      points=np.array(self.points, dtype=np.float64).reshape((-1, 2)),
+      labels=self.labels,
+      children_idxes=self.children_idxes,
+    )
+
+def get_page_arrays(wrappers: typing.List["LTJson"]) -> PageArrays:
+  '''
+  The PageArrays backing wrappers with row i being wrappers[i]
+  Shares the arrays when wrappers are the views of a whole page
+  '''
+  if len(wrappers) > 0:
+    page_arrays = wrappers[0].page_arrays
+    if len(page_arrays) == len(wrappers) and \
+      all([w.page_arrays is page_arrays and w.idx == idx for idx, w in enumerate(wrappers)]):
+      return page_arrays
+  builder = PageArraysBuilder()
+  for wrapper in wrappers:
+    builder.add_row(page_arrays=wrapper.page_arrays, idx=wrapper.idx)
+  return builder.build()
+
 class LTJson:
+  '''
+  A view into one row of a PageArrays. Constructing from a pdfminer elem or
+  serialized json creates a single row PageArrays
+  '''
+  __slots__ = ("page_arrays", "idx", "__path_lines", "__zeroed_path_lines", "__zeroed_bbox")
+
   def __init__(
     self,
     elem: typing.Union[pdfminer.layout.LTComponent, None] = None,
     parent_idx: typing.Union[int, None] = None,
     children_idxes: typing.List[int] = [],
     serialized_json: typing.Union[typing.Dict[str, typing.Any], None] = None,
+    page_arrays: typing.Union[PageArrays, None] = None,
+    idx: int = 0,
   ) -> None:
-    # Public serialized
-    self.bbox: typing.Tuple[float, float, float, float] = (0, 0, 0, 0)
-    self.width: float = 0
-    self.height: float = 0
-    self.label: typing.Union[str, None] = None # text of elements inside
-    self.text: typing.Union[str, None] = None # get_text()
-    self.size = None
-    self.original_path = None
-    self.linewidth = None
-    self.is_container = False
-    self.is_annotation = False
-    self.is_line = False
-    self.is_rect = False
-    self.parent_idx = None
-    self.children_idxes = []
-    self.upright = True
+    if page_arrays is None:
+      builder = PageArraysBuilder()
+      if serialized_json is not None:
+        builder.add_serialized(serialized_json=serialized_json)
+      elif elem is not None:
+        builder.add_elem(elem=elem, parent_idx=parent_idx, children_idxes=children_idxes)
+      else:
+        builder.add()
+      page_arrays = builder.build()
+      idx = 0
+    self.page_arrays = page_arrays
+    self.idx = idx
 
     # Prive unserialized
-    self.__path_lines = None
+    self.__path_lines: typing.Union[typing.List[path_utils.LinePointsType], None] = None
     self.__zeroed_path_lines: typing.Union[typing.List[path_utils.LinePointsType], None] = None
     self.__zeroed_bbox: typing.Union[BboxType, None] = None
 
-    if elem is not None:
-      self.bbox = elem.bbox
-      self.width = elem.width
-      self.height = elem.height
-      self.parent_idx = parent_idx
-      self.children_idxes = children_idxes
-      if isinstance(elem, pdfminer.layout.LTCurve):
-        if isinstance(elem, pdfminer.layout.LTRect):
-          self.is_rect = True
-        if isinstance(elem, pdfminer.layout.LTLine):
-          self.is_line = True
-        self.original_path = elem.original_path
-        self.linewidth = elem.linewidth
-      if isinstance(elem, pdfminer.layout.LTText):
-        self.text = elem.get_text()
-        if isinstance(elem, pdfminer.layout.LTChar):
-          self.size = elem.size
-          self.upright = elem.upright
-      if isinstance(elem, pdfminer.layout.LTContainer):
-        self.is_container = True
-      if isinstance(elem, pdfminer.layout.LTAnno):
-        self.is_annotation = True
-
-    if serialized_json is not None:
-      self.bbox = serialized_json["bbox"]
-      if "width" in serialized_json:
-        self.width = serialized_json["width"]
-      if "height" in serialized_json:
-        self.height = serialized_json["height"]
-      if "label" in serialized_json:
-        self.label = serialized_json["label"]
-      if "text" in serialized_json:
-        self.text = serialized_json["text"]
-      if "size" in serialized_json:
-        self.size = serialized_json["size"]
-      if "upright" in serialized_json:
-        self.upright = serialized_json["upright"]
-      if "original_path" in serialized_json:
-        self.original_path = serialized_json["original_path"]
-      if "linewidth" in serialized_json:
-        self.linewidth = serialized_json["linewidth"]
-      if "is_container" in serialized_json:
-        self.is_container = serialized_json["is_container"]
-      if "is_annotation" in serialized_json:
-       self.is_annotation = serialized_json["is_annotation"]
-      if "is_line" in serialized_json:
-        self.is_line = serialized_json["is_line"]
-      if "is_rect" in serialized_json:
-        self.is_rect = serialized_json["is_rect"]
-      if "parent_idx" in serialized_json:
-        self.parent_idx = serialized_json["parent_idx"]
-      if "children_idxes" in serialized_json:
-        self.children_idxes = serialized_json["children_idxes"]
+  def __reduce__(self):
+    # Only pickle this element's row rather than the whole page
+    return (LTJson, (None, None, [], None, self.page_arrays.take([self.idx]), 0))
+
+  @property
+  def bbox(self) -> BboxType:
+    x0, y0, x1, y1 = self.page_arrays.bbox[self.idx].tolist()
+    return (x0, y0, x1, y1)
+
+  @bbox.setter
+  def bbox(self, bbox: typing.Sequence[float]):
+    self.page_arrays.bbox[self.idx] = bbox
+    self.__zeroed_bbox = None
+
+  @property
+  def width(self) -> float:
+    return self.page_arrays.width.item(self.idx)
+
+  @width.setter
+  def width(self, width: float):
+    self.page_arrays.width[self.idx] = width
+
+  @property
+  def height(self) -> float:
+    return self.page_arrays.height.item(self.idx)
+
+  @height.setter
+  def height(self, height: float):
+    self.page_arrays.height[self.idx] = height
+
+  @property
+  def label(self) -> typing.Union[None, str]:
+    # text of elements inside
+    return self.page_arrays.labels.get(self.idx)
+
+  @label.setter
+  def label(self, label: typing.Union[None, str]):
+    if label is None:
+      self.page_arrays.labels.pop(self.idx, None)
+    else:
+      self.page_arrays.labels[self.idx] = label
+
+  @property
+  def text(self) -> typing.Union[None, str]:
+    # get_text()
+    return self.page_arrays.get_text(self.idx)
+
+  @text.setter
+  def text(self, text: typing.Union[None, str]):
+    self.page_arrays.text_overrides[self.idx] = text
+
+  @property
+  def size(self) -> typing.Union[None, float]:
+    size = self.page_arrays.size.item(self.idx)
+    return None if size != size else size
+
+  @size.setter
+  def size(self, size: typing.Union[None, float]):
+    self.page_arrays.size[self.idx] = np.nan if size is None else size
+
+  @property
+  def original_path(self) -> typing.Any:
+    return self.page_arrays.get_path(self.idx)
+
+  @original_path.setter
+  def original_path(self, original_path: typing.Any):
+    self.page_arrays.path_overrides[self.idx] = original_path
+    self.page_arrays.path_lines = None
+    self.page_arrays.zeroed_path_lines = None
+    self.__path_lines = None
+    self.__zeroed_path_lines = None
+
+  @property
+  def linewidth(self) -> typing.Union[None, float]:
+    linewidth = self.page_arrays.linewidth.item(self.idx)
+    return None if linewidth != linewidth else linewidth
+
+  @linewidth.setter
+  def linewidth(self, linewidth: typing.Union[None, float]):
+    self.page_arrays.linewidth[self.idx] = np.nan if linewidth is None else linewidth
+
+  @property
+  def is_container(self) -> bool:
+    return self.page_arrays.has_flag(self.idx, FLAG_IS_CONTAINER)
+
+  @is_container.setter
+  def is_container(self, value: bool):
+    self.page_arrays.set_flag(self.idx, FLAG_IS_CONTAINER, value)
+
+  @property
+  def is_annotation(self) -> bool:
+    return self.page_arrays.has_flag(self.idx, FLAG_IS_ANNOTATION)
+
+  @is_annotation.setter
+  def is_annotation(self, value: bool):
+    self.page_arrays.set_flag(self.idx, FLAG_IS_ANNOTATION, value)
+
+  @property
+  def is_line(self) -> bool:
+    return self.page_arrays.has_flag(self.idx, FLAG_IS_LINE)
+
+  @is_line.setter
+  def is_line(self, value: bool):
+    self.page_arrays.set_flag(self.idx, FLAG_IS_LINE, value)
+
+  @property
+  def is_rect(self) -> bool:
+    return self.page_arrays.has_flag(self.idx, FLAG_IS_RECT)
+
+  @is_rect.setter
+  def is_rect(self, value: bool):
+    self.page_arrays.set_flag(self.idx, FLAG_IS_RECT, value)
+
+  @property
+  def upright(self) -> bool:
+    return self.page_arrays.has_flag(self.idx, FLAG_UPRIGHT)
+
+  @upright.setter
+  def upright(self, value: bool):
+    self.page_arrays.set_flag(self.idx, FLAG_UPRIGHT, value)
+
+  @property
+  def parent_idx(self) -> typing.Union[None, int]:
+    parent_idx = self.page_arrays.parent_idx.item(self.idx)
+    return None if parent_idx < 0 else parent_idx
+
+  @parent_idx.setter
+  def parent_idx(self, parent_idx: typing.Union[None, int]):
+    self.page_arrays.parent_idx[self.idx] = -1 if parent_idx is None else parent_idx
+
+  @property
+  def children_idxes(self) -> typing.List[int]:
+    return self.page_arrays.children_idxes.get(self.idx, [])
+
+  @children_idxes.setter
+  def children_idxes(self, children_idxes: typing.List[int]):
+    self.page_arrays.children_idxes[self.idx] = children_idxes
 
   def __eq__(self, other: object) -> bool:
     if not debug_utils.is_debug:
@@ -101,14 +561,14 @@ class LTJson:
       return False
     if not isinstance(other, LTJson):
       return False
-    for key in self.__dict__.keys():
+    for key in SERIALIZED_KEYS:
       if key == "bbox":
         if not self.__eq_bbox(other):
           return False
       elif key == "original_path":
         if not self.__eq_original_path(other):
           return False
-      elif self.__dict__[key] != other.__dict__[key]:
+      elif getattr(self, key) != getattr(other, key):
         return False
     return True
 
@@ -161,24 +621,28 @@ class LTJson:
     if self.__path_lines is not None:
       return self.__path_lines
 
-    if self.original_path is not None:
-      self.__path_lines = path_utils.path_to_lines(path=self.original_path)
-    if self.__path_lines is None:
-      self.__path_lines = []
-
+    lines, line_offsets = self.page_arrays.get_path_lines()
+    self.__path_lines = [
+      (x0, y0, x1, y1) for x0, y0, x1, y1 in
+      lines[line_offsets[self.idx]:line_offsets[self.idx+1]].tolist()
+    ]
     return self.__path_lines
 
   def get_zeroed_path_lines(self):
     if self.__zeroed_path_lines is not None:
       return self.__zeroed_path_lines
 
-    self.__zeroed_path_lines = []
-    path_lines = self.get_path_lines()
-    if len(path_lines) == 0:
-      return self.__zeroed_path_lines
-    self.__zeroed_path_lines = path_utils.get_zeroed_path_lines(path_lines=path_lines)
+    lines, line_offsets = self.page_arrays.get_zeroed_path_lines()
+    self.__zeroed_path_lines = [
+      (x0, y0, x1, y1) for x0, y0, x1, y1 in
+      lines[line_offsets[self.idx]:line_offsets[self.idx+1]].tolist()
+    ]
     return self.__zeroed_path_lines
 
+  def get_zeroed_path_lines_array(self) -> np.ndarray:
+    lines, line_offsets = self.page_arrays.get_zeroed_path_lines()
+    return lines[line_offsets[self.idx]:line_offsets[self.idx+1]]
+
   def get_zeroed_bbox(self):
     if self.__zeroed_bbox is not None:
       return self.__zeroed_bbox
@@ -190,9 +654,8 @@ class LTJson:
 
   def as_dict(self):
     out: typing.Dict[str, typing.Any] = dict()
-    for key in self.__dict__.keys():
-      if not key.startswith("_{0}__".format(self.__class__.__name__)):
-        out[key] = self.__dict__[key]
+    for key in SERIALIZED_KEYS:
+      out[key] = getattr(self, key)
     return out
 
 class LTJsonEncoder(json.JSONEncoder):
@@ -233,3 +696,10 @@ class PdfSummaryJson(typing.TypedDict):
   houseName: str
   architectName: str
   pageNames: typing.Dict[int, str]
+
+class PdfResultsDelta(typing.TypedDict):
+  page: int
+  # Schedules found on page
+  schedules: PdfSummaryJson
+  # Elems found on page
+  elems: typing.List[PdfElem]
@@ -18,7 +18,7 @@ from . import pdfelemtransforms
 from . import pdfextracter
 from . import pdfindexer
 from . import pdftkdrawer
-from . import votesearch
+from . import votesearch, symbol_library
 from . import dataprovider, pdfprocessor
 from .ltjson import LTJson, LTJsonEncoder, BboxType, ScheduleTypes
 
@@ -198,7 +198,7 @@ def d8():
       "row": -1
     },
     regex="^(?P<label>{0})[\\n ]?$".format("D\\d\\d?"),
-    shape_matches=[votesearch.global_symbols["window_label"][0:1]],
+    shape_matches=[symbol_library.get_default_library()["window_label"][0:1]],
   )
   rule.process_page(page_number=page_number, elems=elems, indexer=indexer)
   results = rule.get_results()
@@ -0,0 +1,254 @@
+import abc
+import datetime
+import hashlib
+import io
+import os
+import typing
+
+import numpy as np
+
+from .ltjson import LTJson, PageArrays, get_page_arrays
+
+# Parsed pages keyed by (sha256 of the pdf bytes, page number) so re-processing
+# the same upload skips pdfminer layout extraction which is the dominant cost
+# Pages are stored as npz of the PageArrays columns
+
+# Part of the key so pages encoded by an older layout are never decoded. Bump it when
+# encode_page or the PageArrays columns change. Old pages are evicted as they are never read
+PAGE_FORMAT_VERSION = 1
+
+CachedPage = typing.Tuple[
+  typing.List[LTJson], # elems from get_underlying_parent_links
+  float, # width
+  float, # height
+]
+
+def get_pdf_hash(pdfdata: bytes) -> str:
+  return hashlib.sha256(pdfdata).hexdigest()
+
+def get_page_key(pdf_hash: str, page_number: int) -> str:
+  return "{0}-{1}.v{2}.page".format(pdf_hash, page_number, PAGE_FORMAT_VERSION)
+
+def encode_page(page: CachedPage) -> bytes:
+  elems, width, height = page
+  columns = get_page_arrays(wrappers=elems).to_columns()
+  out = io.BytesIO()
+  np.savez_compressed(out, page_width=np.array(width), page_height=np.array(height), **columns)
+  return out.getvalue()
+
+def decode_page(data: bytes) -> CachedPage:
+  with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+    columns = { key: npz[key] for key in npz.files }
+  elems = PageArrays.from_columns(columns=columns).views()
+  return elems, float(columns["page_width"]), float(columns["page_height"])
+
+class PageCache(metaclass=abc.ABCMeta):
+  @abc.abstractmethod
+  def contains(self, pdf_hash: str, page_number: int) -> bool:
+    pass
+
+  @abc.abstractmethod
+  def get(self, pdf_hash: str, page_number: int) -> typing.Union[None, CachedPage]:
+    pass
+
+  @abc.abstractmethod
+  def put(self, pdf_hash: str, page_number: int, page: CachedPage):
+    pass
+
+class NullPageCache(PageCache):
+  def contains(self, pdf_hash: str, page_number: int) -> bool:
+    return False
+
+  def get(self, pdf_hash: str, page_number: int) -> typing.Union[None, CachedPage]:
+    return None
+
+  def put(self, pdf_hash: str, page_number: int, page: CachedPage):
+    pass
+
+class FilePageCache(PageCache):
+  '''
+  One file per page in directory. Reading a page touches its mtime so that
+  evicting the oldest mtime first once over max_bytes is least recently used
+  '''
+  def __init__(self, directory: str, max_bytes: int) -> None:
+    self.directory = directory
+    self.max_bytes = max_bytes
+    os.makedirs(self.directory, exist_ok=True)
+
+  def contains(self, pdf_hash: str, page_number: int) -> bool:
+    return os.path.exists(self.__get_path(pdf_hash=pdf_hash, page_number=page_number))
+
+  def get(self, pdf_hash: str, page_number: int) -> typing.Union[None, CachedPage]:
+    path = self.__get_path(pdf_hash=pdf_hash, page_number=page_number)
+    try:
+      with open(path, "rb") as f:
+        data = f.read()
+      os.utime(path)
+      return decode_page(data=data)
+    except Exception as e:
+      print("Failed to read page cache:", path, e)
+    return None
+
+  def put(self, pdf_hash: str, page_number: int, page: CachedPage):
+    path = self.__get_path(pdf_hash=pdf_hash, page_number=page_number)
+    # Worker processes may write at the same time so write then rename
+    tmp_path = "{0}.{1}.tmp".format(path, os.getpid())
+    try:
+      with open(tmp_path, "wb") as f:
+        f.write(encode_page(page=page))
+      os.replace(tmp_path, path)
+    except Exception as e:
+      print("Failed to write page cache:", path, e)
+      return
+    self.__evict()
+
+  def __get_path(self, pdf_hash: str, page_number: int):
+    return os.path.join(self.directory, get_page_key(pdf_hash=pdf_hash, page_number=page_number))
+
+  def __evict(self):
+    entries: typing.List[typing.Tuple[float, int, str]] = []
+    total_bytes = 0
+    for entry in os.scandir(self.directory):
+      if not entry.name.endswith(".page"):
+        continue
+      try:
+        stat = entry.stat()
+      except FileNotFoundError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, entry.path))
+      total_bytes += stat.st_size
+    entries.sort()
+    for _, size, path in entries:
+      if total_bytes <= self.max_bytes:
+        break
+      try:
+        os.remove(path)
+      except FileNotFoundError:
+        pass
+      total_bytes -= size
+
+# Pages read within this long keep their LastModified (1 day)
+S3_REFRESH_AFTER_S = 24 * 60 * 60
+# Fraction of max_bytes left after evicting
+S3_EVICT_TARGET_FRACTION = 0.9
+
+class S3PageCache(PageCache):
+  '''
+  One object per page under bucket/prefix. Reading a page last modified more than
+  refresh_after_s ago copies the object onto itself to refresh LastModified so evicting
+  the oldest first is close to least recently used. A lifecycle rule expiring the prefix
+  can be used instead with refresh_after_s < 0
+  The prefix is listed once to get its size, then puts add to the running size
+  and the prefix is only listed again to evict once it is over max_bytes
+  '''
+  def __init__(
+    self,
+    bucket: str,
+    prefix: str,
+    max_bytes: int,
+    refresh_after_s: float = S3_REFRESH_AFTER_S,
+  ) -> None:
+    self.bucket = bucket
+    self.prefix = prefix
+    self.max_bytes = max_bytes
+    self.refresh_after_s = refresh_after_s
+    self.client: typing.Any = None
+    self.client_pid: typing.Union[None, int] = None
+    # None until the prefix has been listed. Other invocations write to the same
+    # prefix so this is a lower bound that is corrected on each eviction
+    self.total_bytes: typing.Union[None, int] = None
+
+  def contains(self, pdf_hash: str, page_number: int) -> bool:
+    try:
+      self.__get_client().head_object(Bucket=self.bucket, Key=self.__get_key(pdf_hash, page_number))
+      return True
+    except Exception: # pylint:disable=broad-except
+      return False
+
+  def get(self, pdf_hash: str, page_number: int) -> typing.Union[None, CachedPage]:
+    key = self.__get_key(pdf_hash, page_number)
+    try:
+      client = self.__get_client()
+      response = client.get_object(Bucket=self.bucket, Key=key)
+      data = response["Body"].read()
+      age_s = (datetime.datetime.now(datetime.timezone.utc) - response["LastModified"]).total_seconds()
+      if self.refresh_after_s >= 0 and age_s > self.refresh_after_s:
+        client.copy_object(
+          Bucket=self.bucket,
+          Key=key,
+          CopySource={ "Bucket": self.bucket, "Key": key },
+          MetadataDirective="REPLACE",
+        )
+      return decode_page(data=data)
+    except Exception as e:
+      print("Failed to read page cache:", key, e)
+    return None
+
+  def put(self, pdf_hash: str, page_number: int, page: CachedPage):
+    key = self.__get_key(pdf_hash, page_number)
+    try:
+      data = encode_page(page=page)
+      self.__get_client().put_object(Bucket=self.bucket, Key=key, Body=data)
+    except Exception as e:
+      print("Failed to write page cache:", key, e)
+      return
+    if self.total_bytes is None:
+      self.__evict()
+    else:
+      self.total_bytes += len(data)
+      if self.total_bytes > self.max_bytes:
+        self.__evict()
+
+  def __get_key(self, pdf_hash: str, page_number: int):
+    return self.prefix + get_page_key(pdf_hash=pdf_hash, page_number=page_number)
+
+  def __get_client(self):
+    # boto3 clients can't be shared across forked worker processes
+    if self.client is None or self.client_pid != os.getpid():
+      import boto3 # pylint:disable=import-outside-toplevel
+      self.client = boto3.client("s3")
+      self.client_pid = os.getpid()
+    return self.client
+
+  def __evict(self):
+    try:
+      client = self.__get_client()
+      entries: typing.List[typing.Tuple[typing.Any, int, str]] = []
+      total_bytes = 0
+      paginator = client.get_paginator("list_objects_v2")
+      for response in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+        for obj in response.get("Contents", []):
+          entries.append((obj["LastModified"], obj["Size"], obj["Key"]))
+          total_bytes += obj["Size"]
+      if total_bytes > self.max_bytes:
+        # Evict below max_bytes so the next puts don't list the prefix again
+        entries.sort()
+        for _, size, key in entries:
+          if total_bytes <= self.max_bytes * S3_EVICT_TARGET_FRACTION:
+            break
+          client.delete_object(Bucket=self.bucket, Key=key)
+          total_bytes -= size
+      self.total_bytes = total_bytes
+    except Exception as e:
+      print("Failed to evict page cache:", e)
+
+def make_page_cache() -> PageCache:
+  '''
+  PAGE_CACHE_DIR=/tmp/pagecache or PAGE_CACHE_S3=s3://bucket/prefix/
+  PAGE_CACHE_MAX_BYTES defaults to 512MB
+  PAGE_CACHE_S3_REFRESH_AFTER_S defaults to S3_REFRESH_AFTER_S. -1 leaves expiry to a lifecycle rule
+  '''
+  max_bytes = int(os.environ.get("PAGE_CACHE_MAX_BYTES") or 512 * 1024 * 1024)
+  cache_dir = os.environ.get("PAGE_CACHE_DIR")
+  if cache_dir:
+    return FilePageCache(directory=cache_dir, max_bytes=max_bytes)
+  cache_s3 = os.environ.get("PAGE_CACHE_S3")
+  if cache_s3 and cache_s3.startswith("s3://"):
+    bucket, _, prefix = cache_s3[len("s3://"):].partition("/")
+    return S3PageCache(
+      bucket=bucket,
+      prefix=prefix,
+      max_bytes=max_bytes,
+      refresh_after_s=float(os.environ.get("PAGE_CACHE_S3_REFRESH_AFTER_S") or S3_REFRESH_AFTER_S),
+    )
+  return NullPageCache()
@@ -0,0 +1,103 @@
+import enum
+import typing
+
+import numpy as np
+
+from . import pdfindexer, pdfregionclassifier
+from .ltjson import ScheduleTypes, get_page_arrays
+
+# Tags a page from the sheet title in its title block so item rules only run on pages
+# that can have their items (ex: lighting on lighting pages)
+# A page gets every tag whose keywords are in its sheet title and the union of their schedules
+# A page with no tags or only SCHEDULE_SHEET is unknown and every rule runs on it
+
+class PageType(enum.Enum):
+  SCHEDULE_SHEET = 1
+  ELECTRICAL_PLAN = 2
+  CONSTRUCTION_PLAN = 3
+  ELEVATION = 4
+
+# A title block text gets every page type with one of its keywords
+# so "FLOOR PLAN & REFLECTED CEILING PLAN" is both a construction and an electrical plan
+PAGE_TYPE_KEYWORDS: typing.List[typing.Tuple[PageType, typing.List[str]]] = [
+  (PageType.ELECTRICAL_PLAN, ["electrical", "lighting plan", "power plan", "reflected ceiling"]),
+  (PageType.ELEVATION, ["elevation"]),
+  (PageType.CONSTRUCTION_PLAN, ["floor plan", "construction plan", "demolition plan"]),
+  # Plural so a schedule's own title (ex: DOOR SCHEDULE) near the bottom doesn't tag the page
+  (PageType.SCHEDULE_SHEET, ["schedules"]),
+]
+
+# Schedules whose items are drawn on each type of page
+PAGE_TYPE_SCHEDULES: typing.Dict[PageType, typing.Set[ScheduleTypes]] = {
+  PageType.SCHEDULE_SHEET: set(),
+  PageType.ELECTRICAL_PLAN: set([ScheduleTypes.LIGHTING]),
+  PageType.CONSTRUCTION_PLAN: set([ScheduleTypes.DOORS, ScheduleTypes.WINDOWS]),
+  PageType.ELEVATION: set([ScheduleTypes.DOORS, ScheduleTypes.WINDOWS]),
+}
+
+# x0, y0, x1, y1 as fractions of the page with y up. The right and bottom strips
+TITLE_BLOCK_REGIONS: typing.List[typing.Tuple[float, float, float, float]] = [
+  (0.8, 0., 1., 1.),
+  (0., 0., 1., 0.1),
+]
+# Fraction of a text's area that has to be in the title block
+MIN_TITLE_BLOCK_OVERLAP = 0.5
+# The sheet title is the tallest title block text. Notes and credits are smaller
+# Lines of a multi line title are within this fraction of the tallest height
+SHEET_TITLE_HEIGHT_RATIO = 0.9
+
+def get_sheet_title_texts(
+  text_index: pdfindexer.TextIndex,
+  page_width: float,
+  page_height: float,
+) -> typing.List[str]:
+  '''
+  Normalized texts mostly inside TITLE_BLOCK_REGIONS that are as tall as the sheet title
+  '''
+  if len(text_index.elem_idxes) == 0:
+    return []
+  classifier = pdfregionclassifier.PdfRegionClassifier()
+  for x0, y0, x1, y1 in TITLE_BLOCK_REGIONS:
+    classifier.classify_region(
+      bbox=(x0 * page_width, y0 * page_height, x1 * page_width, y1 * page_height),
+      region=pdfregionclassifier.PdfRegion.TITLE_BLOCK,
+      score=1.,
+    )
+  page_arrays = get_page_arrays(wrappers=text_index.wrappers)
+  text_elem_idxes = np.array(text_index.elem_idxes, dtype=np.int64)
+  bboxes = page_arrays.bbox[text_elem_idxes]
+  scores, _ = classifier.get_classification_scores(bboxes=bboxes)
+  title_block_col = pdfregionclassifier.REGION_COLUMNS[pdfregionclassifier.PdfRegion.TITLE_BLOCK.value]
+  areas = np.abs((bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1]))
+  # Regions overlap in the corner so the overlap can be above 1
+  overlaps = scores[:, title_block_col] / np.maximum(areas, 1e-6)
+  title_block_idxes = np.flatnonzero(overlaps >= MIN_TITLE_BLOCK_OVERLAP)
+  if len(title_block_idxes) == 0:
+    return []
+  heights = np.abs(bboxes[title_block_idxes, 3] - bboxes[title_block_idxes, 1])
+  title_idxes = title_block_idxes[heights >= heights.max() * SHEET_TITLE_HEIGHT_RATIO]
+  return [text_index.normalized_texts[idx] for idx in title_idxes.tolist()]
+
+def classify_page(
+  text_index: pdfindexer.TextIndex,
+  page_width: float,
+  page_height: float,
+) -> typing.Set[PageType]:
+  page_types: typing.Set[PageType] = set()
+  for text in get_sheet_title_texts(text_index=text_index, page_width=page_width, page_height=page_height):
+    for page_type, keywords in PAGE_TYPE_KEYWORDS:
+      if any([keyword in text for keyword in keywords]):
+        page_types.add(page_type)
+  return page_types
+
+def get_page_schedule_types(page_types: typing.Set[PageType]) -> typing.Union[None, typing.Set[ScheduleTypes]]:
+  '''
+  Schedules whose items can be on the page or None if the page is unknown
+  '''
+  # A schedule sheet can still have plans or details on it
+  if len(page_types - set([PageType.SCHEDULE_SHEET])) == 0:
+    return None
+  schedule_types: typing.Set[ScheduleTypes] = set()
+  for page_type in page_types:
+    schedule_types.update(PAGE_TYPE_SCHEDULES[page_type])
+  return schedule_types
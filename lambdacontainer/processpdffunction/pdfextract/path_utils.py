@@ -2,6 +2,7 @@
 import math
 import typing
 
+import numpy as np
 import pdfminer, pdfminer.utils
 
 from . import compiled_utils
@@ -20,6 +21,14 @@ PointType = typing.Tuple[float, float]
 Bbox = typing.Tuple[float, float, float, float]
 MAX_SLOPE = 1000.
 
+# Path segment type codes are indexes into this string
+PATH_SEGMENT_TYPES = "mlcvyh"
+SEGMENT_MOVE = PATH_SEGMENT_TYPES.index("m")
+SEGMENT_LINE = PATH_SEGMENT_TYPES.index("l")
+SEGMENT_CURVE = PATH_SEGMENT_TYPES.index("c")
+SEGMENT_CLOSE = PATH_SEGMENT_TYPES.index("h")
+BEZIER_NUM_LINES = 10
+
 def get_bezier_point(t: float, pts: BezierPoints):
   mults = [
     (1 - t) ** 3,
@@ -48,6 +57,99 @@ def bezier_to_lines(pts: BezierPoints):
     x_prev, y_prev = x, y
   return lines, x_prev, y_prev
 
+def get_bernstein_weights(num_lines: int) -> np.ndarray:
+  '''
+  (num_lines+1, 4) weights so that weights @ bezier_pts are the points of bezier_to_lines
+  '''
+  t = np.arange(num_lines + 1, dtype=np.float64) / num_lines
+  return np.stack([
+    (1 - t) ** 3,
+    3 * t * ((1 - t) ** 2),
+    3 * (t ** 2) * (1 - t),
+    t ** 3,
+  ], axis=1)
+
+BEZIER_WEIGHTS = get_bernstein_weights(num_lines=BEZIER_NUM_LINES)
+
+def paths_to_lines(
+  path_offsets: np.ndarray,
+  segment_types: np.ndarray,
+  segment_offsets: np.ndarray,
+  points: np.ndarray,
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+  '''
+  path_to_lines for every path of a page at once
+  path_offsets: (N+1,) into segment_types, segment_offsets: (S+1,) into points (P,2)
+  Returns lines (M,4) in the same order as path_to_lines and the (M,) elem idx of each line
+  '''
+  num_elems = path_offsets.shape[0] - 1
+  num_segments = segment_types.shape[0]
+  if num_segments == 0:
+    return np.zeros((0, 4), dtype=np.float64), np.zeros((0,), dtype=np.int64)
+
+  segment_elem_idxes = np.repeat(np.arange(num_elems), np.diff(path_offsets))
+  segment_idxes = np.arange(num_segments)
+  elem_first_segment = path_offsets[:-1][segment_elem_idxes]
+  segment_end_points = segment_offsets[1:] - 1
+  # Index of (0, 0) for paths that have not moved yet
+  origin_idx = points.shape[0]
+  points_with_origin = np.concatenate([points, np.zeros((1, 2))], axis=0)
+
+  is_move = segment_types == SEGMENT_MOVE
+  is_line = segment_types == SEGMENT_LINE
+  is_curve = segment_types == SEGMENT_CURVE
+  is_close = segment_types == SEGMENT_CLOSE
+  for segment_idx in np.flatnonzero(~(is_move | is_line | is_curve | is_close)).tolist():
+    print("Unhandled path point:", PATH_SEGMENT_TYPES[segment_types[segment_idx]])
+
+  # Current point before each segment is the end of the previous m, l or c in the same path
+  last_moved = np.maximum.accumulate(np.where(is_move | is_line | is_curve, segment_idxes, -1))
+  prev_moved = np.concatenate([[-1], last_moved[:-1]])
+  cursor = points_with_origin[
+    np.where(prev_moved >= elem_first_segment, segment_end_points[prev_moved], origin_idx)
+  ]
+  last_start = np.maximum.accumulate(np.where(is_move, segment_idxes, -1))
+  start = points_with_origin[
+    np.where(last_start >= elem_first_segment, segment_end_points[last_start], origin_idx)
+  ]
+
+  line_counts = np.where(is_line | is_close, 1, 0) + np.where(is_curve, BEZIER_NUM_LINES, 0)
+  line_offsets = np.concatenate([[0], np.cumsum(line_counts)])
+  lines = np.zeros((line_offsets[-1], 4), dtype=np.float64)
+
+  line_from = cursor[is_line]
+  line_to = points[segment_end_points[is_line]]
+  swap = (line_to[:, 0] < line_from[:, 0])[:, None]
+  lines[line_offsets[:-1][is_line]] = np.where(
+    swap,
+    np.concatenate([line_to, line_from], axis=1),
+    np.concatenate([line_from, line_to], axis=1),
+  )
+
+  close_from = cursor[is_close]
+  close_to = start[is_close]
+  swap = (close_to[:, 0] < close_from[:, 0])[:, None]
+  lines[line_offsets[:-1][is_close]] = np.where(
+    swap,
+    np.concatenate([close_to, close_from], axis=1),
+    np.concatenate([close_from, close_to], axis=1),
+  )
+
+  curve_first_points = segment_offsets[:-1][is_curve]
+  bezier_pts = np.stack([
+    cursor[is_curve],
+    points[curve_first_points],
+    points[curve_first_points + 1],
+    points[curve_first_points + 2],
+  ], axis=1)
+  curve_points = BEZIER_WEIGHTS @ bezier_pts
+  curve_lines = np.concatenate([curve_points[:, :-1], curve_points[:, 1:]], axis=2)
+  curve_line_idxes = line_offsets[:-1][is_curve][:, None] + np.arange(BEZIER_NUM_LINES)
+  lines[curve_line_idxes] = curve_lines
+
+  line_elem_idxes = np.repeat(segment_elem_idxes, line_counts)
+  return lines, line_elem_idxes
+
 def path_to_lines(path: typing.List[pdfminer.utils.PathSegment]):
   lines: typing.List[LinePointsType] = []
   x, y = 0, 0
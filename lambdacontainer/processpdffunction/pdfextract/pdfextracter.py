@@ -1,9 +1,10 @@
 
+import bisect
 import collections
 import typing
 import re
 
-import rtree
+import numpy as np
 
 from . import pdfindexer, pdfelemtransforms
 from .ltjson import LTJson, BboxType
@@ -107,6 +108,7 @@ def remove_duplicate_bbox_text(items: typing.List[LTJson]):
     return (x1-x0) * (y1-y0)
   items.sort(key=lambda x: item_size(x), reverse=True) # pylint:disable=unnecessary-lambda
 
+  import rtree # pylint:disable=import-outside-toplevel
   bbox_indexer = rtree.index.Index()
   out: typing.List[LTJson] = []
   idx = 0
@@ -153,22 +155,29 @@ def vertical_aligns_others(elem: LTJson, others: typing.List[LTJson]) -> typing.
   return None
 
 def get_line_splits(elems: typing.List[LTJson]) -> typing.List[float]:
-  cur_tops: typing.List[LTJson] = []
-  for consider in elems:
-    vertical_collision_idx = vertical_aligns_others(elem=consider, others=cur_tops)
-    if vertical_collision_idx is not None:
-      vertical_collision = cur_tops[vertical_collision_idx]
-      if vertical_collision.bbox[3] < consider.bbox[3]:
-        cur_tops[vertical_collision_idx] = consider
+  '''
+  Tops of the text lines bottom up. Elems whose vertical extents overlap are on one line
+  Sweeps the extents sorted by bottom merging each into the current line while it overlaps
+  '''
+  if len(elems) == 0:
+    return []
+  extents = sorted([(elem.bbox[1], elem.bbox[3]) for elem in elems])
+  line_tops: typing.List[float] = []
+  _, cur_top = extents[0]
+  for bottom, top in extents[1:]:
+    if bottom <= cur_top:
+      cur_top = max(cur_top, top)
     else:
-      cur_tops.append(consider)
-  return [top.bbox[3] for top in cur_tops]
+      line_tops.append(cur_top)
+      cur_top = top
+  line_tops.append(cur_top)
+  return line_tops
 
 def join_line_split(elems: typing.List[LTJson]) -> str:
-  out = ""
+  parts: typing.List[str] = []
   has_no_text = True
   if len(elems) > 0 and elems[0].text is not None:
-    out += elems[0].text
+    parts.append(elems[0].text)
     has_no_text = False
   for idx in range(1, len(elems)):
     last_elem = elems[idx-1]
@@ -176,32 +185,30 @@ def join_line_split(elems: typing.List[LTJson]) -> str:
     elem_width = max(elem.bbox[2]-elem.bbox[0], last_elem.bbox[2]-last_elem.bbox[0])
     x_space = elem.bbox[0] - last_elem.bbox[2]
     if x_space > 0.5 * elem_width:
-      out += ""
+      parts.append("")
     if elem.text is None:
       # TODO: other kinds of shapes
-      out += "/"
+      parts.append("/")
     else:
-      out += elem.text
+      parts.append(elem.text)
       has_no_text = False
   if has_no_text:
     return ""
-  return out
+  return "".join(parts)
 
 def join_text(elems: typing.List[LTJson]) -> str:
   text_line_tops = get_line_splits(elems=elems)
-  text_line_tops.sort()
   text_lines: typing.List[typing.List[LTJson]] = [[] for _ in range(len(text_line_tops))]
   for elem in elems:
-    for text_line_idx in range(len(text_lines)):
-      if elem.bbox[3] <= text_line_tops[text_line_idx]:
-        text_lines[text_line_idx].append(elem)
-        break
+    # First line whose top is at or above the elem's top
+    text_line_idx = bisect.bisect_left(text_line_tops, elem.bbox[3])
+    if text_line_idx < len(text_lines):
+      text_lines[text_line_idx].append(elem)
 
   for text_line in text_lines:
     text_line.sort(key=lambda e:e.bbox[0]) # left right
-  text_lines = [t for t in text_lines if len(t) > 0]
-  text_lines.sort(key=lambda line_elems: line_elems[0].bbox[3], reverse=True) # top down
-  text = " ".join([join_line_split(text_line) for text_line in text_lines])
+  # Lines don't overlap so bottom up reversed is top down
+  text = " ".join([join_line_split(text_line) for text_line in reversed(text_lines) if len(text_line) > 0])
   return text
 
 def extract_row(
@@ -210,45 +217,103 @@ def extract_row(
   vertical_dividers: typing.List[LTJson],
   padding: float
 ):
-  bbox = (
-    bbox[0] + padding,
-    bbox[1] + padding,
-    bbox[2] - padding,
-    bbox[3] - padding,
-  )
-  elems_in_row = [
-    e for e in table_elems if \
-      pdfelemtransforms.box_contains(outer=bbox, inner=e.bbox) and not e.is_container
-  ]
-  elems_in_row.sort(key=lambda e: e.bbox[2]) # left to right by their right side
-  vertical_divider_bboxes = [ (bbox[0], bbox[1], bbox[0], bbox[3]) ] # left/begin
-  vertical_divider_bboxes.extend([ v.bbox for v in vertical_dividers ]) # middle
-  vertical_divider_bboxes.append( (bbox[2],bbox[1],bbox[2],bbox[3]) ) # right/end
-  vertical_divider_bboxes.sort(key=lambda v: v[0]) # left to right
-  row: typing.List[ExtractedRowElem] = []
-  # If multicolumn, join MATERIAL INT = column 0, MATERIAL EXT = column 1
-  elem_idx = 0
-  for divider_idx in range(1, len(vertical_divider_bboxes)):
-    left_divider = vertical_divider_bboxes[divider_idx - 1]
-    right_divider = vertical_divider_bboxes[divider_idx]
-    elems_in_this_box: typing.List[LTJson] = []
-    while elem_idx < len(elems_in_row) and \
-      elems_in_row[elem_idx].bbox[2] < right_divider[0]:
+  return extract_rows(
+    table_elems=table_elems,
+    row_bboxes=[bbox],
+    vertical_dividers=vertical_dividers,
+    padding=padding,
+  )[0]
 
-      add_elem = elems_in_row[elem_idx]
-      elems_in_this_box.append(add_elem)
-      elem_idx += 1
+def get_cell_dividers(
+  divider_bboxes: typing.List[BboxType],
+  divider_x0s: typing.List[float],
+  bbox: BboxType,
+) -> typing.List[BboxType]:
+  '''
+  The row's left and right sides placed among the sorted dividers
+  where a stable sort of left, dividers, right by x would put them
+  '''
+  left = (bbox[0], bbox[1], bbox[0], bbox[3]) # left/begin
+  right = (bbox[2], bbox[1], bbox[2], bbox[3]) # right/end
+  if bbox[0] > bbox[2]:
+    return sorted([left] + divider_bboxes + [right], key=lambda v: v[0])
+  left_idx = bisect.bisect_left(divider_x0s, bbox[0])
+  right_idx = bisect.bisect_right(divider_x0s, bbox[2])
+  return divider_bboxes[:left_idx] + [left] + divider_bboxes[left_idx:right_idx] + [right] + divider_bboxes[right_idx:]
 
-    cell_bbox = (
-      left_divider[0],
-      left_divider[1],
-      right_divider[2],
-      right_divider[3],
-    )
-    row_text = join_text(elems=elems_in_this_box)
-    row.append(ExtractedRowElem(text=row_text, elems=elems_in_this_box, bbox=cell_bbox))
+def extract_rows(
+  table_elems: typing.List[LTJson],
+  row_bboxes: typing.List[BboxType],
+  vertical_dividers: typing.List[LTJson],
+  padding: float
+) -> typing.List[typing.List[ExtractedRowElem]]:
+  '''
+  extract_row for each of row_bboxes. Elems and dividers are sorted once
+  and each row only looks at the elems whose bottom is inside it
+  '''
+  return extract_grid_rows(
+    table_elems=table_elems,
+    row_bboxes=row_bboxes,
+    divider_bboxes=[v.bbox for v in vertical_dividers],
+    padding=padding,
+  )
 
-  return row
+def extract_grid_rows(
+  table_elems: typing.List[LTJson],
+  row_bboxes: typing.List[BboxType],
+  divider_bboxes: typing.List[BboxType],
+  padding: float
+) -> typing.List[typing.List[ExtractedRowElem]]:
+  elems = [e for e in table_elems if not e.is_container]
+  elem_bboxes = np.array([e.bbox for e in elems], dtype=np.float64).reshape((-1, 4))
+  by_bottom = np.argsort(elem_bboxes[:, 1], kind="stable")
+  bottoms = elem_bboxes[by_bottom, 1]
+  divider_bboxes = sorted(divider_bboxes, key=lambda v: v[0]) # left to right
+  divider_x0s = [v[0] for v in divider_bboxes]
+  rows: typing.List[typing.List[ExtractedRowElem]] = []
+  for bbox in row_bboxes:
+    bbox = (
+      bbox[0] + padding,
+      bbox[1] + padding,
+      bbox[2] - padding,
+      bbox[3] - padding,
+    )
+    start = int(np.searchsorted(bottoms, bbox[1], side="left"))
+    end = int(np.searchsorted(bottoms, bbox[3], side="right"))
+    candidates = by_bottom[start:end]
+    candidate_bboxes = elem_bboxes[candidates]
+    inside = (candidate_bboxes[:, 0] >= bbox[0]) & (candidate_bboxes[:, 2] <= bbox[2]) & \
+      (candidate_bboxes[:, 3] <= bbox[3])
+    # Back in table_elems order then left to right by their right side
+    elems_in_row = np.sort(candidates[inside])
+    elems_in_row = elems_in_row[np.argsort(elem_bboxes[elems_in_row, 2], kind="stable")]
+    cell_dividers = get_cell_dividers(divider_bboxes=divider_bboxes, divider_x0s=divider_x0s, bbox=bbox)
+    # An elem is in the first cell whose right divider starts after the elem ends
+    cell_idxes = np.searchsorted(
+      np.array([v[0] for v in cell_dividers[1:]], dtype=np.float64),
+      elem_bboxes[elems_in_row, 2],
+      side="right",
+    )
+    cell_starts = np.searchsorted(cell_idxes, np.arange(len(cell_dividers)), side="left").tolist()
+    elems_in_row_list = elems_in_row.tolist()
+    row: typing.List[ExtractedRowElem] = []
+    # If multicolumn, join MATERIAL INT = column 0, MATERIAL EXT = column 1
+    for divider_idx in range(1, len(cell_dividers)):
+      left_divider = cell_dividers[divider_idx - 1]
+      right_divider = cell_dividers[divider_idx]
+      elems_in_this_box = [
+        elems[elem_idx] for elem_idx in elems_in_row_list[cell_starts[divider_idx-1]:cell_starts[divider_idx]]
+      ]
+      cell_bbox = (
+        left_divider[0],
+        left_divider[1],
+        right_divider[2],
+        right_divider[3],
+      )
+      row_text = join_text(elems=elems_in_this_box)
+      row.append(ExtractedRowElem(text=row_text, elems=elems_in_this_box, bbox=cell_bbox))
+    rows.append(row)
+  return rows
 
 def extract_table(
   indexer: pdfindexer.PdfIndexer,
@@ -265,6 +330,14 @@ def extract_table(
   # Find the rect that contains the table
   below = indexer.find_top_left_in(bbox=(x0-key_elem.height*2, y0-key_elem.height*4, x1, y0))
   rects = [ b for b in below if b.is_rect ]
+  if len(rects) == 0:
+    # Table drawn with lines instead of a rect
+    return extract_detected_table(
+      indexer=indexer,
+      key_elem=key_elem,
+      has_header=has_header,
+      header_above_table=header_above_table,
+    )
   # Take the biggest rect
   table_rect_item: LTJson = max(rects, key=lambda x: x.width * x.height)
   # Find everything inside the table rect
@@ -328,14 +401,7 @@ def extract_table(
   # Follow those vertical lines down until the first one ends
   vertical_divider_bottom = max([s.bbox[1] for s in vertical_dividers])
   # At this point we should see a horizontal line that reaches full width and ends the table
-  header_row = extract_row(
-    table_elems=inside_schedule,
-    bbox=header_bbox,
-    vertical_dividers=vertical_dividers,
-    padding=table_padding
-  )
-
-  rows: typing.List[typing.List[ExtractedRowElem]] = []
+  row_bboxes: typing.List[BboxType] = [header_bbox]
   for bottom_divider_idx in range(1, len(left_aligned_horizontal_lines)):
     bottom_divider = left_aligned_horizontal_lines[bottom_divider_idx]
     top_divider = left_aligned_horizontal_lines[bottom_divider_idx - 1]
@@ -343,17 +409,56 @@ def extract_table(
       continue
     if top_divider.bbox[3] <= vertical_divider_bottom:
       break
-    row = extract_row(
-      table_elems=inside_schedule,
-      bbox=(
-        top_divider.bbox[0],
-        bottom_divider.bbox[1],
-        top_divider.bbox[2],
-        top_divider.bbox[3]
-      ),
-      vertical_dividers=vertical_dividers,
-      padding=table_padding
-    )
-    rows.append(row)
+    row_bboxes.append((
+      top_divider.bbox[0],
+      bottom_divider.bbox[1],
+      top_divider.bbox[2],
+      top_divider.bbox[3]
+    ))
+  header_row, *rows = extract_rows(
+    table_elems=inside_schedule,
+    row_bboxes=row_bboxes,
+    vertical_dividers=vertical_dividers,
+    padding=table_padding
+  )
 
   return header_row, rows
+
+def extract_detected_table(
+  indexer: pdfindexer.PdfIndexer,
+  key_elem: LTJson,
+  has_header: bool,
+  header_above_table: bool,
+):
+  '''
+  extract_table from the page's detected table starting just below key_elem
+  '''
+  table_padding = 0.1
+  x0, y0, x1, _ = key_elem.bbox
+  tables = indexer.table_index.find_top_left_in(bbox=(x0-key_elem.height*2, y0-key_elem.height*4, x1, y0))
+  if len(tables) == 0:
+    return None, None
+  # Take the biggest table
+  table = max(tables, key=lambda t: (t.bbox[2] - t.bbox[0]) * (t.bbox[3] - t.bbox[1]))
+  # Like extract_table the table ends where the first column divider ends
+  vertical_divider_bottom = table.get_divider_bottom()
+  row_bboxes = [
+    table.get_row_bbox(row_idx=row_idx) for row_idx in range(table.num_rows)
+    if table.row_ys[row_idx] > vertical_divider_bottom
+  ]
+  if len(row_bboxes) == 0:
+    return None, None
+  if header_above_table:
+    header_bbox = (table.bbox[0], table.bbox[3], table.bbox[2], key_elem.bbox[1])
+  elif has_header:
+    header_bbox = row_bboxes.pop(0)
+  else:
+    header_bbox = (table.bbox[0], table.bbox[3], table.bbox[2], table.bbox[3])
+  header_row, *rows = extract_grid_rows(
+    table_elems=indexer.find_contains(bbox=(table.bbox[0], table.bbox[1], table.bbox[2], header_bbox[3])),
+    row_bboxes=[header_bbox] + row_bboxes,
+    # Like extract_table the columns go up to the key
+    divider_bboxes=table.get_column_dividers(top=key_elem.bbox[1]),
+    padding=table_padding,
+  )
+  return header_row, rows
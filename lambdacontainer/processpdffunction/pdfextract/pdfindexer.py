@@ -3,14 +3,128 @@ import collections
 import time
 import typing
 
-import rtree
-import scipy.spatial # type: ignore
+import numpy as np
 
-from . import path_utils
-from .ltjson import LTJson, BboxType
+from . import distance_utils, path_utils, strtree, tabledetector
+from .ltjson import LTJson, BboxType, FLAG_HAS_TEXT, PageArrays, get_page_arrays
+
+if typing.TYPE_CHECKING:
+  # Imported on first use to keep them out of cold start
+  import scipy.spatial # type: ignore
+  from . import symbol_library
+
+# A page elem or a symbol_library.SymbolTemplate
+ShapeToFind = typing.Union[LTJson, "symbol_library.SymbolTemplate"]
 
 LOG_TIME = False
 
+TextLookup = typing.DefaultDict[str, typing.List[LTJson]]
+
+def normalize_text(text: str) -> str:
+  return text.replace("\n", " ").lower().strip()
+
+def make_text_lookup(wrappers: typing.List[LTJson]) -> TextLookup:
+  text_lookup: TextLookup = collections.defaultdict(list)
+  for elem in wrappers:
+    if elem.text is not None:
+      text_lookup[normalize_text(elem.text)].append(elem)
+  return text_lookup
+
+class TextIndex:
+  '''
+  The text elems of a page so text searches never visit curves
+  elem_idxes[i] is the idx into wrappers of texts[i] and normalized_texts[i]
+  '''
+  def __init__(
+    self,
+    wrappers: typing.List[LTJson]
+  ) -> None:
+    self.wrappers = wrappers
+    self.elem_idxes: typing.List[int] = []
+    self.texts: typing.List[str] = []
+    self.normalized_texts: typing.List[str] = []
+    # normalized text -> elems
+    self.text_lookup: TextLookup = collections.defaultdict(list)
+    # text -> elem idxes
+    self.raw_text_lookup: typing.DefaultDict[str, typing.List[int]] = collections.defaultdict(list)
+    # normalized token -> elem idxes
+    self.token_lookup: typing.DefaultDict[str, typing.List[int]] = collections.defaultdict(list)
+    for elem_idx, elem in enumerate(wrappers):
+      text = elem.text
+      if text is None:
+        continue
+      normalized_text = normalize_text(text)
+      self.elem_idxes.append(elem_idx)
+      self.texts.append(text)
+      self.normalized_texts.append(normalized_text)
+      self.text_lookup[normalized_text].append(elem)
+      self.raw_text_lookup[text].append(elem_idx)
+      for token in set(normalized_text.split()):
+        self.token_lookup[token].append(elem_idx)
+
+  def find_text(self, text: str) -> typing.List[LTJson]:
+    return [self.wrappers[elem_idx] for elem_idx in self.raw_text_lookup.get(text, [])]
+
+  def find_token(self, token: str) -> typing.List[LTJson]:
+    '''
+    Text elems with token as one of their whitespace separated words
+    '''
+    return [self.wrappers[elem_idx] for elem_idx in self.token_lookup.get(normalize_text(token), [])]
+
+SIMILAR_H_W_RATIO = 0.1
+MAX_H_W_RATIO = 1000.
+
+def get_h_w_ratio(width: float, height: float) -> float:
+  if width <= 0.1:
+    return MAX_H_W_RATIO
+  return min(MAX_H_W_RATIO, height / width)
+
+def get_h_w_ratios(widths: np.ndarray, heights: np.ndarray) -> np.ndarray:
+  with np.errstate(divide="ignore", invalid="ignore"):
+    ratios = np.minimum(MAX_H_W_RATIO, heights / widths)
+  return np.where(widths <= 0.1, MAX_H_W_RATIO, ratios)
+
+class ShapeIndex:
+  '''
+  Shape signature of every elem: height/width ratio and line count
+  so that only curves find_most_similar_curve would compare against are returned
+  Elems with lines are kept sorted by ratio so a whole page search is a searchsorted window
+  '''
+  def __init__(
+    self,
+    page_arrays: PageArrays,
+  ) -> None:
+    self.h_w_ratios = get_h_w_ratios(widths=page_arrays.width, heights=page_arrays.height)
+    _, line_offsets = page_arrays.get_path_lines()
+    self.line_counts = np.diff(line_offsets)
+    line_elem_idxes = np.flatnonzero(self.line_counts > 0)
+    order = np.argsort(self.h_w_ratios[line_elem_idxes], kind="stable")
+    self.sorted_elem_idxes: np.ndarray = line_elem_idxes[order]
+    self.sorted_h_w_ratios: np.ndarray = self.h_w_ratios[self.sorted_elem_idxes]
+
+  def find_similar(
+    self,
+    width: float,
+    height: float,
+    elem_idxes: typing.Union[None, typing.List[int]] = None,
+  ) -> typing.List[int]:
+    '''
+    Elems with lines whose height/width ratio is within SIMILAR_H_W_RATIO
+    elem_idxes limits the search and keeps its order otherwise in elem order
+    '''
+    h_w_ratio = get_h_w_ratio(width=width, height=height)
+    if elem_idxes is None:
+      # Widened so float rounding at the edges is left to the exact check below
+      start = np.searchsorted(self.sorted_h_w_ratios, h_w_ratio - SIMILAR_H_W_RATIO - 1e-9, side="left")
+      end = np.searchsorted(self.sorted_h_w_ratios, h_w_ratio + SIMILAR_H_W_RATIO + 1e-9, side="right")
+      candidates = np.sort(self.sorted_elem_idxes[start:end])
+    else:
+      # Already narrowed (ex: by position) so filtering them directly is cheaper
+      candidates = np.array(elem_idxes, dtype=np.int64)
+      candidates = candidates[self.line_counts[candidates] > 0]
+    similar = np.abs(h_w_ratio - self.h_w_ratios[candidates]) <= SIMILAR_H_W_RATIO
+    return candidates[similar].tolist()
+
 class PdfLineIndexer:
   def __init__(
     self,
@@ -21,45 +135,47 @@ class PdfLineIndexer:
     # 14464    0.026    0.000    0.820    0.000 pdfindexer.py:44(find_intersection)
     # Saving elem_idx in the rtree and using objects="raw"
     # 14464    0.034    0.000    5.196    0.000 pdfindexer.py:44(find_intersection)
-    self.rtree_id_to_elem_idx: typing.List[int] = []
-    def insertion_generator(elems: typing.List[LTJson], rtree_id_to_elem_idx: typing.List[int]):
-      rtree_id = 0
-      for elem_idx, elem in enumerate(elems):
-        lines = elem.get_path_lines()
-        if elem.text is not None and len(lines) == 0:
-          yield (rtree_id, elem.bbox, None)
-          rtree_id_to_elem_idx.append(elem_idx)
-          rtree_id += 1
-        else:
-          for line in lines:
-            x0, y0, x1, y1, = line
-            yield (rtree_id, (x0, y0, x1, y1), None)
-            rtree_id_to_elem_idx.append(elem_idx)
-            rtree_id += 1
-    self.find_by_position_rtree = rtree.index.Index(
-      insertion_generator(elems=elems, rtree_id_to_elem_idx=self.rtree_id_to_elem_idx),
-    )
+    page_arrays = get_page_arrays(wrappers=elems)
+    lines, line_offsets = page_arrays.get_path_lines()
+    line_counts = np.diff(line_offsets)
+    # Text without lines is indexed by its bbox, everything else by each of its lines
+    has_text = (page_arrays.flags & FLAG_HAS_TEXT) != 0
+    for idx, text in page_arrays.text_overrides.items():
+      has_text[idx] = text is not None
+    text_idxes = np.flatnonzero(has_text & (line_counts == 0))
+    line_elem_idxes = np.repeat(np.arange(len(page_arrays)), line_counts)
+    # Every path line of the page and the elem it is from
+    self.lines = lines
+    self.line_elem_idxes = line_elem_idxes
+    rtree_elem_idxes = np.concatenate([text_idxes, line_elem_idxes])
+    rtree_bboxes = np.concatenate([page_arrays.bbox[text_idxes], lines], axis=0)
+    # Keep rtree ids in elem order
+    order = np.argsort(rtree_elem_idxes, kind="stable")
+    self.rtree_id_to_elem_idx: np.ndarray = rtree_elem_idxes[order]
+    self.find_by_position_rtree = strtree.STRTree(bboxes=rtree_bboxes[order])
 
   def find_intersection(
     self,
     bbox: BboxType,
   ) -> typing.List[LTJson]:
-    result_idxes = self.find_by_position_rtree.intersection(bbox, objects=False)
-    result_idxes = typing.cast(typing.List[int], result_idxes)
-    results = [ self.elems[self.rtree_id_to_elem_idx[rtree_id]] for rtree_id in result_idxes ] #pylint: disable=not-an-iterable
+    result_idxes = self.rtree_id_to_elem_idx[self.find_by_position_rtree.intersection(bbox)].tolist()
+    results = [ self.elems[elem_idx] for elem_idx in result_idxes ]
     return results
 
+  def find_intersection_many(self, bboxes: np.ndarray) -> strtree.CSRResult:
+    offsets, rtree_ids = self.find_by_position_rtree.intersection_many(bboxes=bboxes)
+    return offsets, self.rtree_id_to_elem_idx[rtree_ids]
+
 class PdfIndexer:
   # To find contents inside shapes
-  find_by_position_rtree: rtree.index.Index
+  find_by_position_rtree: strtree.STRTree
   line_indexer: PdfLineIndexer
-  # To find similar shapes
-  find_by_shape_kdtree: scipy.spatial.KDTree
   def __init__(
     self,
     wrappers: typing.List[LTJson],
     page_width: float,
     page_height: float,
+    text_index: typing.Union[None, TextIndex] = None,
   ) -> None:
     tb = time.time()
     self.page_width = page_width
@@ -68,25 +184,38 @@ class PdfIndexer:
     tl0 = time.time()
     self.line_indexer = PdfLineIndexer(elems=wrappers)
     tl1 = time.time()
-    def index_insertion_generator(elems: typing.List[LTJson]):
-      for i, wrapper in enumerate(elems):
-        yield (i, wrapper.bbox, i)
+    page_arrays = get_page_arrays(wrappers=wrappers)
 
     t0 = time.time()
-    self.find_by_position_rtree = rtree.index.Index(index_insertion_generator(elems=wrappers))
+    self.find_by_position_rtree = strtree.STRTree(bboxes=page_arrays.bbox)
     t1 = time.time()
-    all_elem_shapes = [[wrapper.width, wrapper.height] for wrapper in wrappers]
-    t2 = time.time()
-    self.find_by_shape_kdtree = scipy.spatial.KDTree(data=all_elem_shapes)
+    self.all_elem_shapes = np.stack([page_arrays.width, page_arrays.height], axis=1).reshape((-1, 2))
+    # To find similar shapes. Built on first use
+    self.__find_by_shape_kdtree: typing.Union[None, "scipy.spatial.KDTree"] = None
+    self.__table_index: typing.Union[None, tabledetector.TableIndex] = None
     t3 = time.time()
-    self.text_lookup: typing.Dict[str, typing.List[LTJson]] = collections.defaultdict(list)
-    for elem in wrappers:
-      if elem.text is not None:
-        key_text = elem.text.replace("\n", " ").lower().strip()
-        self.text_lookup[key_text].append(elem)
+    self.text_index = text_index if text_index is not None else TextIndex(wrappers=wrappers)
+    self.text_lookup = self.text_index.text_lookup
+    self.shape_index = ShapeIndex(page_arrays=page_arrays)
     if LOG_TIME:
       # 0.25s 0.9s 0.009s total:1.2s
-      print("pdfindexer rtree:", t1-t0, "lineindexer:", tl1-tl0, "kdtree:", t3-t2, "total:", t3-tb)
+      print("pdfindexer rtree:", t1-t0, "lineindexer:", tl1-tl0, "total:", t3-tb)
+
+  @property
+  def find_by_shape_kdtree(self) -> "scipy.spatial.KDTree":
+    if self.__find_by_shape_kdtree is None:
+      import scipy.spatial # type: ignore # pylint:disable=import-outside-toplevel,redefined-outer-name
+      self.__find_by_shape_kdtree = scipy.spatial.KDTree(data=self.all_elem_shapes)
+    return self.__find_by_shape_kdtree
+
+  @property
+  def table_index(self) -> tabledetector.TableIndex:
+    '''
+    Ruled tables on the page. Detected on first use
+    '''
+    if self.__table_index is None:
+      self.__table_index = tabledetector.detect_tables(lines=self.line_indexer.lines)
+    return self.__table_index
 
   def find_contains(
     self,
@@ -96,15 +225,32 @@ class PdfIndexer:
     '''
     bbox = x0, y0, x1, y1
     '''
+    result_idxes = self.find_contains_idxes(bbox=bbox, y_is_down=y_is_down)
+    results = [self.wrappers[idx] for idx in result_idxes]
+    return results
+
+  def find_contains_idxes(
+    self,
+    bbox: typing.Tuple[float, float, float, float],
+    y_is_down: bool = False,
+  ) -> typing.List[int]:
     if y_is_down:
       x0, y0, x1, y1 = bbox
       bbox = (x0, self.page_height - y1, x1, self.page_height - y0)
-    result_idxes = self.find_by_position_rtree.contains(bbox)
-    if result_idxes is None:
-      return []
-    result_idxes = list(result_idxes)
-    results = [self.wrappers[idx] for idx in result_idxes]
-    return results
+    return self.find_by_position_rtree.contains(bbox).tolist()
+
+  def find_contains_many(
+    self,
+    bboxes: np.ndarray,
+    y_is_down: bool = False,
+  ) -> strtree.CSRResult:
+    '''
+    find_contains_idxes of each row of bboxes in one pass
+    Elem idxes inside bboxes[q] are idxes[offsets[q]:offsets[q+1]]
+    '''
+    if y_is_down:
+      bboxes = self.__flip_bboxes_y(bboxes=bboxes)
+    return self.find_by_position_rtree.contains_many(bboxes=bboxes)
 
   def find_intersection(
     self,
@@ -116,12 +262,33 @@ class PdfIndexer:
       bbox = (x0, self.page_height - y1, x1, self.page_height - y0)
     return self.line_indexer.find_intersection(bbox)
 
+  def find_intersection_many(
+    self,
+    bboxes: np.ndarray,
+    y_is_down: bool = False,
+  ) -> strtree.CSRResult:
+    '''
+    find_intersection of each row of bboxes in one pass as elem idxes
+    An elem is repeated once for each of its lines that intersects
+    '''
+    if y_is_down:
+      bboxes = self.__flip_bboxes_y(bboxes=bboxes)
+    return self.line_indexer.find_intersection_many(bboxes=bboxes)
+
+  def __flip_bboxes_y(self, bboxes: np.ndarray) -> np.ndarray:
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape((-1, 4))
+    return np.stack([
+      bboxes[:, 0],
+      self.page_height - bboxes[:, 3],
+      bboxes[:, 2],
+      self.page_height - bboxes[:, 1],
+    ], axis=1)
+
   def find_top_left_in(
     self,
     bbox: typing.Tuple[float, float, float, float],
   ) -> typing.List[LTJson]:
-    result_idxes = self.find_by_position_rtree.intersection(coordinates=bbox)
-    result_idxes = list(result_idxes)
+    result_idxes = self.find_by_position_rtree.intersection(bbox).tolist()
     results = [ self.wrappers[idx] for idx in result_idxes ]
     def starts_inside_bbox(elem: LTJson, bbox: typing.Tuple[float, float, float, float]):
       x0, y0, x1, y1 = bbox
@@ -130,6 +297,21 @@ class PdfIndexer:
     results = [ r for r in results if starts_inside_bbox(elem=r, bbox=bbox)]
     return results
 
+  def find_similar_shapes(
+    self,
+    wrapper_to_find: ShapeToFind,
+    elem_idxes: typing.Union[None, typing.List[int]] = None,
+  ) -> typing.List[LTJson]:
+    '''
+    Candidates for find_most_similar_curve(wrapper_to_find) out of elem_idxes or the whole page
+    '''
+    result_idxes = self.shape_index.find_similar(
+      width=wrapper_to_find.width,
+      height=wrapper_to_find.height,
+      elem_idxes=elem_idxes,
+    )
+    return [self.wrappers[idx] for idx in result_idxes]
+
   def find_similar_height_width(
     self,
     width: float,
@@ -156,55 +338,50 @@ def line_set_distance(
   lines2: typing.List[path_utils.LinePointsType],
   max_dist: float,
 ):
-  total_dist = 0.
-  if len(lines1) == 0 or len(lines2) == 0:
-    return total_dist
-
-  for linea in lines1:
-    best_dist = line_distance(linea=linea, lineb=lines2[0])
-    for lineb in lines2:
-      dist = line_distance(linea=linea, lineb=lineb)
-      best_dist = min(best_dist, dist)
-    total_dist += best_dist / max(len(lines1), len(lines2))
-    if max_dist >= 0 and total_dist > max_dist:
-      # Return early
-      return total_dist
-  return total_dist
+  return distance_utils.line_set_distance(
+    lines1=np.array(lines1, dtype=np.float64).reshape((-1, 4)),
+    lines2=np.array(lines2, dtype=np.float64).reshape((-1, 4)),
+    max_dist=max_dist,
+  )
 
 # TODO: Search for union of multiple wrappers_to_find
 
 def find_most_similar_curve(
-  wrapper_to_find: LTJson,
+  wrapper_to_find: ShapeToFind,
   wrappers_to_search: typing.List[LTJson],
   max_dist: float,
 ) -> typing.List[LTJson]:
-  lines_to_find = wrapper_to_find.get_zeroed_path_lines()
-  if len(lines_to_find) == 0:
+  lines_to_find = wrapper_to_find.get_zeroed_path_lines_array()
+  if lines_to_find.shape[0] == 0:
     return []
 
-  if wrapper_to_find.width <= 0.1:
-    to_find_h_w_ratio = 1000
-  else:
-    to_find_h_w_ratio = min(1000, wrapper_to_find.height / wrapper_to_find.width)
+  to_find_h_w_ratio = get_h_w_ratio(width=wrapper_to_find.width, height=wrapper_to_find.height)
 
-  results: typing.List[LTJson] = []
-  best_dist = None
+  candidates: typing.List[LTJson] = []
+  candidate_lines: typing.List[np.ndarray] = []
   for wrapper in wrappers_to_search:
-    if wrapper.width <= 0.1:
-      potential_h_w_ratio = 1000
-    else:
-      potential_h_w_ratio = min(1000, wrapper.height / wrapper.width)
-    if abs(to_find_h_w_ratio - potential_h_w_ratio) > 0.1:
+    potential_h_w_ratio = get_h_w_ratio(width=wrapper.width, height=wrapper.height)
+    if abs(to_find_h_w_ratio - potential_h_w_ratio) > SIMILAR_H_W_RATIO:
       continue
-    potential_lines = wrapper.get_zeroed_path_lines()
-    if len(potential_lines) == 0:
+    potential_lines = wrapper.get_zeroed_path_lines_array()
+    if potential_lines.shape[0] == 0:
       continue
-    # TODO: line distance by area drawn instead of just start/stop
-    # TODO: size agnostic
-    dist = line_set_distance(lines1=lines_to_find, lines2=potential_lines, max_dist=max_dist)
-    if dist < max_dist:
-      if best_dist is None or dist < best_dist:
-        best_dist = dist
-        results = [wrapper]
-
-  return results
+    candidates.append(wrapper)
+    candidate_lines.append(potential_lines)
+  if len(candidates) == 0:
+    return []
+
+  # TODO: line distance by area drawn instead of just start/stop
+  # TODO: size agnostic
+  lines, line_offsets = distance_utils.stack_lines(line_sets=candidate_lines)
+  dists = distance_utils.line_set_distances(
+    lines1=lines_to_find,
+    lines=lines,
+    line_offsets=line_offsets,
+    max_dist=max_dist,
+  )
+  # First of the closest like a strict < scan
+  best_idx = int(np.argmin(dists))
+  if dists[best_idx] < max_dist:
+    return [candidates[best_idx]]
+  return []
@@ -1,14 +1,15 @@
 
 import io
-import json
-import os
+import multiprocessing
+import multiprocessing.connection
+import traceback
 import typing
 import time
 
 import pdfminer, pdfminer.layout, pdfminer.high_level, pdfminer.utils
 import pdfminer.pdfparser, pdfminer.pdfdocument, pdfminer.pdftypes
 
-from pdfextract import pdfindexer, pdfelemtransforms, votesearch, dataprovider, ltjson
+from pdfextract import pdfindexer, pdfelemtransforms, votesearch, dataprovider, ltjson, pagecache, checkpoint, pageclassifier
 
 def get_pdf_num_pages(pdfdata_io: io.BytesIO):
   parser = pdfminer.pdfparser.PDFParser(pdfdata_io)
@@ -16,62 +17,473 @@ def get_pdf_num_pages(pdfdata_io: io.BytesIO):
   num_pages = pdfminer.pdftypes.resolve1(document.catalog["Pages"])["Count"]
   return num_pages
 
-def read_symbols_from_json():
-  dirpath = "./"
-  with open(os.path.join(dirpath, "symbols_michael_smith.json"), "r", encoding="utf-8") as f:
-    json_string = f.read()
-  symbols_dicts = json.loads(json_string)
-  symbols: typing.Dict[str, typing.List[ltjson.LTJson]] = dict()
-  for key, serialized_elems in symbols_dicts.items():
-    elems: typing.List[ltjson.LTJson] = []
-    for serialized_json in serialized_elems:
-      elems.append(ltjson.LTJson(serialized_json=serialized_json))
-    symbols[key] = elems
-  return symbols
+# Pages parsed in pass 1 are kept for pass 2 up to this many bytes of page arrays
+# and the rest are parsed again (or read from the page cache) so peak memory stays bounded
+KEPT_PAGES_MAX_BYTES = 128 * 1024 * 1024
 
 class PdfProcessor:
+  '''
+  Pass 1: find the schedules on every page
+  Pass 2: match the items of every schedule on every page
+  Checkpoints through data_provider every checkpoint_interval_s so that an invocation
+  that times out can be resumed by the next invocation for the same pdfkey
+  last_pass_number=1 stops after finding the schedules
+  kept_pages_max_bytes: how much of pass 1's parsed pages to keep for pass 2
+  '''
   def __init__(self,
-    pages_gen: typing.Iterator[pdfminer.layout.LTPage],
-    data_provider: dataprovider.DataProvider
+    pdfdata: bytes,
+    page_numbers: typing.List[int],
+    page_cache: pagecache.PageCache,
+    data_provider: dataprovider.DataProvider,
+    pdfkey: typing.Union[None, str] = None,
+    checkpoint_interval_s: float = -1,
+    last_pass_number: int = 2,
+    kept_pages_max_bytes: int = KEPT_PAGES_MAX_BYTES,
   ) -> None:
-    self.pages_gen = pages_gen
+    self.pdfdata = pdfdata
+    self.page_numbers = page_numbers
+    self.page_cache = page_cache
     self.data_provider = data_provider
+    self.pdfkey = pdfkey
+    self.checkpoint_interval_s = checkpoint_interval_s
+    self.last_pass_number = last_pass_number
+    self.kept_pages_max_bytes = kept_pages_max_bytes
     self.searcher = votesearch.PdfSearcher()
+    # What each step added to the results
+    self.deltas: typing.List[ltjson.PdfResultsDelta] = []
     self.processing_time = 0.
+    self.num_steps = 2 * len(page_numbers)
+    self.pass_number = 1
+    self.num_pages_done = 0
+    self.last_checkpoint_time = time.time()
+    self.__load_checkpoint()
+
+  @property
+  def num_steps_done(self) -> int:
+    return (self.pass_number - 1) * len(self.page_numbers) + self.num_pages_done
 
   def process_page(self):
-    for page_number, page in enumerate(self.pages_gen):
-      t0 = time.time()
-      width = page.width
-      height = page.height
-      elems = pdfelemtransforms.get_underlying_parent_links(elems=page)
-      indexer = pdfindexer.PdfIndexer(wrappers=elems, page_width=width, page_height=height)
+    page_order = sorted(self.page_numbers)
+    pages: typing.Dict[int, ParsedPage] = {}
+    kept_bytes = 0
+    if self.pass_number == 1:
+      for page_number, elems, width, height in extract_page_elems(
+        pdfdata=self.pdfdata,
+        page_numbers=page_order[self.num_pages_done:],
+        page_cache=self.page_cache,
+      ):
+        t0 = time.time()
+        tables, indexer = find_page_schedules(
+          searcher=self.searcher,
+          page_number=page_number,
+          elems=elems,
+          width=width,
+          height=height,
+        )
+        self.searcher.insert_schedules(page_number=page_number, tables=tables)
+        self.deltas.append(self.searcher.get_schedules_delta(page_number=page_number))
+        page_bytes = ltjson.get_page_arrays(wrappers=elems).nbytes
+        if kept_bytes + page_bytes <= self.kept_pages_max_bytes:
+          pages[page_number] = (page_number, elems, width, height, indexer)
+          kept_bytes += page_bytes
+        self.num_pages_done += 1
+        t1 = time.time()
+        self.processing_time += t1 - t0
+        self.__maybe_write_checkpoint(last_page=page_number)
+        yield
+      self.pass_number = 2
+      self.num_pages_done = 0
+      if self.last_pass_number == 1:
+        return
 
-      self.searcher.process_page(page_number=page_number, elems=elems, indexer=indexer)
-      self.searcher.refine()
+    # Pages parsed before resuming or over the byte budget are parsed again
+    remaining_page_numbers = page_order[self.num_pages_done:]
+    unparsed_pages = extract_page_elems(
+      pdfdata=self.pdfdata,
+      page_numbers=[page_number for page_number in remaining_page_numbers if page_number not in pages],
+      page_cache=self.page_cache,
+    )
+    for page_number in remaining_page_numbers:
+      if page_number in pages:
+        page = pages.pop(page_number) # Release the page once it has been searched
+      else:
+        unparsed_page_number, elems, width, height = next(unparsed_pages)
+        page = (unparsed_page_number, elems, width, height, None)
+      t0 = time.time()
+      item_results = match_page_items(
+        searcher=self.searcher,
+        page=page,
+        item_search_rules=self.searcher.get_item_search_rules_for_page(page_number=page[0]),
+      )
+      self.searcher.add_item_results(page_number=page[0], item_results=item_results)
+      self.deltas.append(self.searcher.get_items_delta(page_number=page[0], item_results=item_results))
+      self.num_pages_done += 1
       t1 = time.time()
       self.processing_time += t1 - t0
+      self.__maybe_write_checkpoint(last_page=page_number)
       yield
+    self.searcher.refine()
+
+  def get_results(self) -> ltjson.PdfSummaryJson:
+    return votesearch.merge_results_deltas(deltas=self.deltas)
+
+  def make_checkpoint(self, last_page: int) -> checkpoint.ProcessorCheckpoint:
+    return checkpoint.make_checkpoint(
+      searcher=self.searcher,
+      page_numbers=self.page_numbers,
+      pass_number=self.pass_number,
+      num_pages_done=self.num_pages_done,
+      last_page=last_page,
+      deltas=self.deltas,
+    )
+
+  def restore_checkpoint(self, pdf_checkpoint: checkpoint.ProcessorCheckpoint):
+    checkpoint.restore_searcher(searcher=self.searcher, checkpoint=pdf_checkpoint)
+    self.deltas = pdf_checkpoint["deltas"]
+    self.pass_number = pdf_checkpoint["passNumber"]
+    self.num_pages_done = pdf_checkpoint["numPagesDone"]
+
+  def __maybe_write_checkpoint(self, last_page: int):
+    if self.pdfkey is None or self.checkpoint_interval_s < 0:
+      return
+    if time.time() - self.last_checkpoint_time < self.checkpoint_interval_s:
+      return
+    self.data_provider.write_processpdf_checkpoint(
+      pdfkey=self.pdfkey,
+      checkpoint=checkpoint.encode_checkpoint(checkpoint=self.make_checkpoint(last_page=last_page)),
+    )
+    self.last_checkpoint_time = time.time()
+
+  def __load_checkpoint(self):
+    if self.pdfkey is None or self.checkpoint_interval_s < 0:
+      return
+    data = self.data_provider.read_processpdf_checkpoint(pdfkey=self.pdfkey)
+    if data is None:
+      return
+    pdf_checkpoint = checkpoint.decode_checkpoint(data=data)
+    if pdf_checkpoint is None or pdf_checkpoint["pageNumbers"] != self.page_numbers:
+      print("Ignoring checkpoint for:", self.pdfkey)
+      return
+    self.restore_checkpoint(pdf_checkpoint=pdf_checkpoint)
+    print("Resuming:", self.pdfkey, "pass:", self.pass_number, "after page:", pdf_checkpoint["lastPage"])
+
+ParsedPage = typing.Tuple[
+  int, # page_number
+  typing.List[ltjson.LTJson], # elems
+  float, # width
+  float, # height
+  typing.Union[None, pdfindexer.PdfIndexer], # indexer if already built
+]
+
+def find_page_schedules(
+  searcher: votesearch.PdfSearcher,
+  page_number: int,
+  elems: typing.List[ltjson.LTJson],
+  width: float,
+  height: float,
+) -> typing.Tuple[
+  typing.List[typing.Union[None, votesearch.ExtractedTable]],
+  typing.Union[None, pdfindexer.PdfIndexer],
+]:
+  # Only pay for indexing the page here if it has the title text of a schedule
+  text_index = pdfindexer.TextIndex(wrappers=elems)
+  if not searcher.has_schedule_text(text_lookup=text_index.text_lookup):
+    return [None for _ in searcher.search_rules], None
+  indexer = pdfindexer.PdfIndexer(
+    wrappers=elems,
+    page_width=width,
+    page_height=height,
+    text_index=text_index,
+  )
+  return searcher.find_schedules(page_number=page_number, indexer=indexer), indexer
+
+def match_page_items(
+  searcher: votesearch.PdfSearcher,
+  page: ParsedPage,
+  item_search_rules: typing.List[typing.List[votesearch.ItemSearchRule]],
+) -> typing.List[typing.List[ltjson.PdfElem]]:
+  page_number, elems, width, height, indexer = page
+  if all([len(rules) == 0 for rules in item_search_rules]):
+    return [[] for _ in item_search_rules]
+  text_index = indexer.text_index if indexer is not None else pdfindexer.TextIndex(wrappers=elems)
+  # Skip indexing pages that can't have any of the items
+  item_search_rules = searcher.select_item_search_rules(
+    item_search_rules=item_search_rules,
+    page_types=pageclassifier.classify_page(text_index=text_index, page_width=width, page_height=height),
+  )
+  if all([len(rules) == 0 for rules in item_search_rules]):
+    return [[] for _ in item_search_rules]
+  if indexer is None:
+    indexer = pdfindexer.PdfIndexer(wrappers=elems, page_width=width, page_height=height, text_index=text_index)
+  return searcher.match_items(
+    page_number=page_number,
+    elems=elems,
+    indexer=indexer,
+    item_search_rules=item_search_rules,
+  )
+
+def parse_page_elems(
+  pdfdata: bytes,
+  page_numbers: typing.List[int],
+) -> typing.Iterator[typing.Tuple[int, typing.List[ltjson.LTJson], float, float]]:
+  # Each caller gets its own parser over the bytes so worker processes don't share file state
+  pdfdata_io = io.BytesIO(initial_bytes=pdfdata)
+  pages_gen = pdfminer.high_level.extract_pages(pdf_file=pdfdata_io, page_numbers=page_numbers)
+  # extract_pages yields the requested pages in document order
+  for page_number, page in zip(sorted(page_numbers), pages_gen):
+    elems = pdfelemtransforms.get_underlying_parent_links(elems=page)
+    yield page_number, elems, page.width, page.height
+
+def extract_page_elems(
+  pdfdata: bytes,
+  page_numbers: typing.List[int],
+  page_cache: pagecache.PageCache,
+) -> typing.Iterator[typing.Tuple[int, typing.List[ltjson.LTJson], float, float]]:
+  pdf_hash = pagecache.get_pdf_hash(pdfdata=pdfdata)
+  page_numbers = sorted(page_numbers)
+  uncached_page_numbers = [
+    page_number for page_number in page_numbers
+    if not page_cache.contains(pdf_hash=pdf_hash, page_number=page_number)
+  ]
+  # Only run pdfminer over the pages that are not cached
+  parsed_gen = parse_page_elems(pdfdata=pdfdata, page_numbers=uncached_page_numbers)
+  uncached_set = set(uncached_page_numbers)
+  for page_number in page_numbers:
+    if page_number not in uncached_set:
+      cached = page_cache.get(pdf_hash=pdf_hash, page_number=page_number)
+      if cached is not None:
+        elems, width, height = cached
+        yield page_number, elems, width, height
+        continue
+      # Evicted since checked
+      _, elems, width, height = next(parse_page_elems(pdfdata=pdfdata, page_numbers=[page_number]))
+    else:
+      _, elems, width, height = next(parsed_gen)
+    page_cache.put(pdf_hash=pdf_hash, page_number=page_number, page=(elems, width, height))
+    yield page_number, elems, width, height
 
-  def get_results(self):
-    return self.searcher.get_results()
+WorkerMessage = typing.Tuple[
+  str, # kind: "schedules", "items" or "error"
+  int, # page_number
+  typing.Any, # payload
+  float, # processing_time
+]
+
+def process_pages_worker(
+  conn: multiprocessing.connection.Connection,
+  pdfdata: bytes,
+  page_numbers: typing.List[int],
+  page_cache: pagecache.PageCache,
+):
+  '''
+  Phase 1: parse each page, send back the schedules found on it
+  Phase 2: receive the item search rules per page, send back the items found on it
+  Parsed pages are kept in this process between the phases
+  '''
+  try:
+    searcher = votesearch.PdfSearcher()
+    pages: typing.List[typing.Union[None, ParsedPage]] = []
+    t0 = time.time()
+    for page_number, elems, width, height in extract_page_elems(
+      pdfdata=pdfdata,
+      page_numbers=page_numbers,
+      page_cache=page_cache,
+    ):
+      tables, indexer = find_page_schedules(
+        searcher=searcher,
+        page_number=page_number,
+        elems=elems,
+        width=width,
+        height=height,
+      )
+      pages.append((page_number, elems, width, height, indexer))
+      t1 = time.time()
+      message: WorkerMessage = ("schedules", page_number, tables, t1 - t0)
+      conn.send(message)
+      t0 = time.time()
+
+    page_item_search_rules: typing.Dict[
+      int,
+      typing.List[typing.List[votesearch.ItemSearchRule]]
+    ] = conn.recv()
+    for page_idx, page in enumerate(pages):
+      t0 = time.time()
+      page = typing.cast(ParsedPage, page)
+      pages[page_idx] = None
+      item_results = match_page_items(
+        searcher=searcher,
+        page=page,
+        item_search_rules=page_item_search_rules[page[0]],
+      )
+      t1 = time.time()
+      message = ("items", page[0], item_results, t1 - t0)
+      conn.send(message)
+  except Exception: # pylint:disable=broad-except
+    conn.send(("error", -1, traceback.format_exc(), 0.))
+  finally:
+    conn.close()
+
+class ParallelPdfProcessor:
+  '''
+  Same passes as PdfProcessor but the pages are split across worker processes
+  that each parse and index their own pages. Schedules from every worker are inserted
+  in page order before any worker starts matching items.
+  Uses Process and Pipe since multiprocessing.Pool and Queue are not available in Lambda
+  '''
+  def __init__(
+    self,
+    pdfdata: bytes,
+    page_numbers: typing.List[int],
+    num_workers: int,
+    page_cache: pagecache.PageCache,
+    data_provider: dataprovider.DataProvider
+  ) -> None:
+    self.pdfdata = pdfdata
+    self.page_numbers = page_numbers
+    self.page_cache = page_cache
+    self.num_workers = num_workers
+    self.data_provider = data_provider
+    self.searcher = votesearch.PdfSearcher()
+    # What each step added to the results
+    self.deltas: typing.List[ltjson.PdfResultsDelta] = []
+    self.processing_time = 0.
+    self.num_steps = 2 * len(page_numbers)
+    self.num_steps_done = 0
+
+  def process_page(self):
+    workers: typing.List[typing.Tuple[
+      multiprocessing.connection.Connection,
+      multiprocessing.Process,
+      typing.List[int],
+    ]] = []
+    try:
+      for worker_idx in range(self.num_workers):
+        # Interleave so expensive runs of pages are spread across workers
+        worker_page_numbers = self.page_numbers[worker_idx::self.num_workers]
+        if len(worker_page_numbers) == 0:
+          continue
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+          target=process_pages_worker,
+          args=(child_conn, self.pdfdata, worker_page_numbers, self.page_cache),
+          daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        workers.append((parent_conn, process, worker_page_numbers))
+
+      # Schedules are inserted in page order as soon as every earlier page has arrived
+      # and each step adds at most one delta so (step, page) stays unique
+      page_order = sorted(self.page_numbers)
+      num_pages_inserted = 0
+      page_tables: typing.Dict[int, typing.List[typing.Union[None, votesearch.ExtractedTable]]] = {}
+      for page_number, tables in self.__receive(workers=workers):
+        page_tables[page_number] = tables
+        while num_pages_inserted < len(page_order) and page_order[num_pages_inserted] in page_tables:
+          next_page_number = page_order[num_pages_inserted]
+          self.searcher.insert_schedules(page_number=next_page_number, tables=page_tables.pop(next_page_number))
+          self.deltas.append(self.searcher.get_schedules_delta(page_number=next_page_number))
+          num_pages_inserted += 1
+          yield
+
+      for conn, _, worker_page_numbers in workers:
+        conn.send({
+          page_number: self.searcher.get_item_search_rules_for_page(page_number=page_number)
+          for page_number in worker_page_numbers
+        })
+      page_item_results: typing.Dict[int, typing.List[typing.List[ltjson.PdfElem]]] = {}
+      for page_number, item_results in self.__receive(workers=workers):
+        page_item_results[page_number] = item_results
+        self.deltas.append(self.searcher.get_items_delta(page_number=page_number, item_results=item_results))
+        yield
+      for page_number in sorted(page_item_results.keys()):
+        self.searcher.add_item_results(page_number=page_number, item_results=page_item_results[page_number])
+      self.searcher.refine()
+    finally:
+      for conn, process, _ in workers:
+        conn.close()
+        process.join(timeout=1)
+        if process.is_alive():
+          process.terminate()
+
+  def __receive(
+    self,
+    workers: typing.List[typing.Tuple[
+      multiprocessing.connection.Connection,
+      multiprocessing.Process,
+      typing.List[int],
+    ]],
+  ) -> typing.Iterator[typing.Tuple[int, typing.Any]]:
+    # Each worker sends one message per page. Only wait on workers that still owe messages
+    # since a finished worker may close its end of the pipe
+    num_remaining = { conn: len(worker_page_numbers) for conn, _, worker_page_numbers in workers }
+    while len(num_remaining) > 0:
+      for conn in multiprocessing.connection.wait(list(num_remaining.keys())):
+        conn = typing.cast(multiprocessing.connection.Connection, conn)
+        message: WorkerMessage = conn.recv()
+        kind, page_number, payload, processing_time = message
+        if kind == "error":
+          raise RuntimeError("Pdf worker failed: {0}".format(payload))
+        self.processing_time += processing_time
+        num_remaining[conn] -= 1
+        if num_remaining[conn] == 0:
+          del num_remaining[conn]
+        yield page_number, payload
+
+  def get_results(self) -> ltjson.PdfSummaryJson:
+    return votesearch.merge_results_deltas(deltas=self.deltas)
 
 def process_pdf(
   data_provider: dataprovider.DataProvider,
   pdfkey:str,
   pdfdata: bytes,
-  page_numbers: typing.Union[None, typing.List[int]] = None
+  page_numbers: typing.Union[None, typing.List[int]] = None,
+  num_workers: int = 1,
+  page_cache: typing.Union[None, pagecache.PageCache] = None,
+  checkpoint_interval_s: float = -1,
 ):
+  '''
+  checkpoint_interval_s >= 0 resumes from and writes checkpoints when processing serially
+  '''
   pdfdata_io = io.BytesIO(initial_bytes=pdfdata)
   num_pages = get_pdf_num_pages(pdfdata_io=pdfdata_io)
-  num_steps_total = num_pages + 1
+  if page_numbers is None:
+    page_numbers = list(range(num_pages))
+  if page_cache is None:
+    page_cache = pagecache.NullPageCache()
+  processor: typing.Union[PdfProcessor, ParallelPdfProcessor]
+  if num_workers > 1:
+    if checkpoint_interval_s >= 0:
+      print("Warning: checkpoints are not supported with {0} workers. Not checkpointing".format(num_workers))
+      checkpoint_interval_s = -1
+    processor = ParallelPdfProcessor(
+      pdfdata=pdfdata,
+      page_numbers=page_numbers,
+      num_workers=num_workers,
+      page_cache=page_cache,
+      data_provider=data_provider,
+    )
+  else:
+    processor = PdfProcessor(
+      pdfdata=pdfdata,
+      page_numbers=page_numbers,
+      page_cache=page_cache,
+      data_provider=data_provider,
+      pdfkey=pdfkey,
+      checkpoint_interval_s=checkpoint_interval_s,
+    )
+  num_steps_total = processor.num_steps + 1
   data_provider.write_processpdf_start(pdfkey=pdfkey, num_steps_total=num_steps_total)
-  pages_gen = pdfminer.high_level.extract_pages(pdf_file=pdfdata_io, page_numbers=page_numbers)
-  processor = PdfProcessor(pages_gen=pages_gen, data_provider=data_provider)
   t0 = time.time()
   t_writing = 0.
-  for idx, _ in enumerate(processor.process_page()):
+  # Deltas restored from a checkpoint were written by the previous invocation
+  num_deltas_written = len(processor.deltas)
+  for idx, _ in enumerate(processor.process_page(), start=processor.num_steps_done):
     td0 = time.time()
+    for delta in processor.deltas[num_deltas_written:]:
+      if not votesearch.results_delta_is_empty(delta=delta):
+        data_provider.write_processpdf_delta(pdfkey=pdfkey, curr_step=idx+1, delta=delta)
+    num_deltas_written = len(processor.deltas)
     data_provider.write_processpdf_progress(
       pdfkey=pdfkey,
       curr_step=idx+1,
@@ -85,5 +497,9 @@ def process_pdf(
     "elem processing took:", processor.processing_time,
     "Writing progress took:", t_writing
   )
+  if checkpoint_interval_s >= 0:
+    data_provider.delete_processpdf_checkpoint(pdfkey=pdfkey)
+  # Queued deltas are still being encoded
+  data_provider.flush_processpdf_deltas()
   results = processor.get_results()
   return results
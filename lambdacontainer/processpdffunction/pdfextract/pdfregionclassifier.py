@@ -3,9 +3,9 @@ import collections
 import enum
 import typing
 
-import rtree
+import numpy as np
 
-from . import ltjson, pdfelemtransforms
+from . import compiled_utils, ltjson, strtree
 
 # Order pdf elements from left to right top down
 # For rectangles we want the png image and the fill coordinates mapping back to the shape
@@ -25,11 +25,22 @@ from . import ltjson, pdfelemtransforms
 class PdfRegion(enum.Enum):
   SCHEDULE = 1
   FLOOR_PLAN = 2
+  TITLE_BLOCK = 3
+
+# Score columns of get_classification_scores
+REGION_ORDER: typing.List[PdfRegion] = list(PdfRegion)
+REGION_COLUMNS: typing.Dict[int, int] = { region.value: col for col, region in enumerate(REGION_ORDER) }
 
 class PdfRegionClassifier():
   def __init__(self) -> None:
-    self.box_classifier = rtree.index.Index()
-    self.data: typing.List[typing.Tuple[PdfRegion, float,]] = []
+    self.bboxes: typing.List[ltjson.BboxType] = []
+    self.regions: typing.List[int] = []
+    self.scores: typing.List[float] = []
+    # Rebuilt from the lists on the first query after a region is added
+    self.box_classifier: typing.Union[None, strtree.STRTree] = None
+    self.bbox_array = np.zeros((0, 4), dtype=np.float64)
+    self.region_array = np.zeros((0,), dtype=np.int64)
+    self.score_array = np.zeros((0,), dtype=np.float64)
 
   def classify_region(
     self,
@@ -37,22 +48,57 @@ class PdfRegionClassifier():
     region: PdfRegion,
     score: float
   ) -> None:
-    idx = len(self.data)
-    self.box_classifier.insert(idx, bbox)
-    self.data.append((region, score))
+    self.bboxes.append(bbox)
+    self.regions.append(REGION_COLUMNS[region.value])
+    self.scores.append(score)
+    self.box_classifier = None
 
   def get_classification(
     self,
     bbox: ltjson.BboxType,
   ) -> typing.DefaultDict[PdfRegion, float]:
-    out: typing.DefaultDict[PdfRegion, float] = collections.defaultdict(float)
-    matches = self.box_classifier.intersection(bbox, objects="raw") # TODO: raw is much slower than saving data ourselves
-    if matches is None:
-      return out
-    for item in list(matches):
-      region, score = self.data[typing.cast(int, item.id)]
-      out[region] += score * pdfelemtransforms.bbox_intersection_area(
-        a=bbox,
-        b=typing.cast(ltjson.BboxType, item.bbox)
-      )
+    return self.get_classifications(bboxes=np.array([bbox], dtype=np.float64))[0]
+
+  def get_classifications(
+    self,
+    bboxes: np.ndarray,
+  ) -> typing.List[typing.DefaultDict[PdfRegion, float]]:
+    '''
+    get_classification for each row of bboxes
+    '''
+    scores, has_region = self.get_classification_scores(bboxes=bboxes)
+    out: typing.List[typing.DefaultDict[PdfRegion, float]] = []
+    for bbox_scores, bbox_has_region in zip(scores.tolist(), has_region.tolist()):
+      classification: typing.DefaultDict[PdfRegion, float] = collections.defaultdict(float)
+      for col, region in enumerate(REGION_ORDER):
+        if bbox_has_region[col]:
+          classification[region] = bbox_scores[col]
+      out.append(classification)
     return out
+
+  def get_classification_scores(
+    self,
+    bboxes: np.ndarray,
+  ) -> typing.Tuple[np.ndarray, np.ndarray]:
+    '''
+    (N, len(REGION_ORDER)) score weighted by intersection area of each region for each bbox
+    and whether any region of that kind intersects the bbox
+    '''
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape((-1, 4))
+    scores = np.zeros((bboxes.shape[0], len(REGION_ORDER)), dtype=np.float64)
+    has_region = np.zeros(scores.shape, dtype=np.bool_)
+    offsets, region_idxes = self.__get_box_classifier().intersection_many(bboxes=bboxes)
+    bbox_idxes = np.repeat(np.arange(bboxes.shape[0]), np.diff(offsets))
+    cols = self.region_array[region_idxes]
+    areas = compiled_utils.bbox_pair_intersection_areas(a=bboxes[bbox_idxes], b=self.bbox_array[region_idxes])
+    np.add.at(scores, (bbox_idxes, cols), self.score_array[region_idxes] * areas)
+    has_region[bbox_idxes, cols] = True
+    return scores, has_region
+
+  def __get_box_classifier(self) -> strtree.STRTree:
+    if self.box_classifier is None:
+      self.bbox_array = np.array(self.bboxes, dtype=np.float64).reshape((-1, 4))
+      self.region_array = np.array(self.regions, dtype=np.int64)
+      self.score_array = np.array(self.scores, dtype=np.float64)
+      self.box_classifier = strtree.STRTree(bboxes=self.bbox_array)
+    return self.box_classifier
@@ -0,0 +1,258 @@
+import typing
+
+import numpy as np
+
+from . import compiled_utils, strtree
+
+# Planar graph of a page's lines with every line split where another line crosses it
+# Vertices and edges are ints in flat arrays so shape search can walk the graph
+# without hashing points or ClassificationNodes
+
+# Endpoints and crossings in the same grid cell of this size are one vertex
+SNAP_TOLERANCE = 0.01
+
+class PlanarGraph:
+  def __init__(
+    self,
+    vertices: np.ndarray,
+    edges: np.ndarray,
+    edge_line_idxes: np.ndarray,
+    offsets: np.ndarray,
+    neighbors: np.ndarray,
+    neighbor_edges: np.ndarray,
+    intersection_pts: np.ndarray,
+    intersection_line_idxes: np.ndarray,
+  ) -> None:
+    # (V,2) x, y of each vertex
+    self.vertices = vertices
+    # (E,2) vertex idxes of each split segment with the smaller idx first
+    self.edges = edges
+    # (E,) line each segment was split from
+    self.edge_line_idxes = edge_line_idxes
+    # CSR adjacency. Vertex v's neighbors are neighbors[offsets[v]:offsets[v+1]]
+    # through the edges neighbor_edges[offsets[v]:offsets[v+1]]
+    self.offsets = offsets
+    self.neighbors = neighbors
+    self.neighbor_edges = neighbor_edges
+    # (K,2) unsnapped crossing of each pair of lines in intersection_line_idxes (K,2)
+    self.intersection_pts = intersection_pts
+    self.intersection_line_idxes = intersection_line_idxes
+
+  @property
+  def num_vertices(self) -> int:
+    return self.vertices.shape[0]
+
+  @property
+  def num_edges(self) -> int:
+    return self.edges.shape[0]
+
+  def get_degrees(self) -> np.ndarray:
+    return np.diff(self.offsets)
+
+  def get_neighbors(self, vertex_idx: int) -> typing.Tuple[np.ndarray, np.ndarray]:
+    start, end = self.offsets[vertex_idx], self.offsets[vertex_idx + 1]
+    return self.neighbors[start:end], self.neighbor_edges[start:end]
+
+def get_line_bboxes(lines: np.ndarray) -> np.ndarray:
+  return np.stack([
+    np.minimum(lines[:, 0], lines[:, 2]),
+    np.minimum(lines[:, 1], lines[:, 3]),
+    np.maximum(lines[:, 0], lines[:, 2]),
+    np.maximum(lines[:, 1], lines[:, 3]),
+  ], axis=1).reshape((-1, 4))
+
+def find_line_intersections(
+  lines: np.ndarray,
+  bboxes: np.ndarray,
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+  '''
+  path_utils.line_intersection of every pair of lines whose bboxes touch
+  Returns the crossing points (K,2) and the pair of line idxes (K,2) with the smaller idx first
+  '''
+  tree = strtree.STRTree(bboxes=bboxes)
+  offsets, other_idxes = tree.intersection_many(bboxes=bboxes)
+  line_idxes = np.repeat(np.arange(lines.shape[0], dtype=np.int64), np.diff(offsets))
+  # The crossing is the same for either order so each pair is checked once
+  is_first = line_idxes < other_idxes
+  pairs = np.stack([line_idxes[is_first], other_idxes[is_first]], axis=1).reshape((-1, 2))
+  pts = compiled_utils.line_pair_intersections(lines1=lines[pairs[:, 0]], lines2=lines[pairs[:, 1]])
+  found = pts[:, 0] != -1.
+  return pts[found].reshape((-1, 2)), pairs[found]
+
+def get_line_positions(lines: np.ndarray, line_idxes: np.ndarray, pts: np.ndarray) -> np.ndarray:
+  '''
+  How far along its line each point is from 0 at the start to 1 at the end
+  '''
+  starts = lines[line_idxes, 0:2]
+  directions = lines[line_idxes, 2:4] - starts
+  lengths_sq = (directions ** 2).sum(axis=1)
+  return ((pts - starts) * directions).sum(axis=1) / np.maximum(lengths_sq, 1e-12)
+
+def snap_points(pts: np.ndarray, snap: float) -> typing.Tuple[np.ndarray, np.ndarray]:
+  '''
+  Returns the vertex (V,2) at the mean of each grid cell's points and each point's vertex idx
+  '''
+  cells = np.round(pts / snap).astype(np.int64)
+  _, vertex_idxes, counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+  vertex_idxes = vertex_idxes.reshape((-1,))
+  vertices = np.zeros((counts.shape[0], 2), dtype=np.float64)
+  np.add.at(vertices, vertex_idxes, pts)
+  return vertices / counts[:, np.newaxis], vertex_idxes
+
+def get_adjacency(edges: np.ndarray, num_vertices: int) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+  '''
+  CSR offsets, neighbors and neighbor edges with each vertex's neighbors in ascending order
+  '''
+  edge_idxes = np.arange(edges.shape[0], dtype=np.int64)
+  sources = np.concatenate([edges[:, 0], edges[:, 1]])
+  targets = np.concatenate([edges[:, 1], edges[:, 0]])
+  order = np.lexsort((targets, sources))
+  offsets = np.concatenate([[0], np.cumsum(np.bincount(sources, minlength=num_vertices))]).astype(np.int64)
+  return offsets, targets[order], np.concatenate([edge_idxes, edge_idxes])[order]
+
+def build_planar_graph(
+  lines: np.ndarray,
+  bboxes: typing.Union[None, np.ndarray] = None,
+  snap: float = SNAP_TOLERANCE,
+  split_at_crossings: bool = True,
+) -> PlanarGraph:
+  '''
+  lines: (N,4) of x0, y0, x1, y1 end points
+  bboxes: (N,4) to find crossing candidates with. Defaults to each line's bbox
+  split_at_crossings: False only joins lines at shared end points and keeps one edge per line
+  but still finds intersection_pts
+  '''
+  lines = np.asarray(lines, dtype=np.float64).reshape((-1, 4))
+  bboxes = get_line_bboxes(lines=lines) if bboxes is None else np.asarray(bboxes, dtype=np.float64).reshape((-1, 4))
+  intersection_pts, intersection_line_idxes = find_line_intersections(lines=lines, bboxes=bboxes)
+  split_pts = intersection_pts if split_at_crossings else np.zeros((0, 2), dtype=np.float64)
+  split_line_idxes = intersection_line_idxes if split_at_crossings else np.zeros((0, 2), dtype=np.int64)
+
+  # Every line's end points and the crossings on it
+  num_lines = lines.shape[0]
+  line_range = np.arange(num_lines, dtype=np.int64)
+  pt_line_idxes = np.concatenate([
+    line_range,
+    line_range,
+    split_line_idxes[:, 0],
+    split_line_idxes[:, 1],
+  ])
+  pts = np.concatenate([
+    lines[:, 0:2],
+    lines[:, 2:4],
+    split_pts,
+    split_pts,
+  ]).reshape((-1, 2))
+  pt_positions = np.concatenate([
+    np.zeros((num_lines,), dtype=np.float64),
+    np.ones((num_lines,), dtype=np.float64),
+    get_line_positions(lines=lines, line_idxes=split_line_idxes[:, 0], pts=split_pts),
+    get_line_positions(lines=lines, line_idxes=split_line_idxes[:, 1], pts=split_pts),
+  ])
+  vertices, pt_vertex_idxes = snap_points(pts=pts, snap=snap)
+
+  # Consecutive points along the same line are a segment unless they snapped together
+  order = np.lexsort((pt_positions, pt_line_idxes))
+  sorted_line_idxes = pt_line_idxes[order]
+  sorted_vertex_idxes = pt_vertex_idxes[order]
+  is_segment = (sorted_line_idxes[1:] == sorted_line_idxes[:-1]) & \
+    (sorted_vertex_idxes[1:] != sorted_vertex_idxes[:-1])
+  starts = sorted_vertex_idxes[:-1][is_segment]
+  ends = sorted_vertex_idxes[1:][is_segment]
+  edges = np.stack([np.minimum(starts, ends), np.maximum(starts, ends)], axis=1).reshape((-1, 2))
+  # Overlapping lines give the same segment more than once. Keep the first line's
+  _, first_idxes = np.unique(edges, axis=0, return_index=True)
+  first_idxes = np.sort(first_idxes)
+  edges = edges[first_idxes]
+  edge_line_idxes = sorted_line_idxes[:-1][is_segment][first_idxes]
+
+  offsets, neighbors, neighbor_edges = get_adjacency(edges=edges, num_vertices=vertices.shape[0])
+  return PlanarGraph(
+    vertices=vertices,
+    edges=edges,
+    edge_line_idxes=edge_line_idxes,
+    offsets=offsets,
+    neighbors=neighbors,
+    neighbor_edges=neighbor_edges,
+    intersection_pts=intersection_pts,
+    intersection_line_idxes=intersection_line_idxes,
+  )
+
+# Faces are walked over half edges. Half edge 2e goes from edges[e, 0] to edges[e, 1]
+# and half edge 2e+1 goes back
+
+def get_half_edge_ends(graph: PlanarGraph) -> typing.Tuple[np.ndarray, np.ndarray]:
+  return graph.edges.reshape((-1,)), graph.edges[:, ::-1].reshape((-1,))
+
+def get_next_half_edges(graph: PlanarGraph) -> np.ndarray:
+  '''
+  The half edge after each half edge going around the face on its left
+  '''
+  sources, targets = get_half_edge_ends(graph=graph)
+  directions = graph.vertices[targets] - graph.vertices[sources]
+  angles = np.arctan2(directions[:, 1], directions[:, 0])
+  # Counter clockwise around each vertex. Same vertex ranges as graph.offsets
+  order = np.lexsort((angles, sources))
+  ranks = np.empty((order.shape[0],), dtype=np.int64)
+  ranks[order] = np.arange(order.shape[0]) - graph.offsets[sources[order]]
+  # Arriving at a vertex, leave by the edge just clockwise of the way back which is the sharpest left turn
+  twins = np.arange(order.shape[0]) ^ 1
+  starts = graph.offsets[targets]
+  degrees = graph.offsets[targets + 1] - starts
+  return order[starts + (ranks[twins] - 1) % degrees]
+
+def get_faces(graph: PlanarGraph) -> strtree.CSRResult:
+  '''
+  Every face boundary as a cycle of half edges. Face f is half_edges[offsets[f]:offsets[f+1]]
+  Bounded faces go counter clockwise and the outside of each connected part goes clockwise
+  '''
+  next_half_edges = get_next_half_edges(graph=graph).tolist()
+  is_visited = [False] * len(next_half_edges)
+  half_edges: typing.List[int] = []
+  offsets = [0]
+  for start in range(len(next_half_edges)):
+    half_edge = start
+    while not is_visited[half_edge]:
+      is_visited[half_edge] = True
+      half_edges.append(half_edge)
+      half_edge = next_half_edges[half_edge]
+    if len(half_edges) > offsets[-1]:
+      offsets.append(len(half_edges))
+  return np.array(offsets, dtype=np.int64), np.array(half_edges, dtype=np.int64)
+
+def get_face_areas(graph: PlanarGraph, offsets: np.ndarray, half_edges: np.ndarray) -> np.ndarray:
+  '''
+  Signed shoelace area of each face. Positive for bounded faces
+  '''
+  if half_edges.shape[0] == 0:
+    return np.zeros((0,), dtype=np.float64)
+  sources, targets = get_half_edge_ends(graph=graph)
+  starts = graph.vertices[sources[half_edges]]
+  ends = graph.vertices[targets[half_edges]]
+  crosses = starts[:, 0] * ends[:, 1] - ends[:, 0] * starts[:, 1]
+  return np.add.reduceat(crosses, offsets[:-1]) / 2
+
+def get_bounded_faces(graph: PlanarGraph) -> typing.List[np.ndarray]:
+  '''
+  Half edges of each bounded face that doesn't go along both sides of an edge
+  '''
+  offsets, half_edges = get_faces(graph=graph)
+  areas = get_face_areas(graph=graph, offsets=offsets, half_edges=half_edges)
+  out: typing.List[np.ndarray] = []
+  for face_idx in np.flatnonzero(areas > 0).tolist():
+    face = half_edges[offsets[face_idx]:offsets[face_idx + 1]]
+    if np.unique(face // 2).shape[0] == face.shape[0]:
+      out.append(face)
+  return out
+
+def get_face_lines(graph: PlanarGraph, face: np.ndarray) -> typing.List[typing.Tuple[float, float, float, float]]:
+  '''
+  x0, y0, x1, y1 of each half edge in the order they go around the face
+  '''
+  sources, targets = get_half_edge_ends(graph=graph)
+  return [
+    (x0, y0, x1, y1) for (x0, y0), (x1, y1) in zip(
+      graph.vertices[sources[face]].tolist(),
+      graph.vertices[targets[face]].tolist(),
+    )
+  ]
@@ -0,0 +1,167 @@
+import math
+import typing
+
+import numpy as np
+
+# Static R-tree bulk loaded with Sort-Tile-Recursive packing from an (N,4) array
+# For indexes that don't change after they are built. Use rtree for incremental inserts
+#
+# Matches rtree's inclusive predicates on the raw coordinates so boxes with
+# x0 > x1 or y0 > y1 are found exactly when rtree would find them
+
+NODE_CAPACITY = 16
+
+CSRResult = typing.Tuple[np.ndarray, np.ndarray] # offsets (Q+1,), ids
+
+class STRLevel:
+  def __init__(
+    self,
+    mins: np.ndarray,
+    maxs: np.ndarray,
+    child_starts: np.ndarray,
+    child_ends: np.ndarray,
+  ) -> None:
+    # Column wise min and max of every box under each node
+    self.mins = mins
+    self.maxs = maxs
+    # Range of each node's children in the level below or the items for the leaf level
+    self.child_starts = child_starts
+    self.child_ends = child_ends
+
+def get_str_order(centers: np.ndarray, node_capacity: int) -> np.ndarray:
+  '''
+  Sort into vertical slices by x then by y within each slice
+  '''
+  num = centers.shape[0]
+  num_nodes = math.ceil(num / node_capacity)
+  num_slices = math.ceil(math.sqrt(num_nodes))
+  slice_size = num_slices * node_capacity
+  slice_idxes = np.empty((num,), dtype=np.int64)
+  slice_idxes[np.argsort(centers[:, 0], kind="stable")] = np.arange(num) // slice_size
+  return np.lexsort((centers[:, 1], slice_idxes))
+
+def expand_children(
+  query_idxes: np.ndarray,
+  node_idxes: np.ndarray,
+  level: STRLevel,
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+  starts = level.child_starts[node_idxes]
+  counts = level.child_ends[node_idxes] - starts
+  total = int(counts.sum())
+  if total == 0:
+    return np.zeros((0,), dtype=np.int64), np.zeros((0,), dtype=np.int64)
+  # Each node's children are starts[k], starts[k]+1, ... starts[k]+counts[k]-1
+  group_offsets = np.cumsum(counts) - counts
+  child_idxes = np.repeat(starts - group_offsets, counts) + np.arange(total)
+  return np.repeat(query_idxes, counts), child_idxes
+
+class STRTree:
+  def __init__(self, bboxes: np.ndarray, node_capacity: int = NODE_CAPACITY) -> None:
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape((-1, 4))
+    self.node_capacity = node_capacity
+    # Top level first
+    self.levels: typing.List[STRLevel] = []
+    if bboxes.shape[0] == 0:
+      self.item_ids = np.zeros((0,), dtype=np.int64)
+      self.item_bboxes = bboxes
+      return
+    centers = np.stack([
+      (bboxes[:, 0] + bboxes[:, 2]) / 2,
+      (bboxes[:, 1] + bboxes[:, 3]) / 2,
+    ], axis=1)
+    self.item_ids = get_str_order(centers=centers, node_capacity=node_capacity)
+    self.item_bboxes = np.ascontiguousarray(bboxes[self.item_ids])
+    child_mins = self.item_bboxes
+    child_maxs = self.item_bboxes
+    num_children = self.item_ids.shape[0]
+    while True:
+      child_starts = np.arange(0, num_children, node_capacity, dtype=np.int64)
+      child_ends = np.minimum(child_starts + node_capacity, num_children)
+      level = STRLevel(
+        mins=np.minimum.reduceat(child_mins, child_starts, axis=0),
+        maxs=np.maximum.reduceat(child_maxs, child_starts, axis=0),
+        child_starts=child_starts,
+        child_ends=child_ends,
+      )
+      num_nodes = child_starts.shape[0]
+      if num_nodes <= node_capacity:
+        self.levels.insert(0, level)
+        break
+      # Pack this level's nodes under the next level up
+      level_centers = np.stack([
+        (level.mins[:, 0] + level.maxs[:, 2]) / 2,
+        (level.mins[:, 1] + level.maxs[:, 3]) / 2,
+      ], axis=1)
+      order = get_str_order(centers=level_centers, node_capacity=node_capacity)
+      level = STRLevel(
+        mins=level.mins[order],
+        maxs=level.maxs[order],
+        child_starts=level.child_starts[order],
+        child_ends=level.child_ends[order],
+      )
+      self.levels.insert(0, level)
+      child_mins = level.mins
+      child_maxs = level.maxs
+      num_children = num_nodes
+
+  def __len__(self) -> int:
+    return self.item_ids.shape[0]
+
+  def intersection(self, bbox: typing.Sequence[float]) -> np.ndarray:
+    '''
+    Sorted ids of the boxes that intersect or touch bbox
+    '''
+    _, ids = self.intersection_many(bboxes=np.array([bbox], dtype=np.float64))
+    return ids
+
+  def contains(self, bbox: typing.Sequence[float]) -> np.ndarray:
+    '''
+    Sorted ids of the boxes inside bbox
+    '''
+    _, ids = self.contains_many(bboxes=np.array([bbox], dtype=np.float64))
+    return ids
+
+  def intersection_many(self, bboxes: np.ndarray) -> CSRResult:
+    '''
+    intersection for each row of bboxes. Query q's ids are ids[offsets[q]:offsets[q+1]]
+    '''
+    return self.__query_many(queries=bboxes, is_contains=False)
+
+  def contains_many(self, bboxes: np.ndarray) -> CSRResult:
+    return self.__query_many(queries=bboxes, is_contains=True)
+
+  def __query_many(self, queries: np.ndarray, is_contains: bool) -> CSRResult:
+    queries = np.asarray(queries, dtype=np.float64).reshape((-1, 4))
+    num_queries = queries.shape[0]
+    if num_queries == 0 or len(self) == 0:
+      return np.zeros((num_queries + 1,), dtype=np.int64), np.zeros((0,), dtype=np.int64)
+    num_top = self.levels[0].mins.shape[0]
+    query_idxes = np.repeat(np.arange(num_queries, dtype=np.int64), num_top)
+    node_idxes = np.tile(np.arange(num_top, dtype=np.int64), num_queries)
+    for level in self.levels:
+      q = queries[query_idxes]
+      if is_contains:
+        # Some box under the node could start after the query start and end before the query end
+        keep = (level.maxs[node_idxes, 0] >= q[:, 0]) & (level.maxs[node_idxes, 1] >= q[:, 1]) & \
+          (level.mins[node_idxes, 2] <= q[:, 2]) & (level.mins[node_idxes, 3] <= q[:, 3])
+      else:
+        keep = (level.mins[node_idxes, 0] <= q[:, 2]) & (level.mins[node_idxes, 1] <= q[:, 3]) & \
+          (level.maxs[node_idxes, 2] >= q[:, 0]) & (level.maxs[node_idxes, 3] >= q[:, 1])
+      query_idxes, node_idxes = expand_children(
+        query_idxes=query_idxes[keep],
+        node_idxes=node_idxes[keep],
+        level=level,
+      )
+    q = queries[query_idxes]
+    items = self.item_bboxes[node_idxes]
+    if is_contains:
+      keep = (items[:, 0] >= q[:, 0]) & (items[:, 1] >= q[:, 1]) & \
+        (items[:, 2] <= q[:, 2]) & (items[:, 3] <= q[:, 3])
+    else:
+      keep = (items[:, 0] <= q[:, 2]) & (items[:, 1] <= q[:, 3]) & \
+        (items[:, 2] >= q[:, 0]) & (items[:, 3] >= q[:, 1])
+    query_idxes = query_idxes[keep]
+    ids = self.item_ids[node_idxes[keep]]
+    order = np.lexsort((ids, query_idxes))
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(query_idxes, minlength=num_queries))]).astype(np.int64)
+    return offsets, ids[order]
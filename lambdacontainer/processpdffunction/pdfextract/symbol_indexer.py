@@ -228,7 +228,6 @@ class ShapeManager:
 
     circles, hexagons, intersection_pts = linejoiner.identify_from_lines(
       nodes=[node for node in layer if node.line is not None],
-      node_manager=self.node_manager,
     )
     circle_parents: typing.List[pdftypes.ClassificationNode] = []
     for circle, nodes in circles:
@@ -0,0 +1,275 @@
+import argparse
+import functools
+import hashlib
+import json
+import os
+import typing
+
+import numpy as np
+
+from . import pdfindexer
+from .ltjson import LTJson, BboxType
+
+# Symbol templates stored already flattened so shape matching doesn't rebuild LTJson
+# python -m pdfextract.symbol_library symbols_michael_smith.json symbols_michael_smith.symbols
+#
+# File layout: LIBRARY_MAGIC, uint64 header length, json header then each array
+# aligned to ARRAY_ALIGNMENT so np.memmap can map them without copying
+
+LIBRARY_MAGIC = b"PDFSYMB1"
+ARRAY_ALIGNMENT = 64
+DEFAULT_SYMBOLS_JSON_PATH = "./symbols_michael_smith.json"
+DEFAULT_LIBRARY_PATH = "./symbols_michael_smith.symbols"
+
+class SymbolTemplate:
+  '''
+  Stands in for the LTJson it was made from when shape matching
+  '''
+  __slots__ = ("key", "bbox", "width", "height", "h_w_ratio", "signature", "zeroed_lines")
+
+  def __init__(
+    self,
+    key: str,
+    bbox: BboxType,
+    width: float,
+    height: float,
+    h_w_ratio: float,
+    signature: int,
+    zeroed_lines: np.ndarray,
+  ) -> None:
+    self.key = key
+    self.bbox = bbox
+    self.width = width
+    self.height = height
+    self.h_w_ratio = h_w_ratio
+    self.signature = signature
+    # (N,4) lines moved so their min x and min y is 0
+    self.zeroed_lines = zeroed_lines
+
+  def get_zeroed_path_lines_array(self) -> np.ndarray:
+    return self.zeroed_lines
+
+  def as_dict(self) -> typing.Dict[str, typing.Any]:
+    return {
+      "key": self.key,
+      "bbox": self.bbox,
+      "width": self.width,
+      "height": self.height,
+      "zeroedLines": self.zeroed_lines.tolist(),
+    }
+
+  @staticmethod
+  def from_dict(template_json: typing.Dict[str, typing.Any]) -> "SymbolTemplate":
+    x0, y0, x1, y1 = template_json["bbox"]
+    return make_template(
+      key=template_json["key"],
+      bbox=(x0, y0, x1, y1),
+      width=template_json["width"],
+      height=template_json["height"],
+      zeroed_lines=np.array(template_json["zeroedLines"], dtype=np.float64).reshape((-1, 4)),
+    )
+
+def get_signature(width: float, height: float, zeroed_lines: np.ndarray) -> int:
+  '''
+  64 bit hash of the rounded shape so identical templates are only stored once
+  '''
+  digest = hashlib.blake2b(digest_size=8)
+  digest.update(np.round(np.array([width, height], dtype=np.float64), 3).tobytes())
+  digest.update(np.round(zeroed_lines.astype(np.float64), 3).tobytes())
+  return int.from_bytes(digest.digest(), "little")
+
+def make_template(
+  key: str,
+  bbox: BboxType,
+  width: float,
+  height: float,
+  zeroed_lines: np.ndarray,
+) -> SymbolTemplate:
+  return SymbolTemplate(
+    key=key,
+    bbox=bbox,
+    width=width,
+    height=height,
+    h_w_ratio=pdfindexer.get_h_w_ratio(width=width, height=height),
+    signature=get_signature(width=width, height=height, zeroed_lines=zeroed_lines),
+    zeroed_lines=zeroed_lines,
+  )
+
+def make_templates(key: str, elems: typing.List[LTJson]) -> typing.List[SymbolTemplate]:
+  out: typing.List[SymbolTemplate] = []
+  for elem in elems:
+    x0, y0, x1, y1 = elem.bbox
+    out.append(make_template(
+      key=key,
+      bbox=(x0, y0, x1, y1),
+      width=elem.width,
+      height=elem.height,
+      # Copy out of the page so a template doesn't keep the whole page alive
+      zeroed_lines=elem.get_zeroed_path_lines_array().copy(),
+    ))
+  return out
+
+class SymbolLibrary:
+  '''
+  Templates grouped by key. Symbols learned at runtime are added with add_symbol
+  and identical shapes share one template
+  '''
+  def __init__(self) -> None:
+    self.symbols: typing.Dict[str, typing.List[SymbolTemplate]] = {}
+    self.signature_lookup: typing.Dict[int, typing.List[SymbolTemplate]] = {}
+
+  def __getitem__(self, key: str) -> typing.List[SymbolTemplate]:
+    return self.symbols[key]
+
+  def __contains__(self, key: str) -> bool:
+    return key in self.symbols
+
+  def keys(self) -> typing.List[str]:
+    return list(self.symbols.keys())
+
+  def add_template(self, template: SymbolTemplate) -> SymbolTemplate:
+    existing = self.__find_template(template=template)
+    if existing is None:
+      self.signature_lookup.setdefault(template.signature, []).append(template)
+      existing = template
+    self.symbols.setdefault(template.key, []).append(existing)
+    return existing
+
+  def add_symbol(self, key: str, elem: LTJson) -> SymbolTemplate:
+    return self.add_symbols(key=key, elems=[elem])[0]
+
+  def add_symbols(self, key: str, elems: typing.List[LTJson]) -> typing.List[SymbolTemplate]:
+    return [self.add_template(template=template) for template in make_templates(key=key, elems=elems)]
+
+  def __find_template(self, template: SymbolTemplate) -> typing.Union[None, SymbolTemplate]:
+    for existing in self.signature_lookup.get(template.signature, []):
+      if existing.width == template.width and existing.height == template.height and \
+        existing.bbox == template.bbox and \
+        np.array_equal(existing.zeroed_lines, template.zeroed_lines):
+        return existing
+    return None
+
+def read_symbols_from_json(path: str) -> typing.Dict[str, typing.List[LTJson]]:
+  with open(path, "r", encoding="utf-8") as f:
+    symbols_dicts = json.loads(f.read())
+  symbols: typing.Dict[str, typing.List[LTJson]] = dict()
+  for key, serialized_elems in symbols_dicts.items():
+    elems: typing.List[LTJson] = []
+    for serialized_json in serialized_elems:
+      elems.append(LTJson(serialized_json=serialized_json))
+    symbols[key] = elems
+  return symbols
+
+def make_library_from_json(path: str) -> SymbolLibrary:
+  library = SymbolLibrary()
+  for key, elems in read_symbols_from_json(path=path).items():
+    library.add_symbols(key=key, elems=elems)
+  return library
+
+def write_library(library: SymbolLibrary, path: str):
+  keys = library.keys()
+  templates = [template for key in keys for template in library[key]]
+  key_offsets = np.cumsum([0] + [len(library[key]) for key in keys]).tolist()
+  line_counts = [template.zeroed_lines.shape[0] for template in templates]
+  arrays: typing.Dict[str, np.ndarray] = {
+    "lines": np.concatenate(
+      [template.zeroed_lines for template in templates] + [np.zeros((0, 4), dtype=np.float64)]
+    ).astype(np.float64).reshape((-1, 4)),
+    "line_offsets": np.cumsum([0] + line_counts).astype(np.int64),
+    "bboxes": np.array([template.bbox for template in templates], dtype=np.float64).reshape((-1, 4)),
+    "sizes": np.array([(template.width, template.height) for template in templates], dtype=np.float64).reshape((-1, 2)),
+    "signatures": np.array([template.signature for template in templates], dtype=np.uint64),
+  }
+  header: typing.Dict[str, typing.Any] = { "keys": keys, "keyOffsets": key_offsets, "arrays": {} }
+  # Offsets depend on the header length so grow the header until it stops changing
+  header_bytes = b""
+  while True:
+    offset = align(len(LIBRARY_MAGIC) + 8 + len(header_bytes))
+    for name, array in arrays.items():
+      header["arrays"][name] = {
+        "dtype": array.dtype.str,
+        "shape": list(array.shape),
+        "offset": offset,
+      }
+      offset = align(offset + array.nbytes)
+    new_header_bytes = json.dumps(header).encode("utf-8")
+    done = len(new_header_bytes) == len(header_bytes)
+    header_bytes = new_header_bytes
+    if done:
+      break
+  tmp_path = "{0}.{1}.tmp".format(path, os.getpid())
+  with open(tmp_path, "wb") as f:
+    f.write(LIBRARY_MAGIC)
+    f.write(np.array([len(header_bytes)], dtype="<u8").tobytes())
+    f.write(header_bytes)
+    for name, array in arrays.items():
+      f.write(b"\0" * (header["arrays"][name]["offset"] - f.tell()))
+      f.write(np.ascontiguousarray(array).tobytes())
+  os.replace(tmp_path, path)
+
+def load_library(path: str) -> SymbolLibrary:
+  '''
+  Templates are views into the memory mapped file
+  '''
+  with open(path, "rb") as f:
+    if f.read(len(LIBRARY_MAGIC)) != LIBRARY_MAGIC:
+      raise ValueError("Not a symbol library: {0}".format(path))
+    header_len = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+    header = json.loads(f.read(header_len).decode("utf-8"))
+  arrays: typing.Dict[str, np.ndarray] = {}
+  for name, array_header in header["arrays"].items():
+    shape = tuple(array_header["shape"])
+    dtype = np.dtype(array_header["dtype"])
+    if int(np.prod(shape)) == 0:
+      # Can't map zero bytes
+      arrays[name] = np.zeros(shape, dtype=dtype)
+    else:
+      arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=array_header["offset"], shape=shape)
+  # Plain ndarray views that still read from the mapping
+  lines = np.asarray(arrays["lines"])
+  line_offsets = arrays["line_offsets"].tolist()
+  bboxes = arrays["bboxes"].tolist()
+  sizes = arrays["sizes"].tolist()
+  signatures = arrays["signatures"].tolist()
+  library = SymbolLibrary()
+  key_offsets = header["keyOffsets"]
+  for key_idx, key in enumerate(header["keys"]):
+    for idx in range(key_offsets[key_idx], key_offsets[key_idx+1]):
+      x0, y0, x1, y1 = bboxes[idx]
+      width, height = sizes[idx]
+      library.add_template(template=SymbolTemplate(
+        key=key,
+        bbox=(x0, y0, x1, y1),
+        width=width,
+        height=height,
+        h_w_ratio=pdfindexer.get_h_w_ratio(width=width, height=height),
+        signature=signatures[idx],
+        zeroed_lines=lines[line_offsets[idx]:line_offsets[idx+1]],
+      ))
+  return library
+
+def align(offset: int) -> int:
+  return (offset + ARRAY_ALIGNMENT - 1) // ARRAY_ALIGNMENT * ARRAY_ALIGNMENT
+
+@functools.lru_cache(maxsize=None)
+def get_default_library() -> SymbolLibrary:
+  '''
+  Loaded once per process from SYMBOL_LIBRARY_PATH if it has been built otherwise from the json
+  '''
+  library_path = os.environ.get("SYMBOL_LIBRARY_PATH") or DEFAULT_LIBRARY_PATH
+  if os.path.exists(library_path):
+    try:
+      return load_library(path=library_path)
+    except Exception as e:
+      print("Failed to load symbol library:", library_path, e)
+  return make_library_from_json(path=DEFAULT_SYMBOLS_JSON_PATH)
+
+def parse_args():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("json_path", nargs="?", default=DEFAULT_SYMBOLS_JSON_PATH)
+  parser.add_argument("library_path", nargs="?", default=DEFAULT_LIBRARY_PATH)
+  return parser.parse_args()
+
+if __name__ == "__main__":
+  args = parse_args()
+  write_library(library=make_library_from_json(path=args.json_path), path=args.library_path)
@@ -0,0 +1,190 @@
+import typing
+
+import numpy as np
+
+from . import strtree
+from .ltjson import BboxType
+
+# Finds the ruled tables of a page once from its path lines
+# Horizontal and vertical lines that touch are grouped and each group
+# with at least two rows or columns of cells is a table
+
+# Thickest a ruling line can be and how far apart lines can be to still touch
+RULING_TOLERANCE = 1.
+MIN_RULING_LENGTH = 5.
+# Line coordinates closer than this are the same grid line
+GRID_SNAP = 1.
+MIN_TABLE_CELLS = 2
+
+class DetectedTable:
+  def __init__(
+    self,
+    bbox: BboxType,
+    row_ys: typing.List[float],
+    col_xs: typing.List[float],
+    col_bottoms: typing.List[float],
+    line_idxes: np.ndarray,
+  ) -> None:
+    self.bbox = bbox
+    # Grid lines top down and left to right including the outside border
+    self.row_ys = row_ys
+    self.col_xs = col_xs
+    # Lowest point of the vertical lines of each column grid line
+    self.col_bottoms = col_bottoms
+    # Into the lines the table was detected from
+    self.line_idxes = line_idxes
+
+  @property
+  def num_rows(self) -> int:
+    return len(self.row_ys) - 1
+
+  @property
+  def num_cols(self) -> int:
+    return len(self.col_xs) - 1
+
+  def get_row_bbox(self, row_idx: int) -> BboxType:
+    return (self.col_xs[0], self.row_ys[row_idx + 1], self.col_xs[-1], self.row_ys[row_idx])
+
+  def get_cell_bbox(self, row_idx: int, col_idx: int) -> BboxType:
+    return (self.col_xs[col_idx], self.row_ys[row_idx + 1], self.col_xs[col_idx + 1], self.row_ys[row_idx])
+
+  def get_divider_bottom(self) -> float:
+    '''
+    Where the first inner column grid line ends going down. Rows below it are outside the table
+    '''
+    if self.num_cols < 2:
+      return self.row_ys[-1]
+    return max(self.col_bottoms[1:-1])
+
+  def get_column_dividers(self, top: typing.Union[None, float] = None) -> typing.List[BboxType]:
+    '''
+    Inner vertical grid lines from the bottom of the table to top or the top of the table
+    '''
+    top = self.row_ys[0] if top is None else top
+    return [(x, self.row_ys[-1], x, top) for x in self.col_xs[1:-1]]
+
+class TableIndex:
+  def __init__(self, tables: typing.List[DetectedTable]) -> None:
+    self.tables = tables
+    self.tree = strtree.STRTree(
+      bboxes=np.array([table.bbox for table in tables], dtype=np.float64).reshape((-1, 4))
+    )
+
+  def __len__(self) -> int:
+    return len(self.tables)
+
+  def find_contains(self, bbox: BboxType) -> typing.List[DetectedTable]:
+    return [self.tables[idx] for idx in self.tree.contains(bbox).tolist()]
+
+  def find_intersection(self, bbox: BboxType) -> typing.List[DetectedTable]:
+    return [self.tables[idx] for idx in self.tree.intersection(bbox).tolist()]
+
+  def find_top_left_in(self, bbox: BboxType) -> typing.List[DetectedTable]:
+    '''
+    Tables whose top left corner is inside bbox
+    '''
+    x0, y0, x1, y1 = bbox
+    return [
+      table for table in self.find_intersection(bbox=bbox)
+      if table.bbox[0] >= x0 and table.bbox[0] <= x1 and table.bbox[3] >= y0 and table.bbox[3] <= y1
+    ]
+
+def get_ruling_lines(lines: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+  '''
+  lines: (N,4) of x0, y0, x1, y1 end points
+  Returns the normalized bboxes of every line and the idxes of the horizontal and vertical ones
+  '''
+  bboxes = np.stack([
+    np.minimum(lines[:, 0], lines[:, 2]),
+    np.minimum(lines[:, 1], lines[:, 3]),
+    np.maximum(lines[:, 0], lines[:, 2]),
+    np.maximum(lines[:, 1], lines[:, 3]),
+  ], axis=1).reshape((-1, 4))
+  widths = bboxes[:, 2] - bboxes[:, 0]
+  heights = bboxes[:, 3] - bboxes[:, 1]
+  horizontal_idxes = np.flatnonzero((heights <= RULING_TOLERANCE) & (widths >= MIN_RULING_LENGTH))
+  vertical_idxes = np.flatnonzero((widths <= RULING_TOLERANCE) & (heights >= MIN_RULING_LENGTH))
+  return bboxes, horizontal_idxes, vertical_idxes
+
+def snap_coordinates(coords: np.ndarray) -> typing.List[float]:
+  '''
+  Sorted coordinates with runs closer than GRID_SNAP merged into their mean
+  '''
+  coords = np.sort(coords)
+  run_starts = np.flatnonzero(np.concatenate([[True], np.diff(coords) > GRID_SNAP]))
+  return (np.add.reduceat(coords, run_starts) / np.diff(np.append(run_starts, coords.shape[0]))).tolist()
+
+def group_touching(
+  horizontal_bboxes: np.ndarray,
+  vertical_bboxes: np.ndarray,
+) -> np.ndarray:
+  '''
+  Group label for each horizontal then each vertical line
+  Lines are in the same group if they are connected by horizontal lines touching vertical lines
+  '''
+  num_horizontal = horizontal_bboxes.shape[0]
+  parents = list(range(num_horizontal + vertical_bboxes.shape[0]))
+  def find(idx: int) -> int:
+    while parents[idx] != idx:
+      parents[idx] = parents[parents[idx]]
+      idx = parents[idx]
+    return idx
+  tree = strtree.STRTree(bboxes=vertical_bboxes)
+  offsets, vertical_idxes = tree.intersection_many(bboxes=horizontal_bboxes + np.array([
+    -RULING_TOLERANCE, -RULING_TOLERANCE, RULING_TOLERANCE, RULING_TOLERANCE,
+  ]))
+  horizontal_idxes = np.repeat(np.arange(num_horizontal), np.diff(offsets))
+  for horizontal_idx, vertical_idx in zip(horizontal_idxes.tolist(), (vertical_idxes + num_horizontal).tolist()):
+    root_a = find(horizontal_idx)
+    root_b = find(vertical_idx)
+    if root_a != root_b:
+      parents[max(root_a, root_b)] = min(root_a, root_b)
+  return np.array([find(idx) for idx in range(len(parents))], dtype=np.int64)
+
+def detect_tables(lines: np.ndarray) -> TableIndex:
+  '''
+  lines: (N,4) of x0, y0, x1, y1 end points. Ex: PdfLineIndexer.lines
+  '''
+  lines = np.asarray(lines, dtype=np.float64).reshape((-1, 4))
+  bboxes, horizontal_idxes, vertical_idxes = get_ruling_lines(lines=lines)
+  if horizontal_idxes.shape[0] < 2 or vertical_idxes.shape[0] < 2:
+    return TableIndex(tables=[])
+  groups = group_touching(
+    horizontal_bboxes=bboxes[horizontal_idxes],
+    vertical_bboxes=bboxes[vertical_idxes],
+  )
+  ruling_idxes = np.concatenate([horizontal_idxes, vertical_idxes])
+  is_horizontal = np.arange(ruling_idxes.shape[0]) < horizontal_idxes.shape[0]
+  order = np.argsort(groups, kind="stable")
+  _, group_starts = np.unique(groups[order], return_index=True)
+  tables: typing.List[DetectedTable] = []
+  for members in np.split(order, group_starts[1:]):
+    member_horizontal = members[is_horizontal[members]]
+    member_vertical = members[~is_horizontal[members]]
+    if member_horizontal.shape[0] < 2 or member_vertical.shape[0] < 2:
+      continue
+    horizontal_bboxes = bboxes[ruling_idxes[member_horizontal]]
+    vertical_bboxes = bboxes[ruling_idxes[member_vertical]]
+    row_ys = snap_coordinates(coords=(horizontal_bboxes[:, 1] + horizontal_bboxes[:, 3]) / 2)
+    col_xs = snap_coordinates(coords=(vertical_bboxes[:, 0] + vertical_bboxes[:, 2]) / 2)
+    if len(row_ys) < 2 or len(col_xs) < 2 or (len(row_ys) - 1) * (len(col_xs) - 1) < MIN_TABLE_CELLS:
+      continue
+    row_ys.reverse() # top down
+    vertical_centers = (vertical_bboxes[:, 0] + vertical_bboxes[:, 2]) / 2
+    vertical_col_idxes = np.abs(vertical_centers[:, np.newaxis] - np.array(col_xs)[np.newaxis, :]).argmin(axis=1)
+    col_bottoms = np.full((len(col_xs),), np.inf)
+    np.minimum.at(col_bottoms, vertical_col_idxes, vertical_bboxes[:, 1])
+    member_bboxes = bboxes[ruling_idxes[members]]
+    tables.append(DetectedTable(
+      bbox=(
+        float(member_bboxes[:, 0].min()),
+        float(member_bboxes[:, 1].min()),
+        float(member_bboxes[:, 2].max()),
+        float(member_bboxes[:, 3].max()),
+      ),
+      row_ys=row_ys,
+      col_xs=col_xs,
+      col_bottoms=col_bottoms.tolist(),
+      line_idxes=np.sort(ruling_idxes[members]),
+    ))
+  return TableIndex(tables=tables)
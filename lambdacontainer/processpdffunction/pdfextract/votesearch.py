@@ -1,17 +1,16 @@
 
 from abc import ABCMeta, abstractmethod
 import collections
-import json
-import os
+import copy
 import re
 import typing
 import uuid
 
-import rtree
+import numpy as np
 
-from . import pdfindexer, pdfextracter, pdfelemtransforms
+from . import compiled_utils, pdfindexer, pdfextracter, pdfelemtransforms, labelmatcher, pageclassifier, symbol_library
 from .ltjson import LTJson, PdfElem, PdfScheduleCell,\
-   PdfSummaryJson, PdfRowPtr, ScheduleTypes
+   PdfSummaryJson, PdfRowPtr, ScheduleTypes, PdfSchedule, PdfResultsDelta, BboxType
 
 def get_uuid() -> str:
   return uuid.uuid4().hex
@@ -30,6 +29,7 @@ def remove_duplicate_bbox(items: typing.List[PdfElem]):
     return (x1-x0) * (y1-y0)
   items.sort(key=lambda x: item_size(x), reverse=True) # pylint:disable=unnecessary-lambda
 
+  import rtree # pylint:disable=import-outside-toplevel
   bbox_indexer = rtree.index.Index()
   out: typing.List[PdfElem] = []
   idx = 0
@@ -45,15 +45,13 @@ def remove_duplicate_bbox(items: typing.List[PdfElem]):
     if len(results) == 0:
       insert_item(item)
     else:
-      overlaps_a_result = False
-      for result in results:
-        overlap = pdfelemtransforms.bbox_intersection_area(a=out[result]["bbox"], b=item["bbox"])
-        width = item["bbox"][2] - item["bbox"][0]
-        height = item["bbox"][3] - item["bbox"][1]
-        if overlap > width * height * 0.9:
-          overlaps_a_result = True
-          break
-      if not overlaps_a_result:
+      overlaps = compiled_utils.bbox_intersection_areas(
+        tuple(item["bbox"]),
+        np.array([out[result]["bbox"] for result in results], dtype=np.float64),
+      )
+      width = item["bbox"][2] - item["bbox"][0]
+      height = item["bbox"][3] - item["bbox"][1]
+      if not np.any(overlaps > width * height * 0.9):
         insert_item(item)
   return out
 
@@ -72,6 +70,11 @@ class RowHeader(typing.TypedDict):
   header: typing.List[str]
   rows: typing.List[typing.List[str]] # TODO: Replace with positions and what they map to etc.
 
+ExtractedTable = typing.Tuple[
+  typing.List[pdfextracter.ExtractedRowElem], # header_row
+  typing.List[typing.List[pdfextracter.ExtractedRowElem]], # rows
+]
+
 PageScheduleSearchRuleResults = typing.Dict[
   int, # page_number
   RowHeader,
@@ -85,21 +88,6 @@ def create_results_dict() -> MultiClassSearchRuleResults:
     )
   )
 
-def read_symbols_from_json():
-  dirpath = "./"
-  with open(os.path.join(dirpath, "symbols_michael_smith.json"), "r", encoding="utf-8") as f:
-    json_string = f.read()
-  symbols_dicts = json.loads(json_string)
-  symbols: typing.Dict[str, typing.List[LTJson]] = dict()
-  for key, serialized_elems in symbols_dicts.items():
-    elems: typing.List[LTJson] = []
-    for serialized_json in serialized_elems:
-      elems.append(LTJson(serialized_json=serialized_json))
-    symbols[key] = elems
-  return symbols
-
-global_symbols = read_symbols_from_json()
-
 MergeDict = typing.Dict[str, typing.Any]
 def merge_impl(
   dest: MergeDict,
@@ -125,6 +113,50 @@ def merge(
 ):
   merge_impl(typing.cast(MergeDict, dest), typing.cast(MergeDict, other))
 
+def make_results_delta(page_number: int) -> PdfResultsDelta:
+  return {
+    "page": page_number,
+    "schedules": make_empty_pdfsummarryjson(),
+    "elems": [],
+  }
+
+def results_delta_is_empty(delta: PdfResultsDelta) -> bool:
+  if len(delta["elems"]) > 0:
+    return False
+  return all([len(delta["schedules"][schedule.value]) == 0 for schedule in ScheduleTypes])
+
+def apply_results_delta(
+  dest: PdfSummaryJson,
+  delta: PdfResultsDelta,
+):
+  merge(dest=dest, other=delta["schedules"])
+  page_number = delta["page"]
+  for elem in delta["elems"]:
+    row_ptr = elem["rowPtr"]
+    row = dest[row_ptr["schedule"].value][row_ptr["page"]]["rows"][row_ptr["row"]]
+    if page_number not in row["elems"]:
+      row["elems"][page_number] = []
+    row["elems"][page_number].append({
+      "label": elem["label"],
+      "bbox": elem["bbox"],
+      "rowPtr": row_ptr,
+    })
+
+def merge_results_deltas(deltas: typing.List[PdfResultsDelta]) -> PdfSummaryJson:
+  '''
+  The summary of a pdf is its schedules then the elems of each page applied in page order
+  '''
+  results = make_empty_pdfsummarryjson()
+  ordered_deltas = sorted(deltas, key=lambda delta: delta["page"])
+  for delta in ordered_deltas:
+    # Elems are applied into the merged rows so the caller's deltas can't share them
+    merge(dest=results, other=copy.deepcopy(delta["schedules"]))
+  for delta in ordered_deltas:
+    apply_results_delta(
+      dest=results,
+      delta={ "page": delta["page"], "schedules": make_empty_pdfsummarryjson(), "elems": delta["elems"] },
+    )
+  return results
 
 class SearchRule(metaclass=ABCMeta):
   @abstractmethod
@@ -151,17 +183,18 @@ def make_empty_pdfsummarryjson() -> PdfSummaryJson:
   }
 
 def shape_group_matches(
-  shape_group: typing.List[LTJson],
-  to_search: typing.List[LTJson]
+  shape_group: typing.List[symbol_library.SymbolTemplate],
+  to_search_idxes: typing.List[int],
+  indexer: pdfindexer.PdfIndexer,
 ) -> typing.List[LTJson]:
-  if len(shape_group) == 0 or len(to_search) == 0:
+  if len(shape_group) == 0 or len(to_search_idxes) == 0:
     return []
   all_matching_curves: typing.List[LTJson] = []
   for shape in shape_group:
     # TODO: Only find similar curves that have not already been used (ex: double circle)
     matching_curves = pdfindexer.find_most_similar_curve(
       wrapper_to_find=shape,
-      wrappers_to_search=to_search,
+      wrappers_to_search=indexer.find_similar_shapes(wrapper_to_find=shape, elem_idxes=to_search_idxes),
       max_dist=2.
     )
     all_matching_curves.extend(matching_curves)
@@ -169,15 +202,45 @@ def shape_group_matches(
       return []
   return all_matching_curves
 
+# Rule, text elem and the label its regex matched
+ItemLabel = typing.Tuple["ItemSearchRule", LTJson, str]
+
+# Bounds the size of each find_contains_many result
+MAX_LABELS_PER_QUERY = 2048
+
+def process_item_labels(
+  labels: typing.List[ItemLabel],
+  page_number: int,
+  indexer: pdfindexer.PdfIndexer,
+):
+  '''
+  Finds the elems around every label in bulk then lets each rule match its shapes in order
+  '''
+  for start in range(0, len(labels), MAX_LABELS_PER_QUERY):
+    batch = labels[start:start + MAX_LABELS_PER_QUERY]
+    around_bboxes = np.array([rule.get_around_bbox(elem=elem) for rule, elem, _ in batch], dtype=np.float64)
+    offsets, idxes = indexer.find_contains_many(bboxes=around_bboxes)
+    offsets_list = offsets.tolist()
+    idxes_list = idxes.tolist()
+    for label_idx, (rule, elem, label) in enumerate(batch):
+      rule.process_label(
+        elem=elem,
+        label=label,
+        page_number=page_number,
+        indexer=indexer,
+        around_idxes=idxes_list[offsets_list[label_idx]:offsets_list[label_idx+1]],
+      )
+
 class ItemSearchRule(SearchRule):
   def __init__(
     self,
     row_ptr: PdfRowPtr,
     regex: typing.Union[None, str],
     # Match one of the outer list of all of the inner list
-    shape_matches: typing.List[typing.List[LTJson]]
+    shape_matches: typing.List[typing.List[symbol_library.SymbolTemplate]]
   ) -> None:
     self.row_ptr = row_ptr
+    self.regex_pattern = regex
     self.regex = re.compile(regex) if regex is not None else None
     self.shape_matches = shape_matches
     self.results: typing.List[PdfElem] = []
@@ -190,41 +253,70 @@ class ItemSearchRule(SearchRule):
       self.bounding_box[3] - self.bounding_box[1]
     ) + 10
 
+  def is_searchable(self) -> bool:
+    return self.regex is not None and len(self.shape_matches) > 0
+
   def process_page(self, page_number: int, elems: typing.List[LTJson], indexer: pdfindexer.PdfIndexer):
     if len(self.shape_matches) == 0:
       return
-    self.results = []
+    self.start_page()
+    labels: typing.List[ItemLabel] = []
     for elem in elems:
-      self.__process_elem(elem=elem, page_number=page_number, indexer=indexer)
+      label = self.match_label(elem=elem)
+      if label is not None:
+        labels.append((self, elem, label))
+    process_item_labels(labels=labels, page_number=page_number, indexer=indexer)
+
+  def start_page(self):
+    self.results = []
 
   def get_results(self) -> typing.List[PdfElem]:
     self.__refine()
     return self.results
 
-  def __process_elem(self, elem: LTJson, page_number: int, indexer: pdfindexer.PdfIndexer) -> None:
-    around_bbox = (
-      elem.bbox[0] - self.radius,
-      elem.bbox[1] - self.radius,
-      elem.bbox[2] + self.radius,
-      elem.bbox[3] + self.radius,
-    )
+  def match_label(self, elem: LTJson) -> typing.Union[None, str]:
     if self.regex is not None:
       if elem.text is None:
-        return
+        return None
       match = self.regex.search(elem.text)
       if match is None:
-        return
+        return None
       groups = match.groupdict()
       label = groups["label"]
       if len(label) == 0:
-        return
+        return None
 
       # TODO: Need voting since regex for "C" can match "CO" and conflict
       # TODO: Need merge filtering to remove similar shapes in odd places
     else:
-      return
+      return None
       # check if the elem matches the first shape match
+    return label
+
+  def get_around_bbox(self, elem: LTJson) -> BboxType:
+    '''
+    Where to look for this rule's shapes around a label
+    '''
+    x0, y0, x1, y1 = elem.bbox
+    return (
+      x0 - self.radius,
+      y0 - self.radius,
+      x1 + self.radius,
+      y1 + self.radius,
+    )
 
+  def process_label(
+    self,
+    elem: LTJson,
+    label: str,
+    page_number: int, # pylint:disable=unused-argument
+    indexer: pdfindexer.PdfIndexer,
+    around_idxes: typing.Union[None, typing.List[int]] = None,
+  ) -> None:
+    '''
+    elem's text matched this rule's regex with label
+    around_idxes are the elems inside get_around_bbox if they were already found
+    '''
     #  30847    0.062    0.000    0.103    0.000 layout.py:360(__init__) LTChar
     #   8279    0.003    0.000    0.016    0.000 layout.py:483(__init__) LTTextContainer
     #  76655    0.112    0.000    0.184    0.000 ltjson.py:15(__init__)
@@ -244,10 +336,16 @@ class ItemSearchRule(SearchRule):
     # 4    1.788    0.447   10.670    2.667 layout.py:868(group_textboxes)
     # Only searching lighting on lighting pages
     # 4528    0.025    0.000    5.296    0.001 pdfindexer.py:49(find_contains)
-    around_elems = indexer.find_contains(bbox=around_bbox)
+    # Now every label on the page is resolved with one find_contains_many in process_item_labels
+    if around_idxes is None:
+      around_idxes = indexer.find_contains_idxes(bbox=self.get_around_bbox(elem=elem))
     matched_elems: typing.List[LTJson] = []
     for shape_group in self.shape_matches:
-      matching_curves = shape_group_matches(shape_group=shape_group, to_search=around_elems)
+      matching_curves = shape_group_matches(
+        shape_group=shape_group,
+        to_search_idxes=around_idxes,
+        indexer=indexer,
+      )
       if len(matching_curves) > 0:
         matched_elems.extend(matching_curves)
         break
@@ -269,17 +367,21 @@ class ScheduleSearchRule(SearchRule):
     self,
     table_text_key:str,
     destination: ScheduleTypes,
-    elem_shape_matches: typing.Union[None, typing.List[typing.List[LTJson]]],
+    elem_shape_matches: typing.Union[None, typing.List[typing.List[symbol_library.SymbolTemplate]]],
     elem_label_regex_maker: typing.Union[None, typing.Callable[[str], str]],
     reset_rules_on_page:  bool,
+    # Where symbols learned from the schedule's symbol column go
+    learned_symbols: symbol_library.SymbolLibrary,
   ) -> None:
     self.table_text_key = table_text_key
     self.destination = destination
     self.elem_shape_matches = elem_shape_matches
     self.elem_label_regex_maker = elem_label_regex_maker
-    self.item_search_rules: typing.List[ItemSearchRule] = []
+    self.item_search_rules_by_page: typing.Dict[int, typing.List[ItemSearchRule]] = {}
     self.reset_rules_on_page = reset_rules_on_page
+    self.learned_symbols = learned_symbols
     self.results: PdfSummaryJson = make_empty_pdfsummarryjson()
+    self.label_matcher: typing.Union[None, typing.Tuple[typing.Tuple[int, ...], labelmatcher.LabelMatcher]] = None
 
   def process_page(
     self,
@@ -287,27 +389,118 @@ class ScheduleSearchRule(SearchRule):
     elems: typing.List[LTJson],
     indexer: pdfindexer.PdfIndexer
   ) -> None:
-    if self.reset_rules_on_page:
-      self.item_search_rules = []
+    table = self.find_schedule(page_number=page_number, indexer=indexer)
+    if table is not None:
+      self.insert_schedule(page_number=page_number, table=table)
+
+    item_results = self.match_items(
+      page_number=page_number,
+      elems=elems,
+      indexer=indexer,
+      item_search_rules=self.get_item_search_rules_for_page(page_number=page_number),
+    )
+    self.add_item_results(page_number=page_number, item_results=item_results)
+
+  def get_results(self) -> PdfSummaryJson:
+    return self.results
+
+  def find_schedule(
+    self,
+    page_number: int, # pylint:disable=unused-argument
+    indexer: pdfindexer.PdfIndexer
+  ) -> typing.Union[None, ExtractedTable]:
     header_row, rows = pdfextracter.extract_table(
       indexer=indexer,
       text_key=self.table_text_key,
       has_header=True,
       header_above_table=self.destination == ScheduleTypes.LIGHTING,
     )
-    if header_row is not None and rows is not None:
-      self.__insert_new_schedule(page_number=page_number, header_row=header_row, rows=rows)
+    if header_row is None or rows is None:
+      return None
+    return header_row, rows
 
-    for item_search_rule in self.item_search_rules:
-      self.__process_search_rule(
-        item_search_rule=item_search_rule,
-        page_number=page_number,
-        elems=elems,
-        indexer=indexer
-      )
+  def insert_schedule(
+    self,
+    page_number: int,
+    table: ExtractedTable,
+  ) -> None:
+    header_row, rows = table
+    self.__insert_new_schedule(page_number=page_number, header_row=header_row, rows=rows)
+
+  def has_schedule_text(self, text_lookup: pdfindexer.TextLookup) -> bool:
+    return len(text_lookup.get(self.table_text_key, [])) > 0
+
+  def get_schedule(self, page_number: int) -> typing.Union[None, PdfSchedule]:
+    '''
+    A copy of the schedule inserted for page_number
+    '''
+    schedule = self.results[self.destination.value].get(page_number)
+    if schedule is None:
+      return None
+    return copy.deepcopy(schedule)
+
+  def get_item_search_rules_for_page(self, page_number: int) -> typing.List[ItemSearchRule]:
+    # A schedule applies from its own page onward until the next schedule replaces it
+    # and pages before the first schedule use the first schedule
+    # unless the rules are reset on each page (ex: a legend for that page)
+    if self.reset_rules_on_page:
+      return self.item_search_rules_by_page.get(page_number, [])
+    schedule_pages = sorted(self.item_search_rules_by_page.keys())
+    if len(schedule_pages) == 0:
+      return []
+    preceding_schedule_pages = [p for p in schedule_pages if p <= page_number]
+    if len(preceding_schedule_pages) == 0:
+      return self.item_search_rules_by_page[schedule_pages[0]]
+    return self.item_search_rules_by_page[preceding_schedule_pages[-1]]
 
-  def get_results(self) -> PdfSummaryJson:
-    return self.results
+  def match_items(
+    self,
+    page_number: int,
+    elems: typing.List[LTJson],
+    indexer: pdfindexer.PdfIndexer,
+    item_search_rules: typing.List[ItemSearchRule],
+  ) -> typing.List[PdfElem]:
+    searchable_rules = [rule for rule in item_search_rules if rule.is_searchable()]
+    label_matcher = self.__get_label_matcher(item_search_rules=searchable_rules)
+    for item_search_rule in searchable_rules:
+      item_search_rule.start_page()
+    # Each text elem is matched once against every rule's regex
+    labels: typing.List[ItemLabel] = [
+      (searchable_rules[rule_idx], indexer.wrappers[elem_idx], label)
+      for elem_idx, rule_idx, label in label_matcher.match_text_index(text_index=indexer.text_index)
+    ]
+    process_item_labels(labels=labels, page_number=page_number, indexer=indexer)
+    item_results: typing.List[PdfElem] = []
+    for item_search_rule in item_search_rules:
+      item_results.extend(item_search_rule.get_results())
+    return item_results
+
+  def __get_label_matcher(self, item_search_rules: typing.List[ItemSearchRule]) -> labelmatcher.LabelMatcher:
+    # Rules are usually the same from page to page so keep the last matcher
+    key = tuple([id(rule) for rule in item_search_rules])
+    if self.label_matcher is None or self.label_matcher[0] != key:
+      regexes = [typing.cast(str, rule.regex_pattern) for rule in item_search_rules]
+      self.label_matcher = (key, labelmatcher.LabelMatcher(regexes=regexes))
+    return self.label_matcher[1]
+
+  def add_item_results(
+    self,
+    page_number: int,
+    item_results: typing.List[PdfElem],
+  ) -> None:
+    for item_result in item_results:
+      row_ptr_page_number = item_result["rowPtr"]["page"]
+      row_ptr_row_idx = item_result["rowPtr"]["row"]
+      row_ptr_schedule = item_result["rowPtr"]["schedule"]
+      res_row_ref = self.results[row_ptr_schedule.value][row_ptr_page_number]["rows"][row_ptr_row_idx]
+      if page_number not in res_row_ref["elems"]:
+        res_row_ref["elems"][page_number] = []
+      res_row_ref["elems"][page_number].append({
+        "label": item_result["label"],
+        "bbox": item_result["bbox"],
+        # rowPtr from the schedule that created the rule not necessarily the current schedule rule
+        "rowPtr": item_result["rowPtr"]
+      })
 
   def __get_row_cells(
     self,
@@ -337,7 +530,7 @@ class ScheduleSearchRule(SearchRule):
     header_row: typing.List[pdfextracter.ExtractedRowElem],
     rows: typing.List[typing.List[pdfextracter.ExtractedRowElem]]
   ) -> None:
-    self.item_search_rules = []
+    item_search_rules: typing.List[ItemSearchRule] = []
     self.results[self.destination.value][page_number] = {
       "headerRow": {
         "elems": {},
@@ -373,8 +566,12 @@ class ScheduleSearchRule(SearchRule):
       if self.elem_shape_matches is not None:
         elem_shape_matches = self.elem_shape_matches
       else:
-        elem_shape_matches = [row[elem_shape_symbol_col_idx].elems] # Need to match all of 1 option
-      self.item_search_rules.append(ItemSearchRule(
+        # Need to match all of 1 option
+        elem_shape_matches = [self.learned_symbols.add_symbols(
+          key="{0}-{1}-{2}".format(self.destination.value, page_number, idx),
+          elems=row[elem_shape_symbol_col_idx].elems,
+        )]
+      item_search_rules.append(ItemSearchRule(
         row_ptr={
           "schedule": self.destination,
           "page": page_number,
@@ -383,29 +580,7 @@ class ScheduleSearchRule(SearchRule):
         regex=elem_label_regex,
         shape_matches=elem_shape_matches,
       ))
-
-  def __process_search_rule(
-    self,
-    item_search_rule: ItemSearchRule,
-    page_number: int,
-    elems: typing.List[LTJson],
-    indexer: pdfindexer.PdfIndexer
-  ) -> None:
-    item_search_rule.process_page(page_number=page_number, elems=elems, indexer=indexer)
-    item_results = item_search_rule.get_results()
-    for item_result in item_results:
-      row_ptr_page_number = item_result["rowPtr"]["page"]
-      row_ptr_row_idx = item_result["rowPtr"]["row"]
-      row_ptr_schedule = item_result["rowPtr"]["schedule"]
-      res_row_ref = self.results[row_ptr_schedule.value][row_ptr_page_number]["rows"][row_ptr_row_idx]
-      if page_number not in res_row_ref["elems"]:
-        res_row_ref["elems"][page_number] = []
-      res_row_ref["elems"][page_number].append({
-        "label": item_result["label"],
-        "bbox": item_result["bbox"],
-        # rowPtr from the schedule that created the rule not necessarily the current schedule rule
-        "rowPtr": item_result["rowPtr"]
-      })
+    self.item_search_rules_by_page[page_number] = item_search_rules
 
 class PdfSearcher:
   '''
@@ -426,6 +601,8 @@ class PdfSearcher:
   def __init__(
     self
   ) -> None:
+    global_symbols = symbol_library.get_default_library()
+    self.learned_symbols = symbol_library.SymbolLibrary()
     self.search_rules: typing.List[ScheduleSearchRule] = [
       ScheduleSearchRule(
         table_text_key="door schedule",
@@ -433,6 +610,7 @@ class PdfSearcher:
         elem_shape_matches=[global_symbols["door_label"][0:1]],
         elem_label_regex_maker=lambda id_row_text: id_row_text,
         reset_rules_on_page=False,
+        learned_symbols=self.learned_symbols,
       ),
       ScheduleSearchRule(
         table_text_key="window schedule",
@@ -440,6 +618,7 @@ class PdfSearcher:
         elem_shape_matches=[global_symbols["window_label"][0:1]],
         elem_label_regex_maker=lambda id_row_text: id_row_text.replace("##", "\\d\\d?"),
         reset_rules_on_page=False,
+        learned_symbols=self.learned_symbols,
       ),
       ScheduleSearchRule(
         table_text_key="lighting legend",
@@ -447,6 +626,7 @@ class PdfSearcher:
         elem_shape_matches=None,
         elem_label_regex_maker=lambda id_row_text: id_row_text, # TODO: some lighting elements don't have this
         reset_rules_on_page=True,
+        learned_symbols=self.learned_symbols,
       ),
     ]
 
@@ -456,8 +636,115 @@ class PdfSearcher:
     elems: typing.List[LTJson],
     indexer: pdfindexer.PdfIndexer
   ):
+    self.insert_schedules(
+      page_number=page_number,
+      tables=self.find_schedules(page_number=page_number, indexer=indexer),
+    )
+    page_types = pageclassifier.classify_page(
+      text_index=indexer.text_index,
+      page_width=indexer.page_width,
+      page_height=indexer.page_height,
+    )
+    item_search_rules = self.select_item_search_rules(
+      item_search_rules=self.get_item_search_rules_for_page(page_number=page_number),
+      page_types=page_types,
+    )
+    self.add_item_results(
+      page_number=page_number,
+      item_results=self.match_items(
+        page_number=page_number,
+        elems=elems,
+        indexer=indexer,
+        item_search_rules=item_search_rules,
+      ),
+    )
+
+  # The methods below split process_page into a "find schedules" pass over every page
+  # then a "match items" pass over every page. Pages in the second pass are independent
+  def has_schedule_text(self, text_lookup: pdfindexer.TextLookup) -> bool:
+    return any([rule.has_schedule_text(text_lookup=text_lookup) for rule in self.search_rules])
+
+  def find_schedules(
+    self,
+    page_number: int,
+    indexer: pdfindexer.PdfIndexer
+  ) -> typing.List[typing.Union[None, ExtractedTable]]:
+    return [
+      rule.find_schedule(page_number=page_number, indexer=indexer) for rule in self.search_rules
+    ]
+
+  def insert_schedules(
+    self,
+    page_number: int,
+    tables: typing.List[typing.Union[None, ExtractedTable]],
+  ):
+    for rule, table in zip(self.search_rules, tables):
+      if table is not None:
+        rule.insert_schedule(page_number=page_number, table=table)
+
+  def get_item_search_rules_for_page(self, page_number: int) -> typing.List[typing.List[ItemSearchRule]]:
+    return [
+      rule.get_item_search_rules_for_page(page_number=page_number) for rule in self.search_rules
+    ]
+
+  def select_item_search_rules(
+    self,
+    item_search_rules: typing.List[typing.List[ItemSearchRule]],
+    page_types: typing.Set[pageclassifier.PageType],
+  ) -> typing.List[typing.List[ItemSearchRule]]:
+    '''
+    Only the rules whose items can be on a page of page_types
+    '''
+    schedule_types = pageclassifier.get_page_schedule_types(page_types=page_types)
+    if schedule_types is None:
+      return item_search_rules
+    return [
+      # Rules reset on each page came from a schedule on this page so they always apply
+      rule_item_search_rules if rule.reset_rules_on_page or rule.destination in schedule_types else []
+      for rule, rule_item_search_rules in zip(self.search_rules, item_search_rules)
+    ]
+
+  def match_items(
+    self,
+    page_number: int,
+    elems: typing.List[LTJson],
+    indexer: pdfindexer.PdfIndexer,
+    item_search_rules: typing.List[typing.List[ItemSearchRule]],
+  ) -> typing.List[typing.List[PdfElem]]:
+    return [
+      rule.match_items(
+        page_number=page_number,
+        elems=elems,
+        indexer=indexer,
+        item_search_rules=rule_item_search_rules,
+      ) for rule, rule_item_search_rules in zip(self.search_rules, item_search_rules)
+    ]
+
+  def add_item_results(
+    self,
+    page_number: int,
+    item_results: typing.List[typing.List[PdfElem]],
+  ):
+    for rule, rule_item_results in zip(self.search_rules, item_results):
+      rule.add_item_results(page_number=page_number, item_results=rule_item_results)
+
+  def get_schedules_delta(self, page_number: int) -> PdfResultsDelta:
+    delta = make_results_delta(page_number=page_number)
     for rule in self.search_rules:
-      rule.process_page(page_number=page_number, elems=elems, indexer=indexer)
+      schedule = rule.get_schedule(page_number=page_number)
+      if schedule is not None:
+        delta["schedules"][rule.destination.value][page_number] = schedule
+    return delta
+
+  def get_items_delta(
+    self,
+    page_number: int,
+    item_results: typing.List[typing.List[PdfElem]],
+  ) -> PdfResultsDelta:
+    delta = make_results_delta(page_number=page_number)
+    for rule_item_results in item_results:
+      delta["elems"].extend(rule_item_results)
+    return delta
 
   def refine(self):
     pass
@@ -320,7 +320,6 @@ def find_shapes_from_ids(
   remaining_nodes = set(nodes)
   circles, intersection_pts = linejoiner.identify_from_lines(
     nodes=[node for node in nodes if node.line is not None],
-    node_manager=node_manager,
   )
   shapes: typing.List[pdftypes.ShapesType] = []
   for circle_lines in circles:
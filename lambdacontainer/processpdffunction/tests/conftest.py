@@ -0,0 +1,12 @@
+import os
+import sys
+
+import pytest
+
+PROCESSPDF_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, PROCESSPDF_DIR)
+
+@pytest.fixture(autouse=True)
+def processpdf_dir(monkeypatch: pytest.MonkeyPatch):
+  # Default symbol and cache paths are relative to the function directory
+  monkeypatch.chdir(PROCESSPDF_DIR)
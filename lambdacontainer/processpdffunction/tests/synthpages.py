@@ -0,0 +1,121 @@
+import copy
+import json
+import os
+import typing
+
+from pdfextract import pdfprocessor
+from pdfextract.ltjson import LTJson
+
+# Small drawn pages for running the processor without a pdf
+# A page is (elems, width, height) with elems in the serialized LTJson layout
+
+SYMBOLS_JSON_PATH = os.path.join(os.path.dirname(__file__), "..", "symbols_michael_smith.json")
+PAGE_WIDTH = 792.
+PAGE_HEIGHT = 812.
+
+SyntheticPage = typing.Tuple[typing.List[typing.Dict[str, typing.Any]], float, float]
+
+def get_symbols() -> typing.Dict[str, typing.List[typing.Dict[str, typing.Any]]]:
+  with open(SYMBOLS_JSON_PATH, "r", encoding="utf-8") as f:
+    return json.load(f)
+
+def text(x0: float, y0: float, s: str, h: float = 8., cw: float = 5.):
+  w = cw * max(1, len(s))
+  return {"bbox": [x0, y0, x0 + w, y0 + h], "width": w, "height": h, "text": s + "\n", "size": h}
+
+def hline(x0: float, x1: float, y: float):
+  return {
+    "bbox": [x0, y, x1, y], "width": x1 - x0, "height": 0, "is_line": True,
+    "original_path": [["m", [x0, y]], ["l", [x1, y]]], "linewidth": 1,
+  }
+
+def vline(x: float, y0: float, y1: float):
+  return {
+    "bbox": [x, y0, x, y1], "width": 0, "height": y1 - y0, "is_line": True,
+    "original_path": [["m", [x, y1]], ["l", [x, y0]]], "linewidth": 1,
+  }
+
+def rect(x0: float, y0: float, x1: float, y1: float):
+  return {
+    "bbox": [x0, y0, x1, y1], "width": x1 - x0, "height": y1 - y0, "is_rect": True,
+    "original_path": [["m", [x0, y0]], ["l", [x1, y0]], ["l", [x1, y1]], ["l", [x0, y1]], ["h"]],
+    "linewidth": 1,
+  }
+
+def label(symbol_key: str, cx: float, cy: float, s: str):
+  '''
+  The first symbol_key symbol centered on (cx, cy) with s inside it
+  '''
+  symbol = copy.deepcopy(get_symbols()[symbol_key][0])
+  x0, y0, x1, y1 = symbol["bbox"]
+  dx = cx - (x0 + x1) / 2
+  dy = cy - (y0 + y1) / 2
+  symbol["bbox"] = [x0 + dx, y0 + dy, x1 + dx, y1 + dy]
+  symbol["original_path"] = [
+    [segment[0]] + [[x + dx, y + dy] for x, y in segment[1:]] for segment in symbol["original_path"]
+  ]
+  symbol["parent_idx"] = None
+  symbol["children_idxes"] = []
+  return [symbol, text(cx - 2.5 * len(s), cy - 3, s, h=6, cw=5)]
+
+def schedule(
+  x0: float,
+  y_top: float,
+  key: str,
+  header: typing.List[str],
+  rows: typing.List[typing.List[str]],
+):
+  '''
+  key above a bordered grid with the header as its first row
+  '''
+  col_width = 60
+  row_height = 14
+  width = col_width * len(header)
+  y_bottom = y_top - row_height * (len(rows) + 1)
+  elems = [text(x0, y_top + 4, key), rect(x0, y_bottom, x0 + width, y_top)]
+  for row_idx in range(len(rows) + 1):
+    elems.append(hline(x0, x0 + width, y_top - row_height * (row_idx + 1)))
+  for col_idx in range(1, len(header)):
+    elems.append(vline(x0 + col_idx * col_width, y_bottom, y_top))
+  for row_idx, row in enumerate([header] + rows):
+    for col_idx, cell in enumerate(row):
+      elems.append(text(x0 + col_idx * col_width + 2, y_top - row_height * (row_idx + 1) + 3, cell))
+  return elems
+
+def schedules_page() -> SyntheticPage:
+  elems = schedule(
+    x0=50, y_top=700, key="DOOR SCHEDULE",
+    header=["MARK", "WIDTH", "MATERIAL"],
+    rows=[["101", "3'0\"", "WOOD"], ["102", "2'8\"", "WOOD"], ["103", "2'6\"", "HM"]],
+  )
+  elems += schedule(
+    x0=400, y_top=700, key="WINDOW SCHEDULE",
+    header=["MARK", "SIZE"],
+    rows=[["A##", "3'0\""], ["B##", "2'0\""]],
+  )
+  elems += label("door_label", 120, 200, "101")
+  elems += label("window_label", 300, 250, "A3")
+  return elems, PAGE_WIDTH, PAGE_HEIGHT
+
+def plan_page() -> SyntheticPage:
+  elems: typing.List[typing.Dict[str, typing.Any]] = []
+  for cx, s in [(100, "101"), (200, "102"), (300, "103")]:
+    elems += label("door_label", cx, 100, s)
+  elems += label("window_label", 400, 300, "B12")
+  elems.append(text(500, 500, "FIRST FLOOR PLAN"))
+  return elems, PAGE_WIDTH, PAGE_HEIGHT
+
+def patch_pdf_pages(monkeypatch: typing.Any, pages: typing.List[SyntheticPage]):
+  '''
+  Makes pdfprocessor read pages instead of parsing the pdf data
+  '''
+  def extract_page_elems(
+    pdfdata: bytes, # pylint:disable=unused-argument
+    page_numbers: typing.List[int],
+    page_cache: typing.Any = None, # pylint:disable=unused-argument
+  ):
+    for page_number in sorted(page_numbers):
+      elems, width, height = pages[page_number]
+      yield page_number, [LTJson(serialized_json=elem) for elem in elems], width, height
+  monkeypatch.setattr(pdfprocessor, "extract_page_elems", extract_page_elems)
+  monkeypatch.setattr(pdfprocessor, "get_pdf_num_pages", lambda pdfdata_io: len(pages))
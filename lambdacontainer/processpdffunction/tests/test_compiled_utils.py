@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from pdfextract import compiled_kernels, compiled_utils
+
+# Build the compiled module first with: python -m pdfextract.compiled_utils_build
+requires_compiled = pytest.mark.skipif(not compiled_utils.IS_COMPILED, reason="compiled_utils_aot is not built")
+
+OUTER = (0., 0., 10., 10.)
+INNER = (1., 2., 3., 4.)
+
+@requires_compiled
+@pytest.mark.parametrize("inner", [INNER, list(INNER), np.array(INNER), (1, 2, 3, 4), np.array([INNER])[0]])
+def test_compiled_box_functions_coerce_bboxes(inner):
+  assert compiled_utils.box_contains(OUTER, inner) == compiled_kernels.box_contains(OUTER, INNER)
+  assert compiled_utils.box_contains(list(OUTER), inner) == compiled_kernels.box_contains(OUTER, INNER)
+  assert compiled_utils.bbox_intersection_area(OUTER, inner) == compiled_kernels.bbox_intersection_area(OUTER, INNER)
+  assert compiled_utils.bbox_intersection_area(np.array(OUTER), inner) == \
+    compiled_kernels.bbox_intersection_area(OUTER, INNER)
+
+@requires_compiled
+@pytest.mark.parametrize("bad_bbox", [None, (1., 2., 3.), [1., 2., 3., 4., 5.], np.zeros(3)])
+def test_compiled_box_functions_reject_bad_bboxes(bad_bbox):
+  with pytest.raises((ValueError, TypeError)):
+    compiled_utils.box_contains(OUTER, bad_bbox)
+  with pytest.raises((ValueError, TypeError)):
+    compiled_utils.bbox_intersection_area(bad_bbox, OUTER)
+
+@requires_compiled
+def test_compiled_box_array_functions_coerce_bboxes():
+  inners = [[1, 2, 3, 4], [5, 5, 20, 20]]
+  expected_areas = [compiled_kernels.bbox_intersection_area(OUTER, tuple(map(float, inner))) for inner in inners]
+  assert compiled_utils.boxes_contain(list(OUTER), inners).tolist() == [True, False]
+  assert compiled_utils.boxes_contain(OUTER, np.asfortranarray(np.array(inners, dtype=np.float32))).tolist() == [True, False]
+  assert compiled_utils.boxes_contain(OUTER, []).tolist() == []
+  assert compiled_utils.bbox_intersection_areas(np.array(OUTER), inners).tolist() == expected_areas
+  with pytest.raises(ValueError):
+    compiled_utils.bbox_intersection_areas(OUTER, [[1., 2., 3.]])
+
+@requires_compiled
+def test_compiled_line_functions_coerce_lines():
+  line1 = (0., 0., 10., 10.)
+  line2 = (0., 10., 10., 0.)
+  assert compiled_utils.line_intersection(list(line1), np.array(line2)) == compiled_kernels.line_intersection(line1, line2)
+  assert compiled_utils.point_inside_line_bbox(np.array(line1), 5, 5) == \
+    compiled_kernels.point_inside_line_bbox(line1, 5., 5.)
+  with pytest.raises(ValueError):
+    compiled_utils.line_intersection(line1, None)
@@ -0,0 +1,68 @@
+import typing
+
+import pytest
+
+from pdfextract import dataprovider, ltjson, pdfprocessor
+from pdfextract.ltjson import PdfSummaryJson, ScheduleTypes
+
+import synthpages
+
+def get_found_items(results: PdfSummaryJson, destination: ScheduleTypes):
+  '''
+  (page number, label, bbox) of every item found for destination's schedules
+  '''
+  found_items: typing.List[typing.Tuple[int, str, typing.Tuple[float, ...]]] = []
+  for schedule in results[destination.value].values():
+    for row in schedule["rows"]:
+      for page_number, elems in row["elems"].items():
+        found_items.extend([(int(page_number), elem["label"], tuple(elem["bbox"])) for elem in elems])
+  return sorted(found_items)
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_repeated_schedule_items_found_once(monkeypatch: pytest.MonkeyPatch, num_workers: int):
+  synthpages.patch_pdf_pages(monkeypatch=monkeypatch, pages=[synthpages.schedules_page(), synthpages.plan_page()])
+  once = pdfprocessor.process_pdf(dataprovider.NullDataProvider(), "once", b"", num_workers=num_workers)
+  synthpages.patch_pdf_pages(
+    monkeypatch=monkeypatch,
+    pages=[synthpages.schedules_page(), synthpages.schedules_page(), synthpages.plan_page()],
+  )
+  repeated = pdfprocessor.process_pdf(dataprovider.NullDataProvider(), "repeated", b"", num_workers=num_workers)
+  for destination in [ScheduleTypes.DOORS, ScheduleTypes.WINDOWS]:
+    once_items = get_found_items(results=once, destination=destination)
+    repeated_items = get_found_items(results=repeated, destination=destination)
+    assert len(once_items) > 0
+    assert len(repeated_items) == len(set(repeated_items))
+    # The repeated schedule page finds the same items as the first and the plan moves back a page
+    once_by_page = { page_number: [] for page_number in range(2) }
+    for page_number, label, bbox in once_items:
+      once_by_page[page_number].append((label, bbox))
+    expected = sorted(
+      [(0, label, bbox) for label, bbox in once_by_page[0]]
+      + [(1, label, bbox) for label, bbox in once_by_page[0]]
+      + [(2, label, bbox) for label, bbox in once_by_page[1]]
+    )
+    assert repeated_items == expected
+
+class DeltaRecorder(dataprovider.NullDataProvider):
+  def __init__(self) -> None:
+    self.delta_keys: typing.List[typing.Tuple[int, int]] = []
+    self.num_steps_total = 0
+
+  def write_processpdf_start(self, pdfkey: str, num_steps_total: int):
+    self.num_steps_total = num_steps_total
+
+  def write_processpdf_delta(self, pdfkey: str, curr_step: int, delta: ltjson.PdfResultsDelta):
+    self.delta_keys.append((curr_step, delta["page"]))
+
+@pytest.mark.parametrize("num_workers", [1, 2, 3])
+def test_delta_keys_unique(monkeypatch: pytest.MonkeyPatch, num_workers: int):
+  # Deltas are upserted by (pdf, step, page) so a repeated key overwrites a delta
+  synthpages.patch_pdf_pages(
+    monkeypatch=monkeypatch,
+    pages=[synthpages.plan_page(), synthpages.schedules_page(), synthpages.plan_page(), synthpages.schedules_page()],
+  )
+  recorder = DeltaRecorder()
+  pdfprocessor.process_pdf(recorder, "pdf", b"", num_workers=num_workers)
+  assert len(recorder.delta_keys) > 0
+  assert len(recorder.delta_keys) == len(set(recorder.delta_keys))
+  assert max([step for step, _ in recorder.delta_keys]) < recorder.num_steps_total